@@ -0,0 +1,203 @@
+"""
+Admission control: per-client and per-route rate limits, concurrency caps and
+load shedding, applied before a request reaches a handler.
+
+Every request is put in a cost class:
+  - "expensive": order lists with a search term (ILIKE '%...%' cannot use an
+    index), include_archived, or an offset deeper than ADMISSION_DEEP_OFFSET,
+    plus exports, at-risk stops and route optimization;
+  - "write":     POST/PUT/PATCH/DELETE, except the routes in ROUTE_CLASSES
+                 (POST /api/orders/batch-get is a read with its ids in the body);
+  - "read":      everything else.
+
+Checks, cheapest first:
+  1. load shedding - when the requests in flight in this worker (or the
+     connections checked out of the pool, if higher) reach the pool's capacity
+     plus ADMISSION_QUEUE_LIMIT, new requests get 503. Expensive requests are
+     shed earlier, once ADMISSION_EXPENSIVE_SHARE of the pool is busy, so
+     cheap ones (the dispatch UI) keep getting connections;
+  2. per-client concurrency - at most ADMISSION_CLIENT_CONCURRENCY requests
+     in flight per client and worker, else 429;
+  3. token buckets - one per (client, class) from RATE_LIMITS, and one per
+     class across all clients from ROUTE_RATE_LIMITS, else 429.
+
+Rejections carry Retry-After. Clients are identified by address, or by
+X-API-Key when it is one of ADMISSION_API_KEYS - an unvetted header would let
+a client take a fresh bucket per request by sending a new value each time. Buckets live in the shared state store, so limits hold across
+workers when SHARED_STATE_URL is set; they are taken with the store's async
+client, so a Redis round trip doesn't hold up the event loop.
+
+Off unless ADMISSION_ENABLED=true.
+"""
+import json
+import math
+import os
+from urllib.parse import parse_qsl
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from database import engine
+from shared_state import shared
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "false").lower() in ("1", "true", "yes")
+ADMISSION_DEEP_OFFSET = int(os.getenv("ADMISSION_DEEP_OFFSET", "1000"))
+ADMISSION_CLIENT_CONCURRENCY = int(os.getenv("ADMISSION_CLIENT_CONCURRENCY", "8"))
+ADMISSION_QUEUE_LIMIT = int(os.getenv("ADMISSION_QUEUE_LIMIT", "20"))
+ADMISSION_EXPENSIVE_SHARE = float(os.getenv("ADMISSION_EXPENSIVE_SHARE", "0.5"))
+ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "1"))
+# Comma separated; only these X-API-Key values identify a client
+ADMISSION_API_KEYS = frozenset(k.strip() for k in os.getenv("ADMISSION_API_KEYS", "").split(",") if k.strip())
+
+# class -> [tokens per second, burst]; JSON overrides are merged over these
+DEFAULT_RATE_LIMITS = {"read": [50, 100], "write": [20, 40], "expensive": [2, 10]}
+DEFAULT_ROUTE_RATE_LIMITS = {"expensive": [20, 40]}
+RATE_LIMITS = {**DEFAULT_RATE_LIMITS, **json.loads(os.getenv("RATE_LIMITS", "{}"))}
+ROUTE_RATE_LIMITS = {**DEFAULT_ROUTE_RATE_LIMITS, **json.loads(os.getenv("ROUTE_RATE_LIMITS", "{}"))}
+
+EXEMPT_PATHS = ("/", "/docs", "/docs/oauth2-redirect", "/redoc", "/openapi.json")
+EXPENSIVE_PREFIXES = ("/api/export/", "/api/stops/at-risk")
+# (method, path) -> class, for routes whose method doesn't say what they cost
+ROUTE_CLASSES = {("POST", "/api/orders/batch-get"): "read"}
+
+
+def pool_capacity(bind=engine) -> int:
+    pool = bind.pool
+    if not callable(getattr(pool, "size", None)):
+        return ADMISSION_QUEUE_LIMIT
+    return pool.size() + max(getattr(pool, "_max_overflow", 0), 0)
+
+
+def pool_in_use(bind=engine) -> int:
+    pool = bind.pool
+    return pool.checkedout() if hasattr(pool, "checkedout") else 0
+
+
+def classify(method: str, path: str, query_string: bytes) -> str:
+    if (method, path) in ROUTE_CLASSES:
+        return ROUTE_CLASSES[method, path]
+    if method in ("POST", "PUT", "PATCH", "DELETE"):
+        return "expensive" if path.endswith("/optimize") else "write"
+    if path.startswith(EXPENSIVE_PREFIXES):
+        return "expensive"
+    if path == "/api/orders" and query_string:
+        params = dict(parse_qsl(query_string.decode("latin-1")))
+        if params.get("search") or params.get("include_archived", "").lower() in ("1", "true", "yes"):
+            return "expensive"
+        try:
+            offset = (int(params.get("page", 1)) - 1) * int(params.get("limit", 10))
+        except ValueError:
+            return "read"  # rejected by validation anyway
+        if offset > ADMISSION_DEEP_OFFSET:
+            return "expensive"
+    return "read"
+
+
+def client_key(scope: Scope) -> str:
+    for name, value in scope["headers"]:
+        if name == b"x-api-key":
+            key = value.decode("latin-1")
+            if key in ADMISSION_API_KEYS:
+                return "key:" + key
+            break
+    client = scope.get("client")
+    return "ip:" + (client[0] if client else "unknown")
+
+
+class AdmissionController:
+    """Per-worker admission state; one instance is shared by the middleware and the stats endpoint"""
+
+    def __init__(self, enabled: bool = ADMISSION_ENABLED):
+        self.enabled = enabled
+        self.capacity = pool_capacity()
+        self.in_flight = 0
+        self.in_flight_by_client = {}
+        self.rejected = {"shed": 0, "concurrency": 0, "rate": 0}
+
+    async def admit(self, scope: Scope):
+        """(client, None) when admitted - call release(client) afterwards - else (None, rejection)"""
+        cost_class = classify(scope["method"], scope["path"], scope["query_string"])
+        busy = max(self.in_flight, pool_in_use())
+        limit = self.capacity * ADMISSION_EXPENSIVE_SHARE if cost_class == "expensive" \
+            else self.capacity + ADMISSION_QUEUE_LIMIT
+        if busy >= limit:
+            self.rejected["shed"] += 1
+            return None, (503, "Server is busy, retry shortly", ADMISSION_RETRY_AFTER_SECONDS)
+
+        client = client_key(scope)
+        if self.in_flight_by_client.get(client, 0) >= ADMISSION_CLIENT_CONCURRENCY:
+            self.rejected["concurrency"] += 1
+            return None, (429, "Too many concurrent requests", ADMISSION_RETRY_AFTER_SECONDS)
+
+        # Counted in flight before awaiting the buckets, so the checks above hold for concurrent requests
+        self.in_flight += 1
+        self.in_flight_by_client[client] = self.in_flight_by_client.get(client, 0) + 1
+        try:
+            wait = 0.0
+            if cost_class in RATE_LIMITS:
+                wait = await shared.take_async(f"rl:{client}:{cost_class}", *RATE_LIMITS[cost_class])
+            if not wait and cost_class in ROUTE_RATE_LIMITS:
+                wait = await shared.take_async(f"rl:route:{cost_class}", *ROUTE_RATE_LIMITS[cost_class])
+        except BaseException:
+            self.release(client)
+            raise
+        if wait:
+            self.release(client)
+            self.rejected["rate"] += 1
+            return None, (429, "Rate limit exceeded", math.ceil(wait))
+        return client, None
+
+    def release(self, client: str):
+        self.in_flight -= 1
+        remaining = self.in_flight_by_client[client] - 1
+        if remaining:
+            self.in_flight_by_client[client] = remaining
+        else:
+            del self.in_flight_by_client[client]
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "in_flight": self.in_flight,
+            "pool_capacity": self.capacity,
+            "pool_in_use": pool_in_use(),
+            "clients_in_flight": len(self.in_flight_by_client),
+            "rejected": dict(self.rejected),
+        }
+
+
+admission = AdmissionController()
+
+
+class AdmissionMiddleware:
+    def __init__(self, app: ASGIApp, controller: AdmissionController = admission):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if not self.controller.enabled or scope["type"] != "http" or scope["method"] == "OPTIONS" \
+                or scope["path"] in EXEMPT_PATHS or scope["path"].startswith("/api/stats/"):
+            await self.app(scope, receive, send)
+            return
+
+        client, rejection = await self.controller.admit(scope)
+        if rejection is not None:
+            await _reject(send, *rejection)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(client)
+
+
+async def _reject(send: Send, status: int, detail: str, retry_after: int):
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(retry_after, 1)).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
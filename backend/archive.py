@@ -0,0 +1,190 @@
+"""
+Archival of completed orders.
+
+Orders in a terminal status whose last update is older than ARCHIVE_AFTER_DAYS
+are moved, with their stops, from the live tables into the archive tables (see
+models.ArchivedOrder). A batch copies the orders into the archive, then
+deletes the live rows whose archive copy has the same version:
+
+  - on PostgreSQL both steps are one transaction, so an order is never in
+    both or neither;
+  - on SQLite the archive is another database file, and a commit spanning two
+    files isn't atomic in WAL mode (SQLITE_MODE=tuned) - a crash mid-commit
+    could land one file's half only. So the copy and the delete are separate
+    transactions, one file each: an interruption leaves the order in both
+    (readers with include_archived may briefly see it twice), never in
+    neither, and the next batch finishes the move. Copying first replaces any
+    copy such a batch left, and a live row changed since its copy stays live.
+
+Run once from the command line:
+
+    python archive.py [--days 90] [--batch-size 500]
+
+or set ARCHIVE_ENABLED=true to have the API run it periodically in the
+background, on every shard (sharding.py). The command line archives the
+DATABASE_URL database.
+"""
+import argparse
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, exists, func, insert, literal, select, text
+
+from database import engine, ARCHIVE_SCHEMA
+from eta import changing_stops
+from models import Order, Stop, ArchivedOrder, ArchivedStop, ORDER_TERMINAL_STATUSES
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "false").lower() in ("1", "true", "yes")
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+ARCHIVE_INTERVAL_SECONDS = int(os.getenv("ARCHIVE_INTERVAL_SECONDS", "3600"))
+ARCHIVE_STATUSES = tuple(
+    s.strip() for s in os.getenv("ARCHIVE_STATUSES", ",".join(ORDER_TERMINAL_STATUSES)).split(",") if s.strip()
+)
+
+
+def _month_start(value: datetime) -> datetime:
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _utc(value: datetime) -> datetime:
+    # Naive means UTC; aware values come back in the session's time zone
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def _next_month(value: datetime) -> datetime:
+    return _month_start(_month_start(value) + timedelta(days=32))
+
+
+def ensure_partitions(conn, created_ats):
+    """Create the monthly archive partitions (PostgreSQL only) that a batch needs"""
+    months = {_month_start(_utc(value)) for value in created_ats if value is not None}
+    for month in sorted(months):
+        suffix = month.strftime("%Y_%m")
+        # Explicit UTC bounds: bare dates would be read in the session's TimeZone,
+        # sending rows near a month boundary to the DEFAULT partition
+        bounds = f"FROM ('{month:%Y-%m-%d} 00:00+00') TO ('{_next_month(month):%Y-%m-%d} 00:00+00')"
+        for table in ("orders", "stops"):
+            conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {ARCHIVE_SCHEMA}.{table}_{suffix} "
+                f"PARTITION OF {ARCHIVE_SCHEMA}.{table} FOR VALUES {bounds}"
+            ))
+
+
+def archive_batch(older_than_days: int = ARCHIVE_AFTER_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE,
+                  bind=engine) -> int:
+    """Move one batch of eligible orders into the archive. Returns how many were moved."""
+    is_postgres = bind.dialect.name == "postgresql"
+    cutoff = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+
+    # ARCHIVE_STATUSES may name active statuses, whose stops the ETA cache holds
+    with changing_stops(bind) as conn:
+        eligible = (
+            select(Order.id, Order.created_at)
+            .where(Order.status.in_(ARCHIVE_STATUSES), Order.updated_at < cutoff)
+            .order_by(Order.id)
+            .limit(batch_size)
+        )
+        if not is_postgres:
+            # SQLite hands out max(id) + 1 for new rows, so moving the newest
+            # order away would let its id be reused by the next insert
+            eligible = eligible.where(Order.id < select(func.max(Order.id)).scalar_subquery())
+        batch = conn.execute(eligible).all()
+        if not batch:
+            return 0
+        order_ids = [row.id for row in batch]
+
+        if is_postgres:
+            ensure_partitions(conn, [row.created_at for row in batch])
+        _copy_to_archive(conn, order_ids)
+        if is_postgres:
+            return _delete_archived(conn, order_ids)
+    # SQLite: the copy has committed (to the archive file alone); now the live file
+    with changing_stops(bind) as conn:
+        return _delete_archived(conn, order_ids)
+
+
+def _copy_to_archive(conn, order_ids):
+    """Copy these orders and their stops into the archive, replacing any copy an interrupted batch left"""
+    order_columns = [c.name for c in Order.__table__.columns]
+    stop_columns = [c.name for c in Stop.__table__.columns]
+    conn.execute(delete(ArchivedStop).where(ArchivedStop.order_id.in_(order_ids)))
+    conn.execute(delete(ArchivedOrder).where(ArchivedOrder.id.in_(order_ids)))
+    archived_at = datetime.now(timezone.utc)
+    conn.execute(
+        insert(ArchivedOrder.__table__).from_select(
+            order_columns + ["archived_at"],
+            select(*[Order.__table__.c[name] for name in order_columns], literal(archived_at))
+            .where(Order.id.in_(order_ids))
+        )
+    )
+    conn.execute(
+        insert(ArchivedStop.__table__).from_select(
+            stop_columns + ["order_created_at"],
+            select(*[Stop.__table__.c[name] for name in stop_columns], Order.created_at)
+            .join(Order, Order.id == Stop.order_id)
+            .where(Stop.order_id.in_(order_ids))
+        )
+    )
+
+
+def _delete_archived(conn, order_ids) -> int:
+    """Delete the live rows of these orders whose archive copy is current; returns how many orders went"""
+    # Aliased: the archive tables have the live tables' names
+    archived_stops = ArchivedStop.__table__.alias("archived_stops")
+    archived_orders = ArchivedOrder.__table__.alias("archived_orders")
+    conn.execute(
+        delete(Stop).where(
+            Stop.order_id.in_(order_ids),
+            exists().where(archived_stops.c.id == Stop.id, archived_stops.c.version == Stop.version),
+        )
+    )
+    return conn.execute(
+        delete(Order).where(
+            Order.id.in_(order_ids),
+            exists().where(archived_orders.c.id == Order.id, archived_orders.c.version == Order.version),
+            ~exists().where(Stop.order_id == Order.id),
+        )
+    ).rowcount
+
+
+def archive_completed_orders(older_than_days: int = ARCHIVE_AFTER_DAYS,
+                             batch_size: int = ARCHIVE_BATCH_SIZE, log=print) -> int:
+    """Archive batches until nothing eligible is left"""
+    total = 0
+    while True:
+        moved = archive_batch(older_than_days, batch_size)
+        if not moved:
+            return total
+        total += moved
+        log(f"  archived {total} orders")
+
+
+async def run_archiver(stop_event: asyncio.Event, interval: int = ARCHIVE_INTERVAL_SECONDS, bind=engine):
+    """Background loop for the API process. Each batch runs in a worker thread."""
+    while not stop_event.is_set():
+        try:
+            while not stop_event.is_set():
+                moved = await asyncio.to_thread(archive_batch, ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE, bind)
+                if not moved:
+                    break
+                logger.info("Archived %d orders", moved)
+        except Exception:
+            logger.exception("Order archival failed; retrying next interval")
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move completed orders into the archive")
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS, help="archive orders older than this")
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    args = parser.parse_args()
+    moved = archive_completed_orders(args.days, args.batch_size)
+    print(f"✅ Archived {moved} orders")
@@ -0,0 +1,158 @@
+"""
+Throughput and peak memory of bulk loading (bulk_load.py) against the ORM.
+
+    python bench_bulk_load.py --stops 100000 1000000 5000000
+    python bench_bulk_load.py --modes bulk orm --stops 100000
+    python bench_bulk_load.py --postgres-url postgresql://fleet@localhost/fleet_bench --stops 1000000
+
+Each run loads synthetic customers and orders of 2-50 stops (26 on average)
+into a fresh database - a scratch SQLite file, or --postgres-url, which is
+dropped and re-migrated first, so point it at a scratch database - in a
+process of its own, so every run's peak RSS is its own. "bulk" streams the
+orders through load_orders() with the stops as tuples; "orm" builds Customer,
+Order and Stop objects in one session and commits at the end, as init_db.py
+used to. The triggers (order_summaries, status_events, outbox,
+customer_order_stats) run per row in "orm"; "bulk" turns all but
+customer_order_stats off and writes the summaries and status history per
+chunk (bulk_load.py), and both are part of the numbers.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Imported before a run starts, so the baseline RSS includes them
+from bulk_load import load_customers, load_orders
+from database import engine, SessionLocal
+from migrate import reset
+from migrations import upgrade
+from models import Customer, Order, Stop
+from route_metrics import apply_route_metrics
+
+STOP_COLUMNS = ("sequence", "location", "stop_type", "scheduled_time", "latitude", "longitude")
+CUSTOMERS_PER_STOPS = 1000
+
+
+def synthetic_customers(count: int):
+    for n in range(count):
+        yield {"name": f"Bench Customer {n}", "email": f"bench-{n}@example.com"}
+
+
+def synthetic_orders(stops: int, customers: int, seed: int = 7):
+    """Orders as dicts with their stops as tuples in STOP_COLUMNS order, until `stops` stops"""
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1)
+    made = 0
+    n = 0
+    while made < stops:
+        count = min(rng.randint(2, 50), max(stops - made, 2))
+        lat, lon = rng.uniform(30, 45), rng.uniform(-120, -75)
+        pickup = start + timedelta(minutes=n)
+        yield {
+            "customer_email": f"bench-{rng.randrange(customers)}@example.com",
+            "pickup_location": f"Depot {n % 97}",
+            "delivery_location": f"Store {n % 389}",
+            "pickup_date": pickup,
+            "delivery_date": pickup + timedelta(hours=2 * count),
+            "cargo_type": rng.choice(("Electronics", "Furniture", "Produce", "Machinery")),
+            "weight": round(rng.uniform(200, 20000), 1),
+            "reference_number": f"BENCH-{n:09d}",
+            "stops": [
+                (sequence, f"Stop {sequence} of {n}", "pickup" if sequence == 1 else "delivery",
+                 pickup + timedelta(hours=2 * sequence), lat + sequence * 0.01, lon + sequence * 0.01)
+                for sequence in range(1, count + 1)
+            ],
+        }
+        made += count
+        n += 1
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+
+
+def load_orm(stops: int, customers: int):
+    db = SessionLocal()
+    try:
+        people = [Customer(**values) for values in synthetic_customers(customers)]
+        db.add_all(people)
+        db.commit()
+        by_email = {c.email: c.id for c in people}
+        loaded = 0
+        for values in synthetic_orders(stops, customers):
+            order_stops = [Stop(**dict(zip(STOP_COLUMNS, stop))) for stop in values.pop("stops")]
+            order = Order(customer_id=by_email[values.pop("customer_email")], stops=order_stops, **values)
+            apply_route_metrics(order)
+            db.add(order)
+            loaded += len(order_stops)
+        db.commit()
+        return loaded
+    finally:
+        db.close()
+
+
+def load_bulk(stops: int, customers: int, chunk_size: int):
+    load_customers(synthetic_customers(customers), chunk_size=chunk_size, log=lambda message: None)
+    _, loaded = load_orders(synthetic_orders(stops, customers), stop_columns=STOP_COLUMNS,
+                            chunk_size=chunk_size, log=lambda message: None)
+    return loaded
+
+
+def child(mode: str, stops: int, chunk_size: int):
+    """One run, in the process started by run(); prints its result as JSON"""
+    if engine.dialect.name == "postgresql":
+        reset(engine)
+    else:
+        upgrade(engine, log=lambda *args: None)
+    customers = max(10, stops // CUSTOMERS_PER_STOPS)
+    baseline = peak_rss_mb()
+    started = time.perf_counter()
+    loaded = load_orm(stops, customers) if mode == "orm" else load_bulk(stops, customers, chunk_size)
+    elapsed = time.perf_counter() - started
+    print(json.dumps({
+        "mode": mode, "stops": loaded, "seconds": elapsed, "stops_per_s": loaded / elapsed,
+        "baseline_mb": baseline, "peak_mb": peak_rss_mb(),
+    }))
+
+
+def run(mode: str, stops: int, chunk_size: int, postgres_url: str = None) -> dict:
+    with tempfile.TemporaryDirectory() as scratch:
+        env = {**os.environ}
+        if postgres_url:
+            env["DATABASE_URL"] = postgres_url
+        else:
+            env["DATABASE_URL"] = f"sqlite:///{os.path.join(scratch, 'bench.db')}"
+            env["ARCHIVE_DATABASE_PATH"] = os.path.join(scratch, "bench_archive.db")
+            env["SQLITE_MODE"] = env.get("SQLITE_MODE", "tuned")
+        output = subprocess.run(
+            [sys.executable, __file__, "--child", mode, str(stops), "--chunk-size", str(chunk_size)],
+            cwd=os.path.dirname(os.path.abspath(__file__)), env=env, check=True, capture_output=True, text=True,
+        ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark bulk loading against the ORM")
+    parser.add_argument("--modes", nargs="+", choices=["bulk", "orm"], default=["bulk"])
+    parser.add_argument("--stops", type=int, nargs="+", default=[100_000, 1_000_000, 5_000_000])
+    parser.add_argument("--chunk-size", type=int, default=int(os.getenv("BULK_CHUNK_SIZE", "10000")))
+    parser.add_argument("--postgres-url", help="a scratch database: it is dropped and re-migrated per run")
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "STOPS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child[0], int(args.child[1]), args.chunk_size)
+        sys.exit(0)
+
+    print(f"{'mode':>6} {'stops':>10} {'seconds':>9} {'stops/s':>9} {'base MB':>8} {'peak MB':>8} {'growth MB':>10}")
+    for stops in args.stops:
+        for mode in dict.fromkeys(args.modes):
+            r = run(mode, stops, args.chunk_size, args.postgres_url)
+            print(f"{r['mode']:>6} {r['stops']:>10} {r['seconds']:>9.1f} {r['stops_per_s']:>9.0f} "
+                  f"{r['baseline_mb']:>8.0f} {r['peak_mb']:>8.0f} {r['peak_mb'] - r['baseline_mb']:>10.0f}")
@@ -0,0 +1,126 @@
+"""
+Bytes on the wire and end-to-end latency of GET /api/orders per response
+format and content encoding.
+
+    python bench_compression.py --seed 100 --requests 50
+
+Starts serve.py on a spare port (one worker). `--seed N` first creates N
+orders with a 200-point route geometry and 4 stops each through the API. Every
+request fetches a 100-order page and the time includes decompressing and
+parsing the body on the client. `transfer ms` adds the time the bytes would
+take over a --bandwidth-mbps link, which localhost hides.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+import zlib
+
+import httpx
+
+from bench_serve import free_port, wait_until_up
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+DECODERS = {
+    "identity": lambda data: data,
+    "gzip": lambda data: zlib.decompress(data, 31),
+}
+if brotli is not None:
+    DECODERS["br"] = brotli.decompress
+if zstandard is not None:
+    DECODERS["zstd"] = lambda data: zstandard.ZstdDecompressor().decompressobj().decompress(data)
+
+FORMATS = {"json": ("application/json", json.loads)}
+if msgpack is not None:
+    FORMATS["msgpack"] = ("application/msgpack", msgpack.unpackb)
+
+
+def seed(http: httpx.Client, count: int):
+    customer = http.post("/api/customers", json={
+        "name": "Benchmark Freight", "email": f"bench{time.time_ns()}@example.com"
+    }).json()
+    for i in range(count):
+        # A random walk, so pages aren't trivially repetitive
+        rng = random.Random(i)
+        lng, lat, coordinates = -118.24, 34.05, []
+        for _ in range(200):
+            lng, lat = lng + rng.uniform(0, 0.04), lat + rng.uniform(-0.02, 0.02)
+            coordinates.append([round(lng, 6), round(lat, 6)])
+        http.post("/api/orders", json={
+            "customer_id": customer["id"],
+            "pickup_location": f"Warehouse {i}, Los Angeles, CA",
+            "delivery_location": f"Distribution Center {i}, Phoenix, AZ",
+            "pickup_date": "2024-01-01T08:00:00",
+            "delivery_date": "2024-01-02T17:00:00",
+            "cargo_type": "General Freight",
+            "weight": 1000 + i,
+            "route_geometry": {"type": "LineString", "coordinates": coordinates},
+            "stops": [
+                {"sequence": s, "location": f"Stop {s}", "stop_type": "pickup" if s == 1 else "delivery",
+                 "scheduled_time": "2024-01-01T08:00:00", "latitude": 34.0 + s, "longitude": -118.0 + s}
+                for s in range(1, 5)
+            ],
+        })
+
+
+def measure(http: httpx.Client, media_type: str, parse, encoding: str, requests: int):
+    headers = {"Accept": media_type, "Accept-Encoding": encoding}
+    sizes, latencies = [], []
+    for _ in range(requests):
+        started = time.perf_counter()
+        with http.stream("GET", "/api/orders", params={"limit": 100}, headers=headers) as response:
+            raw = b"".join(response.iter_raw())
+            served = response.headers.get("content-encoding", "identity")
+        parse(DECODERS[served](raw))
+        latencies.append(time.perf_counter() - started)
+        sizes.append(len(raw))
+    return statistics.median(sizes), statistics.median(latencies), served
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark response formats and compression")
+    parser.add_argument("--seed", type=int, default=0, help="create this many orders first")
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--bandwidth-mbps", type=float, default=20.0)
+    args = parser.parse_args()
+
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen(
+        [sys.executable, "serve.py", "--host", "127.0.0.1", "--port", str(port), "--workers", "1"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        # One client address would trip the per-client limits
+        env={**os.environ, "ADMISSION_ENABLED": "false"},
+    )
+    try:
+        wait_until_up(base + "/")
+        with httpx.Client(base_url=base, timeout=60.0) as http:
+            if args.seed:
+                seed(http, args.seed)
+            print(f"{'format':<8} {'encoding':<9} {'bytes':>9} {'latency ms':>11} {'transfer ms':>12}")
+            for name, (media_type, parse) in FORMATS.items():
+                for encoding in DECODERS:
+                    size, latency, served = measure(http, media_type, parse, encoding, args.requests)
+                    transfer = size * 8 / (args.bandwidth_mbps * 1e6)
+                    print(f"{name:<8} {served:<9} {size:>9.0f} {latency * 1000:>11.1f} {(latency + transfer) * 1000:>12.1f}")
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
@@ -0,0 +1,99 @@
+"""
+CPU time per order list/detail request: ORM query built per call (the old
+get_orders code path) vs the prebuilt statements in order_queries.py.
+
+    python bench_queries.py --iterations 2000
+
+Runs against DATABASE_URL; point it at a seeded database (python init_db.py).
+Reports microseconds of process CPU time per call and the compiled-cache hit
+rate over the run.
+"""
+import argparse
+import time
+
+from sqlalchemy.orm import joinedload
+
+from database import SessionLocal, engine, compiled_cache_stats
+from models import Order
+from order_queries import (
+    order_filter_params, order_list_statement, order_count_statement, order_detail_statement
+)
+
+SHAPES = [
+    {"search": None, "status": None, "customer_id": None, "sort_by": "created_at", "sort_order": "desc"},
+    {"search": None, "status": "pending", "customer_id": None, "sort_by": "updated_at", "sort_order": "asc"},
+    {"search": "Chicago", "status": None, "customer_id": 1, "sort_by": "id", "sort_order": "desc"},
+]
+
+
+def built_per_call(db, search, status, customer_id, sort_by, sort_order, offset=0, limit=10):
+    query = db.query(Order).options(joinedload(Order.customer), joinedload(Order.stops))
+    if search:
+        term = f"%{search}%"
+        query = query.filter(
+            Order.pickup_location.ilike(term) | Order.delivery_location.ilike(term) |
+            Order.cargo_type.ilike(term) | Order.reference_number.ilike(term)
+        )
+    if status:
+        query = query.filter(Order.status == status)
+    if customer_id:
+        query = query.filter(Order.customer_id == customer_id)
+    total = query.count()
+    column = getattr(Order, sort_by)
+    query = query.order_by(column.desc() if sort_order == "desc" else column.asc())
+    return query.offset(offset).limit(limit).all(), total
+
+
+def prebuilt(db, search, status, customer_id, sort_by, sort_order, offset=0, limit=10):
+    shape, params = order_filter_params(search, status, customer_id)
+    total = db.execute(order_count_statement(Order, *shape), params).scalar()
+    orders = db.execute(
+        order_list_statement(Order, *shape, sort_by, sort_order),
+        {**params, "offset": offset, "limit": limit}
+    ).unique().scalars().all()
+    return orders, total
+
+
+def detail_built_per_call(db, order_id):
+    return db.query(Order).options(
+        joinedload(Order.customer), joinedload(Order.stops)
+    ).filter(Order.id == order_id).first()
+
+
+def detail_prebuilt(db, order_id):
+    return db.execute(order_detail_statement(Order), {"order_id": order_id}).unique().scalars().first()
+
+
+def describe(shape):
+    filters = " ".join(f"{k}={v}" for k, v in shape.items() if v and k not in ("sort_by", "sort_order"))
+    return f"list {filters or '(no filter)'} by {shape['sort_by']} {shape['sort_order']}"
+
+
+def cpu_per_call(fn, iterations):
+    for _ in range(min(50, iterations)):
+        fn()
+    started = time.process_time()
+    for _ in range(iterations):
+        fn()
+    return (time.process_time() - started) / iterations * 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare per-call and prebuilt order queries")
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        order_id = db.query(Order.id).limit(1).scalar() or 1
+        print(f"{'query':<48} {'built/call µs':>14} {'prebuilt µs':>12} {'saved µs':>9}")
+        cases = [(describe(shape), lambda s=shape: built_per_call(db, **s), lambda s=shape: prebuilt(db, **s))
+                 for shape in SHAPES]
+        cases.append(("detail", lambda: detail_built_per_call(db, order_id), lambda: detail_prebuilt(db, order_id)))
+        for name, old, new in cases:
+            before = cpu_per_call(old, args.iterations)
+            after = cpu_per_call(new, args.iterations)
+            print(f"{name:<48} {before:>14.0f} {after:>12.0f} {before - after:>9.0f}")
+    finally:
+        db.close()
+    print("compiled cache:", compiled_cache_stats.stats(engine))
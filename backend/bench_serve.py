@@ -0,0 +1,92 @@
+"""
+Startup time and throughput of serve.py with 1 worker vs N workers.
+
+    python bench_serve.py --workers 1 4 --seconds 10 --concurrency 64
+
+For each worker count this starts serve.py on a spare port, measures how long
+until GET / answers, then drives GET /api/orders with `concurrency` clients
+for `seconds` and reports requests/second overall and per worker. Point
+DATABASE_URL at a seeded database first (python init_db.py).
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(url: str, timeout: float = 60.0) -> float:
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return time.perf_counter() - started
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.05)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+async def drive(url: str, seconds: float, concurrency: int):
+    deadline = time.perf_counter() + seconds
+    counts = {"ok": 0, "error": 0}
+
+    async def client(http):
+        while time.perf_counter() < deadline:
+            try:
+                response = await http.get(url)
+                counts["ok" if response.status_code == 200 else "error"] += 1
+            except httpx.HTTPError:
+                counts["error"] += 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30.0) as http:
+        await asyncio.gather(*(client(http) for _ in range(concurrency)))
+    return counts
+
+
+def run(workers: int, seconds: float, concurrency: int, path: str):
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen(
+        [sys.executable, "serve.py", "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        # One client address would trip the per-client limits
+        env={**os.environ, "ADMISSION_ENABLED": "false"},
+    )
+    try:
+        startup = wait_until_up(base + "/")
+        # Every worker has to finish its lifespan warm-up; give them a moment
+        time.sleep(1.0)
+        counts = asyncio.run(drive(base + path, seconds, concurrency))
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+    rps = counts["ok"] / seconds
+    return {"workers": workers, "startup_s": startup, "rps": rps,
+            "rps_per_worker": rps / workers, "errors": counts["error"]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark single- vs multi-worker serving")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--path", default="/api/orders?limit=20")
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPU cores")
+    print(f"{'workers':>8} {'startup s':>10} {'req/s':>10} {'req/s/worker':>13} {'errors':>7}")
+    for workers in dict.fromkeys(args.workers):
+        r = run(workers, args.seconds, args.concurrency, args.path)
+        print(f"{r['workers']:>8} {r['startup_s']:>10.2f} {r['rps']:>10.0f} {r['rps_per_worker']:>13.0f} {r['errors']:>7}")
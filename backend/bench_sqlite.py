@@ -0,0 +1,167 @@
+"""
+Mixed read/write throughput and latency of the SQLite modes (see embedded.py).
+
+    python bench_sqlite.py --modes plain tuned memory --seconds 10 --concurrency 16 --write-share 0.2
+
+For each mode this copies the DATABASE_URL database (and its archive) to a
+scratch directory, starts serve.py on the copy and drives it with
+`concurrency` clients for `seconds`. A request is a write with probability
+`write_share` - PATCH /api/stops/{id}/status or PATCH /api/orders/{id} - and
+otherwise a read - GET /api/orders?limit=20&view=summary or
+GET /api/orders/{id}. Reports requests/second and p50/p99 latency for reads
+and writes. "memory" always runs one worker. Seed the database first (python init_db.py, or
+python bench_compression.py --seed N).
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from bench_serve import free_port, wait_until_up
+from statuses import sources
+
+# Writes flip between two statuses the state machine allows both ways
+# (statuses.py), so every write is valid however often it hits a row
+STOP_WRITE_STATUSES = ("pending", "failed")
+ORDER_WRITE_STATUSES = ("in_progress", "in_transit")
+
+
+def copy_database(source: str, target: str):
+    """Consistent copy through the backup API (the source may be in WAL mode)"""
+    src, dst = sqlite3.connect(source), sqlite3.connect(target)
+    try:
+        src.backup(dst)
+    finally:
+        src.close()
+        dst.close()
+
+
+def sample_ids(base: str):
+    """Orders and stops whose status can reach both write statuses"""
+    orders = httpx.get(base + "/api/orders", params={"limit": 100}, timeout=30.0).json()["orders"]
+    order_ids = [o["id"] for o in orders if all(o["status"] in sources("order", s) for s in ORDER_WRITE_STATUSES)]
+    stop_ids = [
+        s["id"] for o in orders for s in o["stops"]
+        if all((s["status"] or "pending") in sources("stop", status) for status in STOP_WRITE_STATUSES)
+    ]
+    if not order_ids or not stop_ids:
+        raise SystemExit("No open orders to work with - seed the database first")
+    return order_ids, stop_ids
+
+
+async def drive(base: str, seconds: float, concurrency: int, write_share: float, order_ids, stop_ids):
+    deadline = time.perf_counter() + seconds
+    latencies = {"read": [], "write": []}
+    errors = {"read": 0, "write": 0}
+
+    async def request(http):
+        if random.random() < write_share:
+            if random.random() < 0.5:
+                status = random.choice(STOP_WRITE_STATUSES)
+                call = http.patch(f"/api/stops/{random.choice(stop_ids)}/status", params={"status": status})
+            else:
+                status = random.choice(ORDER_WRITE_STATUSES)
+                call = http.patch(f"/api/orders/{random.choice(order_ids)}", json={"status": status})
+            return "write", call
+        if random.random() < 0.5:
+            return "read", http.get("/api/orders", params={"limit": 20, "view": "summary"})
+        return "read", http.get(f"/api/orders/{random.choice(order_ids)}")
+
+    async def client(http):
+        while time.perf_counter() < deadline:
+            kind, call = await request(http)
+            started = time.perf_counter()
+            try:
+                response = await call
+                if response.status_code < 400:
+                    latencies[kind].append(time.perf_counter() - started)
+                else:
+                    errors[kind] += 1
+            except httpx.HTTPError:
+                errors[kind] += 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=30.0) as http:
+        await asyncio.gather(*(client(http) for _ in range(concurrency)))
+    return latencies, errors
+
+
+def percentile(values, q: float) -> float:
+    return statistics.quantiles(values, n=100)[q - 1] * 1000 if len(values) > 1 else float("nan")
+
+
+def run(mode: str, source: str, workers: int, seconds: float, concurrency: int, write_share: float):
+    with tempfile.TemporaryDirectory() as scratch:
+        path = os.path.join(scratch, "bench.db")
+        copy_database(source, path)
+        archive = os.path.splitext(source)[0] + "_archive.db"
+        if os.path.exists(archive):
+            copy_database(archive, os.path.join(scratch, "bench_archive.db"))
+
+        port = free_port()
+        base = f"http://127.0.0.1:{port}"
+        server = subprocess.Popen(
+            [sys.executable, "serve.py", "--host", "127.0.0.1", "--port", str(port),
+             "--workers", str(1 if mode == "memory" else workers)],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env={
+                **os.environ,
+                "DATABASE_URL": f"sqlite:///{path}",
+                "ARCHIVE_DATABASE_PATH": os.path.join(scratch, "bench_archive.db"),
+                "SQLITE_MODE": mode,
+                # One client address would trip the per-client limits
+                "ADMISSION_ENABLED": "false",
+            },
+        )
+        try:
+            wait_until_up(base + "/")
+            time.sleep(1.0)
+            order_ids, stop_ids = sample_ids(base)
+            latencies, errors = asyncio.run(
+                drive(base, seconds, concurrency, write_share, order_ids, stop_ids)
+            )
+        finally:
+            server.terminate()
+            server.wait(timeout=60)
+
+    done = len(latencies["read"]) + len(latencies["write"])
+    return {
+        "mode": mode,
+        "rps": done / seconds,
+        "read_p50": percentile(latencies["read"], 50),
+        "read_p99": percentile(latencies["read"], 99),
+        "write_p50": percentile(latencies["write"], 50),
+        "write_p99": percentile(latencies["write"], 99),
+        "errors": errors["read"] + errors["write"],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark SQLite modes under mixed read/write traffic")
+    parser.add_argument("--modes", nargs="+", choices=["plain", "tuned", "memory"], default=["plain", "tuned", "memory"])
+    parser.add_argument("--workers", type=int, default=1, help="for plain and tuned")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--write-share", type=float, default=0.2)
+    args = parser.parse_args()
+
+    url = os.getenv("DATABASE_URL", "sqlite:///./fleet_management.db")
+    if not url.startswith("sqlite"):
+        raise SystemExit("DATABASE_URL must point at a SQLite database")
+    source = url.split("///", 1)[-1]
+    if not os.path.exists(source):
+        raise SystemExit(f"{source} does not exist - migrate and seed it first")
+
+    print(f"{'mode':>8} {'req/s':>8} {'read p50':>9} {'read p99':>9} {'write p50':>10} {'write p99':>10} {'errors':>7}")
+    for mode in dict.fromkeys(args.modes):
+        r = run(mode, source, args.workers, args.seconds, args.concurrency, args.write_share)
+        print(f"{r['mode']:>8} {r['rps']:>8.0f} {r['read_p50']:>9.1f} {r['read_p99']:>9.1f} "
+              f"{r['write_p50']:>10.1f} {r['write_p99']:>10.1f} {r['errors']:>7}")
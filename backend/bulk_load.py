@@ -0,0 +1,404 @@
+"""
+Bulk loading of customers, orders and stops.
+
+Rows are streamed in as plain dicts (or tuples, with the column names given
+once) and written with Core statements, one transaction per chunk of about
+BULK_CHUNK_SIZE stops: orders as an executemany INSERT, stops as COPY on
+PostgreSQL with psycopg2 or psycopg 3 and an executemany INSERT otherwise.
+No ORM objects, no identity map, and nothing kept between chunks but a
+bounded cache of customer ids, so memory stays flat however large the input
+is.
+
+  - An order names its customer by customer_id or customer_email; both are
+    checked against the customers table through IdCache, which loads a
+    chunk's misses in one query.
+  - Stops come nested in their order ("stops"), so their order_id is the id
+    the order was just given - no lookup.
+  - The route columns (route_metrics.py) are computed for a whole chunk at
+    once and written with the orders.
+  - Order and stop statuses must be ones statuses.py knows; there is no
+    previous status, so any of them will do.
+  - With sharding (sharding.py) each order goes to its customer's shard, with
+    order and stop ids from the shared allocator; customers are placed on a
+    shard and copied to all of them, as POST /api/customers does.
+
+The per-row insert triggers for order_summaries, status_events and the outbox
+are off in the loader's transactions (migration 0014; they were about half
+the cost of a load). Instead each chunk's summaries and its orders' and
+stops' first status_events rows are written with one INSERT ... SELECT per
+batch of orders, in the chunk's transaction, and loaded rows get no
+outbox_events: a load is not an event. customer_order_stats and
+order_changes are still kept by their triggers.
+A failed chunk rolls back on its own; the chunks before it stay loaded.
+
+Import JSON lines (one customer, or one order with its stops, per line):
+
+    python bulk_load.py customers customers.jsonl
+    python bulk_load.py orders orders.jsonl [--chunk-size 10000]
+"""
+import argparse
+import io
+import itertools
+import json
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Iterable, Iterator, Optional, Sequence
+
+from sqlalchemy import DateTime, case, func, insert, literal, select, text
+
+from database import engine, shard_engines
+from eta import changing_stops
+from models import Customer, Order, OrderSummary, Stop, StatusEvent
+from order_summaries import rewrite
+from route_metrics import route_metrics_many
+from sharding import SHARDING_ENABLED, id_allocator, replicate_customers, shard_for_customer, shard_map
+from statuses import ENTITY_CODES, ORDER_STATUS_CODES, STOP_STATUS_CODES
+
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "10000"))
+BULK_ID_CACHE_SIZE = int(os.getenv("BULK_ID_CACHE_SIZE", "50000"))
+# Keys per IN list when resolving customers, well under SQLite's bound-parameter limit
+LOOKUP_CHUNK_SIZE = 500
+
+# PostgreSQL drivers whose cursors can COPY; others insert stops with executemany
+COPY_DRIVERS = ("psycopg2", "psycopg")
+
+# Filled in by the database, not the loader
+SERVER_COLUMNS = ("id", "created_at", "updated_at", "version")
+
+
+class IdCache:
+    """
+    `key_column` value -> id of `model`, for the `size` most recently used
+    keys. resolve() answers a whole chunk and loads its misses in batches.
+    """
+
+    def __init__(self, model, key_column, bind=engine, size: int = BULK_ID_CACHE_SIZE):
+        self.model = model
+        self.key_column = key_column
+        self.bind = bind
+        self.size = size
+        self._ids = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, keys) -> dict:
+        found, missing = {}, []
+        for key in dict.fromkeys(keys):
+            if key in self._ids:
+                self._ids.move_to_end(key)
+                found[key] = self._ids[key]
+                self.hits += 1
+            else:
+                missing.append(key)
+        self.misses += len(missing)
+        with self.bind.connect() as conn:
+            for start in range(0, len(missing), LOOKUP_CHUNK_SIZE):
+                batch = missing[start:start + LOOKUP_CHUNK_SIZE]
+                for key, id_ in conn.execute(
+                    select(self.key_column, self.model.id).where(self.key_column.in_(batch))
+                ):
+                    found[key] = id_
+                    self.remember(key, id_)
+        return found
+
+    def remember(self, key, id_: int):
+        self._ids[key] = id_
+        self._ids.move_to_end(key)
+        if len(self._ids) > self.size:
+            self._ids.popitem(last=False)
+
+
+def _as_dicts(rows: Iterable, columns: Optional[Sequence[str]]) -> Iterator[dict]:
+    if columns is None:
+        return iter(rows)
+    return (dict(zip(columns, row)) for row in rows)
+
+
+class _RowShape:
+    """The insertable columns of a table, their defaults and which ones hold datetimes"""
+
+    def __init__(self, table, with_id: bool = False):
+        self.columns = [c.name for c in table.columns if c.name not in SERVER_COLUMNS]
+        if with_id:
+            self.columns.insert(0, "id")
+        self.defaults = {
+            c.name: c.default.arg for c in table.columns
+            if c.default is not None and c.default.is_scalar and c.name not in SERVER_COLUMNS
+        }
+        self.datetimes = {c.name for c in table.columns if isinstance(c.type, DateTime)}
+
+    def row(self, values: dict, **extra) -> dict:
+        """Every insertable column (executemany needs the same keys in each row)"""
+        row = {}
+        for name in self.columns:
+            value = extra[name] if name in extra else values.get(name, self.defaults.get(name))
+            if isinstance(value, str) and name in self.datetimes:
+                value = datetime.fromisoformat(value)
+            row[name] = value
+        return row
+
+
+def _copy_value(value) -> str:
+    if value is None:
+        return r"\N"
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    elif isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def copy_rows(conn, table, columns: Sequence[str], rows: Sequence[dict]):
+    """COPY ... FROM STDIN (PostgreSQL, a COPY_DRIVERS driver) in the connection's transaction"""
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(_copy_value(row[name]) for name in columns))
+        buffer.write("\n")
+    statement = f"COPY {table.name} ({', '.join(columns)}) FROM STDIN"
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        if conn.dialect.driver == "psycopg":
+            with cursor.copy(statement) as copy:
+                copy.write(buffer.getvalue())
+        else:
+            buffer.seek(0)
+            cursor.copy_expert(statement, buffer)
+    finally:
+        cursor.close()
+
+
+CUSTOMER_ROWS = _RowShape(Customer.__table__)
+# Sharded, order and stop ids come from the allocator rather than the database
+ORDER_ROWS = _RowShape(Order.__table__, with_id=SHARDING_ENABLED)
+STOP_ROWS = _RowShape(Stop.__table__, with_id=SHARDING_ENABLED)
+
+
+def reserve_stop_ids(stops) -> Optional[list]:
+    """
+    Ids for insert_stops() when sharded (None otherwise). Take them before
+    the write transaction starts: an order can have more stops than the
+    allocator keeps in hand, and a new block is a write to shard 0.
+    """
+    return id_allocator.reserve("stops", len(stops)) if SHARDING_ENABLED else None
+
+
+def insert_stops(conn, order_id: int, stops, ids: Optional[Sequence[int]] = None):
+    """
+    Insert one order's stops (dicts or schema objects) with a single
+    executemany; sharded, `ids` are from reserve_stop_ids()
+    """
+    rows = []
+    for index, stop in enumerate(stops):
+        values = stop if isinstance(stop, dict) else stop.dict()
+        extra = {"order_id": order_id}
+        if SHARDING_ENABLED:
+            extra["id"] = ids[index]
+        rows.append(STOP_ROWS.row(values, **extra))
+    if rows:
+        conn.execute(insert(Stop.__table__), rows)
+
+
+def _without_insert_triggers(conn):
+    """Turn off the migration 0014 triggers for the rest of conn's transaction"""
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SET LOCAL fleet.bulk_load = 'on'"))
+    else:
+        conn.execute(text("INSERT INTO bulk_load_flag (id) VALUES (1)"))
+
+
+def _restore_insert_triggers(conn):
+    if conn.dialect.name != "postgresql":
+        # Never committed, so no other connection ever sees the flag
+        conn.execute(text("DELETE FROM bulk_load_flag"))
+
+
+def _status_code(codes: dict, status):
+    return case(codes, value=status, else_=0)
+
+
+def _derived_rows(conn, order_ids: Sequence[int]):
+    """What the 0014 triggers would have written for these new orders: summaries and status_events"""
+    columns = ["entity_type", "entity_id", "order_id", "to_status"]
+    for start in range(0, len(order_ids), LOOKUP_CHUNK_SIZE):
+        batch = order_ids[start:start + LOOKUP_CHUNK_SIZE]
+        rewrite(conn, Order.id.in_(batch), OrderSummary.id.in_(batch))
+        conn.execute(insert(StatusEvent.__table__).from_select(columns, select(
+            literal(ENTITY_CODES["order"]), Order.id, Order.id, _status_code(ORDER_STATUS_CODES, Order.status),
+        ).where(Order.id.in_(batch)).order_by(Order.id)))
+        conn.execute(insert(StatusEvent.__table__).from_select(columns, select(
+            literal(ENTITY_CODES["stop"]), Stop.id, Stop.order_id,
+            _status_code(STOP_STATUS_CODES, func.coalesce(Stop.status, "pending")),
+        ).where(Stop.order_id.in_(batch)).order_by(Stop.id)))
+
+
+def load_customers(rows: Iterable, columns: Optional[Sequence[str]] = None,
+                   chunk_size: int = BULK_CHUNK_SIZE, log=print) -> int:
+    """Insert customers; returns how many"""
+    table = Customer.__table__
+    total = 0
+    rows = _as_dicts(rows, columns)
+    while True:
+        chunk = [CUSTOMER_ROWS.row(values) for values in itertools.islice(rows, chunk_size)]
+        if not chunk:
+            return total
+        with engine.begin() as conn:
+            _without_insert_triggers(conn)
+            if SHARDING_ENABLED:
+                ids = conn.execute(table.insert().returning(table.c.id, sort_by_parameter_order=True), chunk) \
+                    .scalars().all()
+                shard_map.place_many(conn, ids)
+            else:
+                conn.execute(table.insert(), chunk)
+            _restore_insert_triggers(conn)
+        if SHARDING_ENABLED:
+            # Customers are on every shard (the order read model joins them)
+            replicate_customers(ids)
+        total += len(chunk)
+        log(f"  loaded {total} customers")
+
+
+def _order_chunks(orders: Iterator[dict], chunk_size: int) -> Iterator[list]:
+    """Orders in groups of about chunk_size stops (or chunk_size orders)"""
+    chunk, stops = [], 0
+    for order in orders:
+        chunk.append(order)
+        stops += len(order.get("stops") or ())
+        if stops >= chunk_size or len(chunk) >= chunk_size:
+            yield chunk
+            chunk, stops = [], 0
+    if chunk:
+        yield chunk
+
+
+class OrderLoader:
+    """Writes chunks of orders with their stops; see load_orders()"""
+
+    def __init__(self, stop_columns: Optional[Sequence[str]] = None):
+        self.stop_columns = stop_columns
+        self.by_id = IdCache(Customer, Customer.id)
+        self.by_email = IdCache(Customer, Customer.email)
+
+    def _customer_ids(self, chunk) -> list:
+        by_id = self.by_id.resolve(o["customer_id"] for o in chunk if o.get("customer_id") is not None)
+        by_email = self.by_email.resolve(o["customer_email"] for o in chunk if o.get("customer_id") is None)
+        customer_ids = []
+        for order in chunk:
+            if order.get("customer_id") is not None:
+                customer_id = by_id.get(order["customer_id"])
+            else:
+                customer_id = by_email.get(order.get("customer_email"))
+            if customer_id is None:
+                key = order.get("customer_id") or order.get("customer_email")
+                raise ValueError(f"Unknown customer {key!r}")
+            customer_ids.append(customer_id)
+        return customer_ids
+
+    @staticmethod
+    def _check_statuses(order: dict, stops: list):
+        if order.get("status", "pending") not in ORDER_STATUS_CODES:
+            raise ValueError(f"Unknown order status {order['status']!r}")
+        for stop in stops:
+            if stop.get("status") is not None and stop["status"] not in STOP_STATUS_CODES:
+                raise ValueError(f"Unknown stop status {stop['status']!r}")
+
+    def write(self, chunk) -> int:
+        """One chunk, one transaction per shard it touches; returns the number of stops"""
+        customer_ids = self._customer_ids(chunk)
+        stops_per_order = [
+            [stop if isinstance(stop, dict) else dict(zip(self.stop_columns, stop)) for stop in order.get("stops") or ()]
+            for order in chunk
+        ]
+        metrics = route_metrics_many(
+            (order.get("route_geometry"), stops) for order, stops in zip(chunk, stops_per_order)
+        )
+
+        by_shard = {}
+        for order, customer_id, stops, route in zip(chunk, customer_ids, stops_per_order, metrics):
+            self._check_statuses(order, stops)
+            # Refuses (CustomerMovingError) while the customer is being moved
+            shard = shard_for_customer(customer_id, write=True) if SHARDING_ENABLED else 0
+            extra = {**route, "customer_id": customer_id}
+            if SHARDING_ENABLED:
+                # Taken before the shard's write transaction (SQLite: shard 0 may be that shard)
+                extra["id"] = id_allocator.next_id("orders")
+                stops = [{**stop, "id": id_} for stop, id_ in zip(stops, reserve_stop_ids(stops))]
+            by_shard.setdefault(shard, []).append((ORDER_ROWS.row(order, **extra), stops))
+
+        for shard, orders in by_shard.items():
+            with changing_stops(shard_engines[shard]) as conn:
+                self._insert(conn, orders)
+        return sum(len(stops) for stops in stops_per_order)
+
+    def _insert(self, conn, orders):
+        _without_insert_triggers(conn)
+        table = Order.__table__
+        order_rows = [row for row, _ in orders]
+        if SHARDING_ENABLED:
+            conn.execute(table.insert(), order_rows)
+            order_ids = [row["id"] for row in order_rows]
+        else:
+            order_ids = conn.execute(
+                table.insert().returning(table.c.id, sort_by_parameter_order=True), order_rows
+            ).scalars().all()
+
+        stop_rows = [
+            STOP_ROWS.row(stop, order_id=order_id)
+            for order_id, (_, stops) in zip(order_ids, orders)
+            for stop in stops
+        ]
+        if stop_rows and conn.dialect.name == "postgresql" and conn.dialect.driver in COPY_DRIVERS:
+            copy_rows(conn, Stop.__table__, STOP_ROWS.columns, stop_rows)
+        elif stop_rows:
+            conn.execute(insert(Stop.__table__), stop_rows)
+        _derived_rows(conn, order_ids)
+        _restore_insert_triggers(conn)
+
+
+def load_orders(rows: Iterable, columns: Optional[Sequence[str]] = None,
+                stop_columns: Optional[Sequence[str]] = None,
+                chunk_size: int = BULK_CHUNK_SIZE, log=print) -> tuple:
+    """
+    Insert orders, each with its "stops" (dicts, or tuples in stop_columns
+    order). Returns (orders, stops) loaded.
+    """
+    loader = OrderLoader(stop_columns)
+    orders = stops = 0
+    for chunk in _order_chunks(_as_dicts(rows, columns), chunk_size):
+        stops += loader.write(chunk)
+        orders += len(chunk)
+        log(f"  loaded {orders} orders, {stops} stops")
+    return orders, stops
+
+
+def read_jsonl(path: str) -> Iterator[dict]:
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+if __name__ == "__main__":
+    from database import memory_database
+
+    parser = argparse.ArgumentParser(description="Bulk load customers or orders from JSON lines")
+    parser.add_argument("kind", choices=["customers", "orders"])
+    parser.add_argument("path", help="one JSON object per line")
+    parser.add_argument("--chunk-size", type=int, default=BULK_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    try:
+        if args.kind == "customers":
+            loaded = f"{load_customers(read_jsonl(args.path), chunk_size=args.chunk_size)} customers"
+        else:
+            orders, stops = load_orders(read_jsonl(args.path), chunk_size=args.chunk_size)
+            loaded = f"{orders} orders with {stops} stops"
+    except ValueError as e:
+        # The chunks logged above are loaded; fix the input and load the rest
+        raise SystemExit(f"❌ {e}")
+    if memory_database is not None:
+        # SQLITE_MODE=memory: write the result back to the database file
+        memory_database.snapshot()
+    print(f"✅ Loaded {loaded} in {time.perf_counter() - started:.1f}s")
@@ -1,40 +1,264 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine.default import CACHE_HIT, CACHE_MISS
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, Session
+from fastapi import Request
+import logging
 import os
+import random
+import time
 from dotenv import load_dotenv
 
+from embedded import MemoryDatabase, WriterQueue, tune_connection, SQLITE_MODES
+from shared_state import shared
+
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Database URL - Use PostgreSQL or fallback to SQLite for development
 DATABASE_URL = os.getenv(
     "DATABASE_URL",
     "sqlite:///./fleet_management.db"
 )
 
+# Optional read replicas, comma separated. Read-only endpoints are routed to
+# them; everything else (and any flush) goes to the primary.
+DATABASE_REPLICA_URLS = [u.strip() for u in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if u.strip()]
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_CHECK_INTERVAL_SECONDS = float(os.getenv("REPLICA_CHECK_INTERVAL_SECONDS", "5"))
+# Compiled SQL statements kept per engine (SQLAlchemy's default is 500)
+COMPILED_CACHE_SIZE = int(os.getenv("SQL_COMPILED_CACHE_SIZE", "1200"))
+# psycopg 3 (postgresql+psycopg://) prepares a statement server-side after it
+# has run this many times on a connection. psycopg2 has no prepared statements.
+PG_PREPARE_THRESHOLD = int(os.getenv("PG_PREPARE_THRESHOLD", "5"))
+# SQLite only: "tuned", "memory" or "plain" - see embedded.py
+SQLITE_MODE = os.getenv("SQLITE_MODE", "tuned")
+SQLITE_MMAP_SIZE_MB = int(os.getenv("SQLITE_MMAP_SIZE_MB", "256"))
+SQLITE_CACHE_SIZE_MB = int(os.getenv("SQLITE_CACHE_SIZE_MB", "32"))
+SQLITE_BUSY_TIMEOUT_SECONDS = float(os.getenv("SQLITE_BUSY_TIMEOUT_SECONDS", "5"))
+SQLITE_SNAPSHOT_INTERVAL_SECONDS = float(os.getenv("SQLITE_SNAPSHOT_INTERVAL_SECONDS", "60"))
+if SQLITE_MODE not in SQLITE_MODES:
+    raise ValueError(f"Unknown SQLITE_MODE {SQLITE_MODE!r}, expected one of {SQLITE_MODES}")
+# Optional order shards, comma separated (see sharding.py). DATABASE_URL is
+# shard 0 and also holds the customer -> shard map.
+SHARD_DATABASE_URLS = [u.strip() for u in os.getenv("SHARD_DATABASE_URLS", "").split(",") if u.strip()]
+if SHARD_DATABASE_URLS and SQLITE_MODE == "memory" and not DATABASE_URL.startswith("postgresql"):
+    raise ValueError("SQLITE_MODE=memory does not support SHARD_DATABASE_URLS")
+# After a client writes, its reads stay on the primary this long
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "10"))
+STICKY_COOKIE = "fm_primary_until"
+
 # Determine if using PostgreSQL
 IS_POSTGRES = DATABASE_URL.startswith("postgresql")
 
-# Create engine with appropriate settings
-if IS_POSTGRES:
-    engine = create_engine(
-        DATABASE_URL,
-        echo=False,
-        pool_pre_ping=True
-    )
-else:
+# Archived orders live in the "archive" schema: a real schema on PostgreSQL,
+# an attached database file next to the main one on SQLite
+ARCHIVE_SCHEMA = "archive"
+
+
+def _sqlite_path(url: str) -> str:
+    path = url.split("///", 1)[-1] if "///" in url else ""
+    return path or ":memory:"
+
+
+def _sqlite_archive_path(url: str) -> str:
+    path = _sqlite_path(url)
+    if path == ":memory:":
+        return path
+    return os.path.splitext(path)[0] + "_archive.db"
+
+
+def make_engine(url: str, archive_path: str = None, sqlite_mode: str = SQLITE_MODE):
+    """Create an engine with appropriate settings for its backend"""
+    if url.startswith("postgresql"):
+        connect_args = {"prepare_threshold": PG_PREPARE_THRESHOLD} if url.startswith("postgresql+psycopg:") else {}
+        return create_engine(
+            url,
+            echo=False,
+            pool_pre_ping=True,
+            query_cache_size=COMPILED_CACHE_SIZE,
+            connect_args=connect_args
+        )
+
     # SQLite
-    engine = create_engine(
-        DATABASE_URL,
+    sqlite_engine = create_engine(
+        url,
         echo=False,
-        connect_args={"check_same_thread": False}
+        query_cache_size=COMPILED_CACHE_SIZE,
+        connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_SECONDS}
     )
+    archive_path = archive_path or _sqlite_archive_path(url)
+
+    @event.listens_for(sqlite_engine, "connect")
+    def _attach_archive(dbapi_connection, connection_record):
+        dbapi_connection.execute(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}", (archive_path,))
+        tune_connection(dbapi_connection, sqlite_mode, ("main", ARCHIVE_SCHEMA), SQLITE_MMAP_SIZE_MB, SQLITE_CACHE_SIZE_MB)
+
+    return sqlite_engine
+
+
+# In "memory" mode the database files are only snapshots; in "tuned" and
+# "memory" modes this process's write transactions queue on writer_queue
+memory_database = None
+writer_queue = None
+if not IS_POSTGRES:
+    ARCHIVE_DATABASE_PATH = os.getenv("ARCHIVE_DATABASE_PATH", _sqlite_archive_path(DATABASE_URL))
+    if SQLITE_MODE == "memory":
+        memory_database = MemoryDatabase(_sqlite_path(DATABASE_URL), ARCHIVE_DATABASE_PATH)
+        memory_database.restore()
+        engine = make_engine(memory_database.url, memory_database.uris["archive"], "memory")
+    else:
+        engine = make_engine(DATABASE_URL, ARCHIVE_DATABASE_PATH)
+    if SQLITE_MODE != "plain":
+        writer_queue = WriterQueue(SQLITE_BUSY_TIMEOUT_SECONDS)
+        writer_queue.watch(engine)
+else:
+    engine = make_engine(DATABASE_URL)
+
+
+class CompiledCacheStats:
+    """Counts compiled-cache hits and misses for every statement an engine runs"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.uncached = 0
+
+    def watch(self, watched_engine):
+        @event.listens_for(watched_engine, "before_cursor_execute")
+        def _count(conn, cursor, statement, parameters, context, executemany):
+            if context is None:
+                return
+            if context.cache_hit is CACHE_HIT:
+                self.hits += 1
+            elif context.cache_hit is CACHE_MISS:
+                self.misses += 1
+            else:
+                self.uncached += 1
+
+    def stats(self, watched_engine):
+        lookups = self.hits + self.misses
+        cache = watched_engine._compiled_cache
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "uncached": self.uncached,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "size": len(cache) if cache is not None else 0,
+            "capacity": COMPILED_CACHE_SIZE,
+        }
+
+
+# Shard 0 is the primary engine; the others are plain engines of their own
+shard_engines = [engine] + [make_engine(url) for url in SHARD_DATABASE_URLS]
+for shard_engine in shard_engines[1:]:
+    if shard_engine.dialect.name == "sqlite" and SQLITE_MODE != "plain":
+        WriterQueue(SQLITE_BUSY_TIMEOUT_SECONDS).watch(shard_engine)
+
+compiled_cache_stats = CompiledCacheStats()
+for shard_engine in shard_engines:
+    compiled_cache_stats.watch(shard_engine)
+
+
+class Replica:
+    def __init__(self, url: str):
+        self.url = url
+        self.engine = make_engine(url)
+        self.healthy = True
+        self.lag = 0.0
+        self.checked_at = 0.0
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    def check(self):
+        """Probe the replica and measure replication lag"""
+        try:
+            with self.engine.connect() as conn:
+                if self.engine.dialect.name == "postgresql":
+                    lag = conn.execute(text(
+                        "SELECT CASE WHEN pg_is_in_recovery() "
+                        "THEN COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) "
+                        "ELSE 0 END"
+                    )).scalar()
+                else:
+                    conn.execute(text("SELECT 1"))
+                    lag = 0.0
+            self.lag = float(lag or 0.0)
+            self.healthy = self.lag <= REPLICA_MAX_LAG_SECONDS
+        except Exception as e:
+            logger.warning("Replica %s failed health check: %s", self.engine.url, e)
+            self.healthy = False
+        self.checked_at = time.monotonic()
+
+
+class ReplicaSet:
+    def __init__(self, urls):
+        self.replicas = [Replica(url) for url in urls]
+
+    def choose(self):
+        """A random healthy replica engine, or None to fall back to the primary"""
+        healthy = [r for r in self.replicas if r.healthy]
+        return random.choice(healthy).engine if healthy else None
+
+    def check_all(self):
+        for replica in self.replicas:
+            replica.check()
+
+    def stats(self):
+        return [
+            {"url": repr(r.engine.url), "healthy": r.healthy, "lag_seconds": r.lag}
+            for r in self.replicas
+        ]
+
+
+replicas = ReplicaSet(DATABASE_REPLICA_URLS)
+
+
+class RoutingSession(Session):
+    """
+    Sends reads to a replica when the session was opened read-only; writes,
+    flushes and ordinary sessions always use the primary. A session sticks to
+    the replica it first picked, so one request sees one snapshot.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self._flushing or not self.info.get("read_only"):
+            return engine
+        if "replica" not in self.info:
+            self.info["replica"] = replicas.choose()
+        return self.info["replica"] or engine
+
+
+SessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False, bind=engine)
+# Sessions per shard; shard 0 is SessionLocal, so it keeps the replica routing
+shard_session_factories = [SessionLocal] + [
+    sessionmaker(autocommit=False, autoflush=False, bind=shard_engine) for shard_engine in shard_engines[1:]
+]
 
 Base = declarative_base()
 
+
+def mark_recent_write(request: Request, response):
+    """Pin this client's reads to the primary for READ_YOUR_WRITES_SECONDS"""
+    if not replicas.replicas:
+        return
+    until = time.time() + READ_YOUR_WRITES_SECONDS
+    if request.client is not None:
+        # By address too, for clients that don't keep cookies; shared across workers
+        shared.set(f"ryw:{request.client.host}", 1, ttl=READ_YOUR_WRITES_SECONDS)
+    response.set_cookie(STICKY_COOKIE, str(int(until) + 1), max_age=int(READ_YOUR_WRITES_SECONDS) + 1, httponly=True)
+
+
+def _wrote_recently(request: Request) -> bool:
+    now = time.time()
+    try:
+        if float(request.cookies.get(STICKY_COOKIE, 0)) > now:
+            return True
+    except ValueError:
+        pass
+    return request.client is not None and shared.get(f"ryw:{request.client.host}") is not None
+
+
 # Dependency to get DB session
 def get_db():
     db = SessionLocal()
@@ -42,3 +266,17 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def reads_from_replica(request: Request) -> bool:
+    return bool(replicas.replicas) and not _wrote_recently(request)
+
+
+# Dependency for read-only handlers - may be served by a replica
+def get_read_db(request: Request):
+    db = SessionLocal()
+    db.info["read_only"] = reads_from_replica(request)
+    try:
+        yield db
+    finally:
+        db.close()
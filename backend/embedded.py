@@ -0,0 +1,174 @@
+"""
+SQLite tuning for the embedded deployment (edge depots, CI).
+
+database.py opens a SQLite DATABASE_URL according to SQLITE_MODE:
+  - "tuned" (default): WAL journal, synchronous=NORMAL, memory-mapped reads,
+    a larger page cache and in-memory temp tables, on the main and archive
+    databases. In WAL mode readers neither block the writer nor each other;
+    NORMAL skips the fsync on every commit, so a power cut can lose the last
+    few commits but never corrupts the file.
+  - "memory": the database lives in process memory (SQLite's memdb VFS). It
+    is loaded from the DATABASE_URL file at startup and copied back with the
+    online backup API every SQLITE_SNAPSHOT_INTERVAL_SECONDS and at shutdown,
+    so a crash loses at most one interval. Only one process can use it.
+  - "plain": SQLite's defaults (rollback journal, fsync on every commit).
+
+SQLite allows one write transaction at a time. Outside "plain" mode, write
+transactions within a process queue on a lock (WriterQueue) instead of
+polling for the database write lock with sleeps in between.
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import quote
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+SQLITE_MODES = ("plain", "tuned", "memory")
+
+WRITE_VERBS = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+
+
+def tune_connection(dbapi_connection, mode: str, schemas, mmap_size_mb: int, cache_size_mb: int):
+    """Apply the per-connection PRAGMAs for `mode` to every attached schema"""
+    if mode == "plain":
+        return
+    for schema in schemas:
+        if mode == "tuned":
+            # journal_mode is stored in the file; the rest are per connection
+            dbapi_connection.execute(f"PRAGMA {schema}.journal_mode = WAL")
+            dbapi_connection.execute(f"PRAGMA {schema}.synchronous = NORMAL")
+            dbapi_connection.execute(f"PRAGMA {schema}.mmap_size = {mmap_size_mb * 1024 * 1024}")
+        dbapi_connection.execute(f"PRAGMA {schema}.cache_size = {-cache_size_mb * 1024}")
+    dbapi_connection.execute("PRAGMA temp_store = MEMORY")
+
+
+class WriterQueue:
+    """
+    One write transaction at a time per process. pysqlite opens a transaction
+    at a connection's first INSERT/UPDATE/DELETE; the connection takes the
+    lock there and gives it back at commit or rollback. A writer that waits
+    longer than `timeout` goes ahead and leaves it to SQLite's busy handler.
+    """
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+
+        # Counters for observability
+        self.transactions = 0
+        self.waited = 0
+        self.wait_seconds = 0.0
+        self.timeouts = 0
+
+    def watch(self, engine):
+        @event.listens_for(engine, "before_cursor_execute")
+        def _enter(conn, cursor, statement, parameters, context, executemany):
+            if "writer_queue" in conn.info or not statement.lstrip()[:7].upper().startswith(WRITE_VERBS):
+                return
+            held = self._lock.acquire(blocking=False)
+            if not held:
+                started = time.perf_counter()
+                held = self._lock.acquire(timeout=self.timeout)
+                self.waited += 1
+                self.wait_seconds += time.perf_counter() - started
+                self.timeouts += not held
+            conn.info["writer_queue"] = held
+            self.transactions += 1
+
+        @event.listens_for(engine, "commit")
+        @event.listens_for(engine, "rollback")
+        def _leave(conn):
+            self._release(conn.info)
+
+        # A connection that goes back to the pool mid-transaction is rolled back there
+        @event.listens_for(engine.pool, "reset")
+        def _reset(dbapi_connection, connection_record, reset_state):
+            self._release(connection_record.info)
+
+    def _release(self, info):
+        if info.pop("writer_queue", False):
+            self._lock.release()
+
+    def stats(self) -> dict:
+        return {
+            "transactions": self.transactions,
+            "waited": self.waited,
+            "wait_ms_total": round(self.wait_seconds * 1000, 1),
+            "timeouts": self.timeouts,
+        }
+
+
+class MemoryDatabase:
+    """
+    The main and archive databases held in memory, restored from and
+    snapshotted to their files. Each memdb database exists while a connection
+    to it is open, so this object keeps one open for the life of the process.
+    """
+
+    def __init__(self, path: str, archive_path: str):
+        self.paths = {"main": os.path.abspath(path), "archive": os.path.abspath(archive_path)}
+        self.uris = {schema: f"file:{quote(p)}?vfs=memdb" for schema, p in self.paths.items()}
+        self._connections = {
+            schema: sqlite3.connect(uri, uri=True, check_same_thread=False) for schema, uri in self.uris.items()
+        }
+        self._lock = threading.Lock()
+        self.snapshots = 0
+        self.last_snapshot_seconds = None
+
+    @property
+    def url(self) -> str:
+        """SQLAlchemy URL of the in-memory main database"""
+        return f"sqlite:///file:{quote(self.paths['main'])}?vfs=memdb&uri=true"
+
+    def restore(self):
+        """Load the files into memory (a missing file leaves that database empty)"""
+        with self._lock:
+            for schema, path in self.paths.items():
+                if not os.path.exists(path):
+                    continue
+                source = sqlite3.connect(path)
+                try:
+                    # memdb cannot open a WAL-mode image: checkpoint and switch the file back first
+                    source.execute("PRAGMA journal_mode = DELETE")
+                    source.backup(self._connections[schema])
+                finally:
+                    source.close()
+
+    def snapshot(self):
+        """Copy both databases to their files; each file is replaced atomically"""
+        started = time.perf_counter()
+        with self._lock:
+            for schema, path in self.paths.items():
+                target = sqlite3.connect(path + ".snapshot")
+                try:
+                    self._connections[schema].backup(target)
+                finally:
+                    target.close()
+                os.replace(path + ".snapshot", path)
+        self.snapshots += 1
+        self.last_snapshot_seconds = time.perf_counter() - started
+
+    async def run_snapshots(self, stop_event: asyncio.Event, interval: float):
+        """Background loop for the API process: snapshot every `interval` and once more on the way out"""
+        while not stop_event.is_set():
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await asyncio.to_thread(self.snapshot)
+            except Exception:
+                logger.exception("In-memory database snapshot failed; retrying next interval")
+
+    def stats(self) -> dict:
+        return {
+            "snapshot_paths": self.paths,
+            "snapshots": self.snapshots,
+            "last_snapshot_ms": round(self.last_snapshot_seconds * 1000, 1) if self.last_snapshot_seconds else None,
+        }
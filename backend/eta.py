@@ -0,0 +1,245 @@
+"""
+Vectorised ETA and lateness for the stops of active orders.
+
+The stops of all active orders are loaded once as columnar NumPy arrays and
+cached until a write that changes them commits: every write path that
+touches stops or active orders marks its session with stops_changed() or runs
+its Core transaction in changing_stops(), and the shard's cache is dropped once
+that transaction has committed. The cache generation
+lives in the shared state store so every worker sees every other worker's
+writes; a TTL backs this up for writers outside the API (scripts, other
+services). Each request then recomputes the ETAs
+against the current time, which is pure array arithmetic:
+
+  - a vehicle is at the order's last completed stop (at its departure time,
+    else arrival time), or at the first pending stop at its scheduled time if
+    nothing is completed yet;
+  - it then drives the remaining pending stops in sequence, at the speed for
+    the order's vehicle_type, with haversine distance x ETA_ROAD_FACTOR and
+    ETA_DWELL_MINUTES spent at each stop;
+  - nothing arrives earlier than now.
+
+The first stop of an order with nothing completed is assumed to be on time, so
+its lateness is how close its scheduled time is to now.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from database import shard_engines
+from route_optimizer import EARTH_RADIUS_KM
+from shared_state import shared
+from models import Order, Stop, ORDER_TERMINAL_STATUSES, STOP_DONE_STATUSES
+
+DEFAULT_SPEEDS_KMH = {
+    "Dry Van": 80.0,
+    "Refrigerated": 75.0,
+    "Flatbed": 72.0,
+    "Box Truck": 65.0,
+    "default": 70.0,
+}
+# JSON object of vehicle_type -> km/h, merged over the defaults
+SPEED_MODEL = {**DEFAULT_SPEEDS_KMH, **json.loads(os.getenv("ETA_SPEED_MODEL", "{}"))}
+ROAD_FACTOR = float(os.getenv("ETA_ROAD_FACTOR", "1.25"))
+DWELL_MINUTES = float(os.getenv("ETA_DWELL_MINUTES", "30"))
+CACHE_TTL_SECONDS = float(os.getenv("ETA_CACHE_TTL_SECONDS", "30"))
+
+
+def _epoch(column, dialect_name):
+    """Seconds since the Unix epoch, computed in SQL so no datetimes reach Python"""
+    if dialect_name == "postgresql":
+        return func.extract("epoch", column)
+    return (func.julianday(column) - 2440587.5) * 86400.0
+
+
+class StopArrays:
+    """Columnar snapshot of the stops of active orders, sorted by (order_id, sequence)"""
+
+    def __init__(self, rows):
+        columns = list(zip(*rows)) if rows else [()] * 9
+        self.stop_id = np.array(columns[0], dtype=np.int64)
+        self.order_id = np.array(columns[1], dtype=np.int64)
+        self.latitude = np.array(columns[2], dtype=np.float64)
+        self.longitude = np.array(columns[3], dtype=np.float64)
+        self.scheduled = np.array(columns[4], dtype=np.float64)
+        self.done = np.isin(np.array(columns[5], dtype=object), STOP_DONE_STATUSES)
+        self.departed = np.array(columns[6], dtype=np.float64)  # NaN when unknown
+        self.arrived = np.array(columns[7], dtype=np.float64)
+        default = SPEED_MODEL["default"]
+        self.speed_kmh = np.array([SPEED_MODEL.get(v, default) for v in columns[8]], dtype=np.float64)
+
+    def __len__(self):
+        return len(self.stop_id)
+
+
+def load_stop_arrays(db) -> StopArrays:
+    """One query, NULLs become NaN in the float columns"""
+    dialect_name = db.get_bind().dialect.name
+    rows = db.execute(
+        select(
+            Stop.id,
+            Stop.order_id,
+            Stop.latitude,
+            Stop.longitude,
+            _epoch(Stop.scheduled_time, dialect_name),
+            Stop.status,
+            _epoch(Stop.actual_departure_time, dialect_name),
+            _epoch(Stop.actual_arrival_time, dialect_name),
+            Order.vehicle_type,
+        )
+        .join(Order, Order.id == Stop.order_id)
+        .where(Order.status.notin_(ORDER_TERMINAL_STATUSES))
+        .order_by(Stop.order_id, Stop.sequence)
+    ).all()
+    return StopArrays(rows)
+
+
+def compute_etas(arrays: StopArrays, now: float = None,
+                 dwell_minutes: float = DWELL_MINUTES, road_factor: float = ROAD_FACTOR):
+    """
+    Returns (indices of pending stops into `arrays`, eta epoch seconds,
+    lateness in seconds) - all vectorised, no Python loop over stops.
+    """
+    now = time.time() if now is None else now
+    pending = np.flatnonzero(~arrays.done)
+    if len(pending) == 0:
+        empty = np.empty(0)
+        return pending, empty, empty
+
+    oid = arrays.order_id
+    # Anchor = last completed stop of each order (rows are sorted by order, sequence)
+    done_idx = np.flatnonzero(arrays.done)
+    done_orders = oid[done_idx]
+    last_of_order = np.r_[done_orders[1:] != done_orders[:-1], True] if len(done_idx) else np.empty(0, dtype=bool)
+    anchor_orders, anchor_rows = done_orders[last_of_order], done_idx[last_of_order]
+
+    p_orders = oid[pending]
+    first = np.r_[True, p_orders[1:] != p_orders[:-1]]
+
+    # Previous point for every pending stop: the previous pending stop, or the
+    # anchor for the first pending stop of an order (-1 when there is none)
+    prev_rows = np.r_[-1, pending[:-1]]
+    if len(anchor_orders):
+        pos = np.minimum(np.searchsorted(anchor_orders, p_orders), len(anchor_orders) - 1)
+        anchor_for_pending = np.where(anchor_orders[pos] == p_orders, anchor_rows[pos], -1)
+    else:
+        anchor_for_pending = np.full(len(pending), -1)
+    prev_rows = np.where(first, anchor_for_pending, prev_rows)
+    valid_prev = prev_rows >= 0
+    safe_prev = np.where(valid_prev, prev_rows, 0)
+
+    lat1 = np.radians(arrays.latitude[safe_prev])
+    lon1 = np.radians(arrays.longitude[safe_prev])
+    lat2 = np.radians(arrays.latitude[pending])
+    lon2 = np.radians(arrays.longitude[pending])
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    leg_km = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0))) * road_factor
+    leg_km = np.where(valid_prev & np.isfinite(leg_km), leg_km, 0.0)
+    leg_seconds = leg_km / arrays.speed_kmh[pending] * 3600.0
+
+    # Start of each order's remaining run
+    anchor_time = np.where(
+        np.isfinite(arrays.departed[safe_prev]), arrays.departed[safe_prev], arrays.arrived[safe_prev]
+    )
+    anchor_time = np.where(np.isfinite(anchor_time), anchor_time, now)
+    start = np.where(valid_prev, anchor_time + leg_seconds, arrays.scheduled[pending])
+    start = np.maximum(start, now)
+
+    # Cumulative drive + dwell after the first pending stop, reset per order
+    step = np.where(first, 0.0, leg_seconds + dwell_minutes * 60.0)
+    cumulative = np.cumsum(step)
+    group_start = np.maximum.accumulate(np.where(first, np.arange(len(pending)), 0))
+    eta = start[group_start] + (cumulative - cumulative[group_start])
+
+    lateness = eta - arrays.scheduled[pending]
+    # Orders that haven't started: the first stop is only at risk as its
+    # scheduled time comes near (or passes) with nothing completed
+    not_started = first & ~valid_prev
+    lateness = np.where(not_started, now - arrays.scheduled[pending], lateness)
+    return pending, eta, lateness
+
+
+class StopArrayCache:
+    """Caches StopArrays until a write to its shard's stops or active orders commits, or the TTL expires"""
+
+    GENERATION_KEY = "eta:generation"
+
+    def __init__(self, ttl: float = CACHE_TTL_SECONDS, generation_key: str = GENERATION_KEY):
+        self.ttl = ttl
+        self.generation_key = generation_key
+        self._lock = threading.Lock()
+        self._entry = None  # (generation, loaded_at, arrays)
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def generation(self) -> int:
+        return int(shared.get(self.generation_key) or 0)
+
+    def invalidate(self):
+        shared.incr(self.generation_key)
+
+    def get(self, db) -> StopArrays:
+        generation = self.generation
+        entry = self._entry
+        if entry is not None and entry[0] == generation and time.monotonic() - entry[1] < self.ttl:
+            self.hits += 1
+            return entry[2]
+        with self._lock:
+            entry = self._entry
+            if entry is not None and entry[0] == generation and time.monotonic() - entry[1] < self.ttl:
+                self.hits += 1
+                return entry[2]
+            arrays = load_stop_arrays(db)
+            self._entry = (generation, time.monotonic(), arrays)
+            self.misses += 1
+            return arrays
+
+
+# One cache per shard (sharding.py), each invalidated by commits to its own database
+stop_array_caches = [
+    StopArrayCache(generation_key=StopArrayCache.GENERATION_KEY if shard == 0 else f"eta:generation:{shard}")
+    for shard in range(len(shard_engines))
+]
+stop_array_cache = stop_array_caches[0]
+
+
+def invalidate_stop_arrays(bind):
+    """Drop the cached arrays of the shard `bind` (an Engine or Connection) is on"""
+    for cache, shard_engine in zip(stop_array_caches, shard_engines):
+        if shard_engine is bind.engine:
+            cache.invalidate()
+
+
+# The generation only moves once the data is visible: a reader that reloaded
+# between a bump and the DBAPI commit would keep stale arrays under the new
+# generation until the TTL ran out
+def stops_changed(db: Session):
+    """Mark the session's transaction as changing stops or active orders"""
+    db.info["eta_dirty"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    if session.info.pop("eta_dirty", False):
+        invalidate_stop_arrays(session.get_bind())
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _after_transaction_end(session, transaction):
+    if transaction.parent is None:
+        session.info.pop("eta_dirty", None)
+
+
+@contextmanager
+def changing_stops(bind):
+    """`bind.begin()` for Core writes to stops or active orders; invalidates once it has committed"""
+    with bind.begin() as conn:
+        yield conn
+    invalidate_stop_arrays(bind)
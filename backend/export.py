@@ -0,0 +1,240 @@
+"""
+Columnar export of orders and stops for analytics.
+
+Rows are streamed from the database in batches of EXPORT_BATCH_SIZE, turned
+into Arrow record batches and written to Parquet one row group per batch, so
+memory stays bounded by the batch size no matter how large the tables are.
+status, carrier, cargo_type, vehicle_type and stop_type are dictionary
+encoded.
+
+Exports are incremental by updated_at. A run covers [since, until), where
+`until` is now minus EXPORT_SAFETY_LAG_SECONDS (so transactions still in
+flight are picked up by the next run) and `since` is the previous run's
+`until`. Consecutive runs therefore never miss or repeat a change; a row that
+changed again shows up in both runs, so readers keep the latest updated_at
+per id. Deletes (including archival) are not exported.
+
+Nightly run, appending one part file per table to ./export:
+
+    python export.py --output ./export
+
+The watermark is kept in <output>/_watermark.json; --full ignores it.
+"""
+import argparse
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import select
+
+from database import engine, replicas, shard_engines
+from models import Order, Stop
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "10000"))
+EXPORT_SAFETY_LAG_SECONDS = int(os.getenv("EXPORT_SAFETY_LAG_SECONDS", "300"))
+EXPORT_COMPRESSION = os.getenv("EXPORT_COMPRESSION", "zstd")
+
+PARQUET_MEDIA_TYPE = "application/vnd.apache.parquet"
+
+_category = pa.dictionary(pa.int32(), pa.string())
+_utc = pa.timestamp("us", tz="UTC")
+_naive = pa.timestamp("us")
+
+EXPORT_SCHEMAS = {
+    "orders": (Order, pa.schema([
+        ("id", pa.int64()),
+        ("customer_id", pa.int64()),
+        ("pickup_location", pa.string()),
+        ("delivery_location", pa.string()),
+        ("pickup_date", _naive),
+        ("delivery_date", _naive),
+        ("cargo_type", _category),
+        ("weight", pa.float64()),
+        ("dimensions", pa.string()),
+        ("vehicle_type", _category),
+        ("contact_person", pa.string()),
+        ("contact_phone", pa.string()),
+        ("contact_email", pa.string()),
+        ("route_geometry", pa.string()),  # GeoJSON text
+        ("bill_of_lading", pa.string()),
+        ("container_number", pa.string()),
+        ("seal_number", pa.string()),
+        ("carrier", _category),
+        ("reference_number", pa.string()),
+        ("po_number", pa.string()),
+        ("customer_reference", pa.string()),
+        ("special_instructions", pa.string()),
+        ("internal_notes", pa.string()),
+        ("quote_amount", pa.float64()),
+        ("status", _category),
+        ("created_at", _utc),
+        ("updated_at", _utc),
+        ("version", pa.int64()),
+    ])),
+    "stops": (Stop, pa.schema([
+        ("id", pa.int64()),
+        ("order_id", pa.int64()),
+        ("sequence", pa.int32()),
+        ("location", pa.string()),
+        ("stop_type", _category),
+        ("scheduled_time", _naive),
+        ("contact_person", pa.string()),
+        ("contact_phone", pa.string()),
+        ("latitude", pa.float64()),
+        ("longitude", pa.float64()),
+        ("status", _category),
+        ("actual_arrival_time", _naive),
+        ("actual_departure_time", _naive),
+        ("created_at", _utc),
+        ("updated_at", _utc),
+        ("version", pa.int64()),
+    ])),
+}
+EXPORT_TABLES = tuple(EXPORT_SCHEMAS)
+
+
+def export_until(now: Optional[datetime] = None) -> datetime:
+    """Upper bound for a run: changes newer than this are left for the next one"""
+    now = now or datetime.now(timezone.utc)
+    return now - timedelta(seconds=EXPORT_SAFETY_LAG_SECONDS)
+
+
+def _json_text(value):
+    return None if value is None else json.dumps(value, separators=(",", ":"))
+
+
+def iter_record_batches(table: str, since: Optional[datetime], until: datetime,
+                        batch_size: int = EXPORT_BATCH_SIZE, bind=None) -> Iterator[pa.RecordBatch]:
+    """
+    Rows of `table` with since <= updated_at < until, as Arrow record batches.
+    Without a `bind`, from every shard in turn (sharding.py).
+    """
+    model, schema = EXPORT_SCHEMAS[table]
+    columns = [model.__table__.c[name] for name in schema.names]
+    query = select(*columns).where(model.updated_at < until)
+    if since is not None:
+        query = query.where(model.updated_at >= since)
+    converters = [_json_text if name == "route_geometry" else None for name in schema.names]
+
+    binds = [bind] if bind is not None else [replicas.choose() or engine] + shard_engines[1:]
+    for bind in binds:
+        with bind.connect() as conn:
+            result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(query)
+            for rows in result.partitions(batch_size):
+                arrays = []
+                for i, field in enumerate(schema):
+                    values = [row[i] for row in rows]
+                    if converters[i] is not None:
+                        values = [converters[i](v) for v in values]
+                    arrays.append(pa.array(values, type=field.type))
+                yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def _writer(sink, schema):
+    return pq.ParquetWriter(
+        sink, schema,
+        compression=EXPORT_COMPRESSION,
+        use_dictionary=[f.name for f in schema if pa.types.is_dictionary(f.type)],
+    )
+
+
+class _ChunkSink:
+    """Write-only file object whose contents are drained after each row group"""
+
+    def __init__(self):
+        self._chunks = []
+        self.closed = False
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+def stream_parquet(table: str, since: Optional[datetime], until: datetime,
+                   batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[bytes]:
+    """A Parquet file as a sequence of byte chunks, one per row group"""
+    schema = EXPORT_SCHEMAS[table][1]
+    sink = _ChunkSink()
+    writer = _writer(sink, schema)
+    for batch in iter_record_batches(table, since, until, batch_size):
+        writer.write_batch(batch)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def export_table(table: str, path: str, since: Optional[datetime], until: datetime,
+                 batch_size: int = EXPORT_BATCH_SIZE) -> int:
+    """Write one Parquet file; returns the row count (no file is left for 0 rows)"""
+    schema = EXPORT_SCHEMAS[table][1]
+    rows = 0
+    writer = None
+    try:
+        for batch in iter_record_batches(table, since, until, batch_size):
+            if writer is None:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                writer = _writer(path + ".tmp", schema)
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is not None:
+        os.replace(path + ".tmp", path)
+    return rows
+
+
+def _load_watermark(output: str) -> dict:
+    try:
+        with open(os.path.join(output, "_watermark.json")) as f:
+            return {table: datetime.fromisoformat(value) for table, value in json.load(f).items()}
+    except FileNotFoundError:
+        return {}
+
+
+def _save_watermark(output: str, watermark: dict):
+    path = os.path.join(output, "_watermark.json")
+    with open(path + ".tmp", "w") as f:
+        json.dump({table: value.isoformat() for table, value in watermark.items()}, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def export_incremental(output: str, tables=EXPORT_TABLES, full: bool = False,
+                       batch_size: int = EXPORT_BATCH_SIZE, log=print) -> dict:
+    """Append everything that changed since the last run as <output>/<table>/part-*.parquet"""
+    watermark = _load_watermark(output)
+    until = export_until()
+    counts = {}
+    for table in tables:
+        since = None if full else watermark.get(table)
+        path = os.path.join(output, table, f"part-{until.strftime('%Y%m%dT%H%M%S')}.parquet")
+        counts[table] = export_table(table, path, since, until, batch_size)
+        watermark[table] = until
+        log(f"  {table}: {counts[table]} rows changed since {since.isoformat() if since else 'the beginning'}")
+    os.makedirs(output, exist_ok=True)
+    _save_watermark(output, watermark)
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export orders and stops to Parquet")
+    parser.add_argument("--output", default="./export", help="directory for part files and the watermark")
+    parser.add_argument("--table", choices=EXPORT_TABLES, action="append", help="default: all")
+    parser.add_argument("--full", action="store_true", help="ignore the watermark and export everything")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE)
+    args = parser.parse_args()
+    counts = export_incremental(args.output, args.table or EXPORT_TABLES, args.full, args.batch_size)
+    print(f"✅ Exported {sum(counts.values())} rows to {args.output}")
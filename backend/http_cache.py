@@ -0,0 +1,95 @@
+"""
+Conditional GET for the read endpoints.
+
+A handler derives its validators - an ETag, and a Last-Modified time where
+one is exact - from a cheap query (row versions, or the count, newest
+updated_at and version sum of a filtered list) and calls not_modified()
+before loading or serializing anything. A match is answered with 304 and no
+body; otherwise the same validators go on the 200 response.
+
+If-None-Match uses the weak comparison: compression.py turns strong ETags
+weak, and clients send back what they received. If-Modified-Since is only
+looked at without If-None-Match, and only where the handler passes an exact
+Last-Modified (lists don't: a deleted order leaves the newest updated_at as
+it was).
+
+Responses carry HTTP_CACHE_CONTROL (default "no-cache"): browsers and the
+CDN may keep them, but must revalidate each time, which the 304 makes cheap.
+"""
+import hashlib
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response
+
+HTTP_CACHE_CONTROL = os.getenv("HTTP_CACHE_CONTROL", "no-cache")
+
+
+def digest_etag(*parts) -> str:
+    """Weak ETag over arbitrary values (their repr)"""
+    return 'W/"' + hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest() + '"'
+
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison against an If-None-Match list ("*" matches anything)"""
+    if if_none_match.strip() == "*":
+        return True
+    return _opaque(etag) in {_opaque(tag) for tag in if_none_match.split(",")}
+
+
+def http_date(value: datetime) -> str:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)  # SQLite returns naive UTC
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def _not_modified_since(if_modified_since: str, last_modified: datetime) -> bool:
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False  # an unparseable date is ignored
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    if last_modified.tzinfo is None:
+        last_modified = last_modified.replace(tzinfo=timezone.utc)
+    return last_modified.replace(microsecond=0) <= since
+
+
+def validator_headers(etag: str, last_modified: Optional[datetime] = None) -> dict:
+    headers = {"ETag": etag, "Cache-Control": HTTP_CACHE_CONTROL}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+def is_conditional(request: Request) -> bool:
+    return "if-none-match" in request.headers or "if-modified-since" in request.headers
+
+
+def not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None,
+                 exact_last_modified: bool = True, vary: Optional[str] = None) -> Optional[Response]:
+    """A 304 response when the request's validators still match, else None"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        fresh = etag_matches(if_none_match, etag)
+    elif last_modified is not None and exact_last_modified and "if-modified-since" in request.headers:
+        fresh = _not_modified_since(request.headers["if-modified-since"], last_modified)
+    else:
+        fresh = False
+    if not fresh:
+        return None
+    response = Response(status_code=304, headers=validator_headers(etag, last_modified))
+    if vary:
+        response.headers["Vary"] = vary
+    return response
+
+
+def set_validators(response: Response, etag: str, last_modified: Optional[datetime] = None):
+    response.headers.update(validator_headers(etag, last_modified))
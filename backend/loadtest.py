@@ -0,0 +1,466 @@
+"""
+Load test: replays a dispatch-like traffic mix at stepped request rates.
+
+    python loadtest.py --rps 10 20 40 80 160 --seconds 30
+    python loadtest.py --target postgres --postgres-url postgresql://fleet@localhost/fleet_load
+    python loadtest.py --url http://127.0.0.1:8000 --rps 50 --mix list=80,detail=20
+
+Each step offers `rps` scenarios per second for `seconds`, arriving as a
+Poisson process (open loop: arrivals don't wait for earlier responses, as real
+clients don't). A scenario is one of:
+
+    list        GET /api/orders with a random page, status, sort_by, sort_order and view
+    search      GET /api/customers/search, or GET /api/orders?search=
+    detail      GET /api/orders/{id}
+    create      POST /api/orders with 2-50 stops
+    stop_burst  5-20 concurrent PATCH /api/stops/{id}/status, as when a wave of drivers checks in
+    update      PATCH /api/orders/{id}
+
+drawn with the --mix weights (default about 70% list and search). Latency is
+measured from the scenario's scheduled arrival, not from when the request went
+out, so a server that falls behind shows it as latency instead of quietly
+lowering the offered rate.
+
+A step is saturated when it completes less than 95% of the offered scenarios
+per second, its p99 exceeds --slo-ms or more than --max-error-rate of its
+requests fail. The saturation point is the last step before the first
+saturated one; later steps are skipped unless --all-steps is given.
+
+--target sqlite copies the DATABASE_URL database (and its archive) to a
+scratch directory, as bench_sqlite.py does, and serves the copy;
+--target postgres serves --postgres-url, which is migrated first and written
+to - point it at a scratch database. Both run serve.py on a free port with
+admission control off (one client address would trip the per-client limits);
+--url drives a server that is already running instead. An empty database gets
+--seed orders through the API before the first step.
+
+The generator shares the machine with the server: "lag" is how late, at p99,
+arrivals were sent. When it grows, the numbers describe the generator, not
+the API.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+from bench_serve import free_port, wait_until_up
+from bench_sqlite import copy_database
+from statuses import next_statuses
+
+SCENARIOS = ("list", "search", "detail", "create", "stop_burst", "update")
+DEFAULT_MIX = "list=55,search=15,detail=12,create=5,stop_burst=5,update=8"
+# Upper bounds of the latency histogram buckets, milliseconds
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+ORDER_STATUSES = ("pending", "assigned", "in_transit", "delivered")
+# What updates and stop bursts set, where the state machine allows it (statuses.py)
+UPDATE_STATUSES = ("assigned", "in_transit")
+STOP_STATUSES = ("arrived", "completed")
+CARGO_TYPES = ("Electronics", "Furniture", "Produce", "Machinery", "Textiles", "Chemicals")
+CITIES = (
+    ("Chicago, IL", 41.8781, -87.6298), ("Dallas, TX", 32.7767, -96.7970),
+    ("Atlanta, GA", 33.7490, -84.3880), ("Denver, CO", 39.7392, -104.9903),
+    ("Memphis, TN", 35.1495, -90.0490), ("Columbus, OH", 39.9612, -82.9988),
+    ("Phoenix, AZ", 33.4484, -112.0740), ("Kansas City, MO", 39.0997, -94.5786),
+)
+
+
+def parse_mix(spec: str) -> dict:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario {name!r} in --mix (one of {', '.join(SCENARIOS)})")
+        mix[name] = float(weight)
+    if sum(mix.values()) <= 0:
+        raise SystemExit("--mix weights must add up to more than 0")
+    return mix
+
+
+class Pools:
+    """Ids, statuses and search terms the scenarios draw from; creates add to them"""
+
+    def __init__(self):
+        self.customer_ids = []
+        self.customer_terms = []
+        self.order_ids = []
+        self.stop_ids = []
+        self.statuses = {"order": {}, "stop": {}}
+
+    def load(self, base: str):
+        with httpx.Client(base_url=base, timeout=60.0) as http:
+            customers = http.get("/api/customers", params={"limit": 100}).json()
+            self.customer_ids = [c["id"] for c in customers]
+            self.customer_terms = sorted({c["name"][:3] for c in customers if c.get("name")})
+            for page in range(1, 6):
+                orders = http.get("/api/orders", params={"limit": 100, "page": page}).json()["orders"]
+                self.add_orders(orders)
+                if len(orders) < 100:
+                    break
+
+    def add_orders(self, orders):
+        for order in orders:
+            self.order_ids.append(order["id"])
+            self.statuses["order"][order["id"]] = order["status"]
+            for stop in order["stops"]:
+                self.stop_ids.append(stop["id"])
+                self.statuses["stop"][stop["id"]] = stop["status"]
+
+    def next_status(self, kind: str, entity_id: int, preferred) -> str:
+        """
+        One of `preferred` the row may change to, as far as the generator
+        knows, else the status it already has - so writes don't draw 409s
+        """
+        current = self.statuses[kind].get(entity_id) or "pending"
+        allowed = [status for status in preferred if status in next_statuses(kind, current)]
+        self.statuses[kind][entity_id] = status = random.choice(allowed) if allowed else current
+        return status
+
+
+def order_payload(customer_id: int, stop_count: int) -> dict:
+    start = datetime.now(timezone.utc) + timedelta(hours=random.randint(1, 72))
+    stops = []
+    for sequence in range(1, stop_count + 1):
+        city, lat, lon = random.choice(CITIES)
+        stops.append({
+            "sequence": sequence,
+            "location": city,
+            "stop_type": "pickup" if sequence == 1 else "delivery",
+            "scheduled_time": (start + timedelta(hours=2 * sequence)).isoformat(),
+            "latitude": lat + random.uniform(-0.2, 0.2),
+            "longitude": lon + random.uniform(-0.2, 0.2),
+        })
+    return {
+        "customer_id": customer_id,
+        "pickup_location": stops[0]["location"],
+        "delivery_location": stops[-1]["location"],
+        "pickup_date": stops[0]["scheduled_time"],
+        "delivery_date": stops[-1]["scheduled_time"],
+        "cargo_type": random.choice(CARGO_TYPES),
+        "weight": round(random.uniform(200, 20000), 1),
+        "reference_number": f"LT-{random.getrandbits(40):010x}",
+        "stops": stops,
+    }
+
+
+def seed(base: str, orders: int):
+    """Customers and orders through the API, for a database that has none"""
+    with httpx.Client(base_url=base, timeout=60.0) as http:
+        customer_ids = []
+        for n in range(max(1, orders // 20)):
+            response = http.post("/api/customers", json={
+                "name": f"{random.choice(CARGO_TYPES)} Freight {n}",
+                "email": f"loadtest-{n}-{random.getrandbits(24):06x}@example.com",
+            })
+            response.raise_for_status()
+            customer_ids.append(response.json()["id"])
+        for _ in range(orders):
+            http.post("/api/orders", json=order_payload(random.choice(customer_ids), random.randint(2, 8))) \
+                .raise_for_status()
+
+
+class Recorder:
+    """Per-scenario latencies (seconds) and outcomes of one step"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.outcomes = defaultdict(Counter)  # scenario -> status code or exception name -> count
+        self.lag = []
+
+    def record(self, scenario: str, scheduled: float, outcome):
+        self.latencies[scenario].append(time.perf_counter() - scheduled)
+        self.outcomes[scenario][outcome] += 1
+
+    def errors(self, scenario: str) -> int:
+        return sum(n for outcome, n in self.outcomes[scenario].items()
+                   if not isinstance(outcome, int) or outcome >= 400)
+
+    def requests(self, scenario: str) -> int:
+        return sum(self.outcomes[scenario].values())
+
+
+async def call(http: httpx.AsyncClient, recorder: Recorder, scenario: str, scheduled: float,
+               method: str, url: str, **kwargs):
+    try:
+        response = await http.request(method, url, **kwargs)
+    except httpx.HTTPError as exc:
+        recorder.record(scenario, scheduled, type(exc).__name__)
+        return None
+    recorder.record(scenario, scheduled, response.status_code)
+    return response
+
+
+async def run_scenario(http: httpx.AsyncClient, recorder: Recorder, pools: Pools, scenario: str, scheduled: float):
+    if scenario == "list":
+        params = {
+            # Mostly the first pages, as people rarely page far
+            "page": min(int(random.expovariate(0.5)) + 1, 20),
+            "limit": random.choice((10, 20, 50)),
+            "sort_by": random.choice(("created_at", "updated_at", "status", "id")),
+            "sort_order": random.choice(("asc", "desc")),
+            "view": random.choice(("full", "summary")),
+        }
+        if random.random() < 0.5:
+            params["status"] = random.choice(ORDER_STATUSES)
+        await call(http, recorder, scenario, scheduled, "GET", "/api/orders", params=params)
+    elif scenario == "search":
+        if pools.customer_terms and random.random() < 0.5:
+            await call(http, recorder, scenario, scheduled, "GET", "/api/customers/search",
+                       params={"q": random.choice(pools.customer_terms)})
+        else:
+            await call(http, recorder, scenario, scheduled, "GET", "/api/orders",
+                       params={"search": random.choice(CITIES)[0].split(",")[0], "limit": 20, "view": "summary"})
+    elif scenario == "detail":
+        await call(http, recorder, scenario, scheduled, "GET", f"/api/orders/{random.choice(pools.order_ids)}")
+    elif scenario == "create":
+        payload = order_payload(random.choice(pools.customer_ids), random.randint(2, 50))
+        response = await call(http, recorder, scenario, scheduled, "POST", "/api/orders", json=payload)
+        if response is not None and response.status_code == 200:
+            pools.add_orders([response.json()])
+    elif scenario == "stop_burst":
+        stop_ids = random.sample(pools.stop_ids, min(random.randint(5, 20), len(pools.stop_ids)))
+        await asyncio.gather(*(
+            call(http, recorder, scenario, scheduled, "PATCH", f"/api/stops/{stop_id}/status",
+                 params={"status": pools.next_status("stop", stop_id, STOP_STATUSES)})
+            for stop_id in stop_ids
+        ))
+    elif scenario == "update":
+        order_id = random.choice(pools.order_ids)
+        changes = {"special_instructions": f"Load test note {random.getrandbits(32):08x}"}
+        if random.random() < 0.5:
+            changes["status"] = pools.next_status("order", order_id, UPDATE_STATUSES)
+        await call(http, recorder, scenario, scheduled, "PATCH", f"/api/orders/{order_id}", json=changes)
+
+
+async def run_step(base: str, pools: Pools, mix: dict, rps: float, seconds: float, max_in_flight: int):
+    recorder = Recorder()
+    names, weights = list(mix), list(mix.values())
+    limits = httpx.Limits(max_connections=max_in_flight, max_keepalive_connections=max_in_flight)
+    async with httpx.AsyncClient(base_url=base, timeout=30.0, limits=limits) as http:
+        tasks = set()
+        start = time.perf_counter()
+        scheduled = start
+        offered = 0
+        while True:
+            scheduled += random.expovariate(rps)
+            if scheduled - start >= seconds:
+                break
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            recorder.lag.append(max(0.0, -delay))
+            offered += 1
+            scenario = random.choices(names, weights)[0]
+            task = asyncio.create_task(run_scenario(http, recorder, pools, scenario, scheduled))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.wait(tasks, timeout=60.0)
+        elapsed = time.perf_counter() - start
+        unfinished = len(tasks)
+        for task in list(tasks):
+            task.cancel()
+    return recorder, {"offered": offered, "completed": offered - unfinished, "elapsed": elapsed}
+
+
+def percentile(values, q: float) -> float:
+    """Nearest-rank percentile, in milliseconds"""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))] * 1000
+
+
+def histogram(values) -> list:
+    counts = [0] * (len(BUCKETS_MS) + 1)
+    for value in values:
+        ms = value * 1000
+        counts[next((i for i, bound in enumerate(BUCKETS_MS) if ms <= bound), len(BUCKETS_MS))] += 1
+    return counts
+
+
+def summarize(rps: float, recorder: Recorder, totals: dict, slo_ms: float, max_error_rate: float) -> dict:
+    every = [value for values in recorder.latencies.values() for value in values]
+    requests = len(every)
+    errors = sum(recorder.errors(name) for name in recorder.latencies)
+    achieved = totals["completed"] / totals["elapsed"]
+    p99 = percentile(every, 99)
+    error_rate = errors / requests if requests else 0.0
+    reasons = []
+    if achieved < 0.95 * rps:
+        reasons.append("throughput")
+    if p99 > slo_ms:
+        reasons.append("p99")
+    if error_rate > max_error_rate:
+        reasons.append("errors")
+    return {
+        "target_rps": rps,
+        "achieved_rps": achieved,
+        "requests": requests,
+        "p50_ms": percentile(every, 50),
+        "p90_ms": percentile(every, 90),
+        "p99_ms": p99,
+        "max_ms": max(every) * 1000 if every else float("nan"),
+        "error_rate": error_rate,
+        "lag_p99_ms": percentile(recorder.lag, 99),
+        "saturated": reasons,
+        "scenarios": {
+            name: {
+                "requests": recorder.requests(name),
+                "errors": recorder.errors(name),
+                "p50_ms": percentile(values, 50),
+                "p99_ms": percentile(values, 99),
+                "histogram": histogram(values),
+                "outcomes": {str(outcome): n for outcome, n in recorder.outcomes[name].most_common()},
+            }
+            for name, values in sorted(recorder.latencies.items())
+        },
+    }
+
+
+def print_step(result: dict, show_histograms: bool):
+    verdict = "saturated (" + ", ".join(result["saturated"]) + ")" if result["saturated"] else "ok"
+    print(f"{result['target_rps']:>8.0f} {result['achieved_rps']:>9.1f} {result['requests']:>9} "
+          f"{result['p50_ms']:>8.1f} {result['p90_ms']:>8.1f} {result['p99_ms']:>8.1f} "
+          f"{result['error_rate']:>7.2%} {result['lag_p99_ms']:>8.1f}  {verdict}")
+    for name, s in result["scenarios"].items():
+        failures = {k: v for k, v in s["outcomes"].items() if not k.isdigit() or int(k) >= 400}
+        print(f"{'':>8} {name:<11} {s['requests']:>7} req  p50 {s['p50_ms']:>7.1f}  p99 {s['p99_ms']:>7.1f}  "
+              f"errors {s['errors']}" + (f" {failures}" if failures else ""))
+        if show_histograms:
+            peak = max(s["histogram"]) or 1
+            labels = [f"<={b}" for b in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}"]
+            for label, count in zip(labels, s["histogram"]):
+                if count:
+                    print(f"{'':>20} {label:>7} ms {count:>7} {'#' * max(1, round(40 * count / peak))}")
+
+
+def header():
+    print(f"{'rps':>8} {'achieved':>9} {'requests':>9} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} "
+          f"{'errors':>7} {'lag ms':>8}")
+
+
+def run_against(base: str, args, mix: dict) -> list:
+    pools = Pools()
+    pools.load(base)
+    if not pools.order_ids:
+        print(f"Seeding {args.seed} orders")
+        seed(base, args.seed)
+        pools.load(base)
+    if not pools.order_ids or not pools.customer_ids:
+        raise SystemExit("No orders to work with - seed the database first")
+
+    header()
+    results = []
+    for rps in args.rps:
+        recorder, totals = asyncio.run(run_step(base, pools, mix, rps, args.seconds, args.max_in_flight))
+        result = summarize(rps, recorder, totals, args.slo_ms, args.max_error_rate)
+        results.append(result)
+        print_step(result, args.histograms)
+        if result["saturated"] and not args.all_steps:
+            break
+    passed = [r["target_rps"] for r in results if not r["saturated"]]
+    first_saturated = next((r["target_rps"] for r in results if r["saturated"]), None)
+    if first_saturated is None:
+        print(f"Not saturated up to {results[-1]['target_rps']:.0f} scenarios/s")
+    elif passed and passed[-1] < first_saturated:
+        print(f"Saturation point: {passed[-1]:.0f} scenarios/s (saturated at {first_saturated:.0f})")
+    else:
+        print(f"Saturated at the first step ({first_saturated:.0f} scenarios/s)")
+    return results
+
+
+def serve(env: dict, workers: int):
+    """serve.py on a free port with `env`; (base url, process)"""
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    env = {**os.environ, **env, "ADMISSION_ENABLED": "false"}
+    subprocess.run([sys.executable, "migrate.py", "upgrade"], cwd=cwd, env=env, check=True, stdout=subprocess.DEVNULL)
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "serve.py", "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers)],
+        cwd=cwd, env=env,
+    )
+    base = f"http://127.0.0.1:{port}"
+    try:
+        wait_until_up(base + "/")
+    except BaseException:
+        server.terminate()
+        raise
+    # Every worker has to finish its lifespan warm-up; give them a moment
+    time.sleep(1.0)
+    return base, server
+
+
+def run_target(target: str, args, mix: dict) -> list:
+    with tempfile.TemporaryDirectory() as scratch:
+        if target == "sqlite":
+            url = os.getenv("DATABASE_URL", "sqlite:///./fleet_management.db")
+            if not url.startswith("sqlite"):
+                raise SystemExit("DATABASE_URL must point at a SQLite database for --target sqlite")
+            source = url.split("///", 1)[-1]
+            path = os.path.join(scratch, "load.db")
+            if os.path.exists(source):
+                copy_database(source, path)
+                archive = os.path.splitext(source)[0] + "_archive.db"
+                if os.path.exists(archive):
+                    copy_database(archive, os.path.join(scratch, "load_archive.db"))
+            env = {
+                "DATABASE_URL": f"sqlite:///{path}",
+                "ARCHIVE_DATABASE_PATH": os.path.join(scratch, "load_archive.db"),
+                "SQLITE_MODE": args.sqlite_mode,
+            }
+        else:
+            if not args.postgres_url:
+                raise SystemExit("--target postgres needs --postgres-url (or LOADTEST_POSTGRES_URL)")
+            env = {"DATABASE_URL": args.postgres_url}
+
+        base, server = serve(env, 1 if args.sqlite_mode == "memory" and target == "sqlite" else args.workers)
+        try:
+            return run_against(base, args, mix)
+        finally:
+            server.terminate()
+            server.wait(timeout=60)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a dispatch traffic mix and find the saturation point")
+    parser.add_argument("--target", nargs="+", choices=["sqlite", "postgres"], default=["sqlite"])
+    parser.add_argument("--url", help="drive a running server instead of starting one")
+    parser.add_argument("--postgres-url", default=os.getenv("LOADTEST_POSTGRES_URL"))
+    parser.add_argument("--sqlite-mode", choices=["plain", "tuned", "memory"], default=os.getenv("SQLITE_MODE", "tuned"))
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--rps", type=float, nargs="+", default=[10, 20, 40, 80, 160, 320],
+                        help="scenarios per second, one step each")
+    parser.add_argument("--seconds", type=float, default=20.0, help="per step")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="scenario=weight,...")
+    parser.add_argument("--slo-ms", type=float, default=500.0, help="p99 above this saturates a step")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--max-in-flight", type=int, default=256, help="client connection limit")
+    parser.add_argument("--seed", type=int, default=200, help="orders to create in an empty database")
+    parser.add_argument("--all-steps", action="store_true", help="keep going after the first saturated step")
+    parser.add_argument("--histograms", action="store_true", help="print a latency histogram per scenario")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    results = {}
+    if args.url:
+        results["url"] = run_against(args.url.rstrip("/"), args, mix)
+    else:
+        for target in dict.fromkeys(args.target):
+            print(f"\n{target}" + (f" ({args.sqlite_mode})" if target == "sqlite" else ""))
+            results[target] = run_target(target, args, mix)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"✅ Results written to {args.json}")
@@ -1,26 +1,152 @@
-from fastapi import FastAPI, HTTPException, Query, Depends
+from fastapi import FastAPI, HTTPException, Query, Depends, Header, Response, Request
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session, joinedload
+from fastapi.responses import StreamingResponse, JSONResponse
+from sqlalchemy import update, select, bindparam, literal, and_, or_, tuple_
+from sqlalchemy.orm import Session, joinedload, selectinload, configure_mappers
+from sqlalchemy.sql import func
+from sqlalchemy.orm.exc import StaleDataError
 from typing import Optional
 from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+import asyncio
+import base64
+import json
 import math
+import numpy as np
 
-from database import engine, Base, get_db
-from models import Customer, Order, Stop
+from database import (
+    engine, get_db, get_read_db, SessionLocal, compiled_cache_stats,
+    replicas, mark_recent_write, REPLICA_CHECK_INTERVAL_SECONDS,
+    IS_POSTGRES, SQLITE_MODE, SQLITE_SNAPSHOT_INTERVAL_SECONDS, memory_database, writer_queue,
+    shard_engines, shard_session_factories
+)
+from migrations import upgrade, verify_schema
+from models import Customer, CustomerOrderStats, Order, Stop, ArchivedOrder, OrderSummary
+from write_behind import StopStatusBuffer, WRITE_BEHIND_ENABLED
+from archive import run_archiver, ARCHIVE_ENABLED
+from outbox import OutboxWorker, OUTBOX_WORKER_ENABLED, backlog
+from route_optimizer import optimize_stops, DEFAULT_WINDOW_MINUTES
+from route_metrics import route_metrics, apply_route_metrics, patched_route_metrics
+from bulk_load import insert_stops, reserve_stop_ids
+from statuses import InvalidTransition, check_transition, sources, ORDER_STATUS_CODES, STOP_STATUS_PATTERN
+from status_history import dwell, merge_dwell, throughput, merge_throughput, order_history
+from eta import stop_array_caches, compute_etas, stops_changed
+from compression import CompressionMiddleware
+from admission import AdmissionMiddleware, admission
+from export import stream_parquet, export_until, PARQUET_MEDIA_TYPE
+from response_formats import wants_msgpack, msgpack_response, json_response
+from http_cache import digest_etag, is_conditional, not_modified, set_validators
+from order_queries import (
+    order_filter_params, order_list_statement, order_count_statement, order_summary_list_statement,
+    order_keyset_statement, keyset_value, order_detail_statement, orders_by_id_statement,
+    combined_order_statements, order_list_validator_statement, order_changes_statement, order_validator_statement,
+    template_cache_info, SORT_COLUMNS, SORT_ORDERS, BATCH_GET_CHUNK_SIZE
+)
+from sharding import (
+    ShardRouter, get_shards, get_read_shards, scatter, merge_pages, merge_found, shard_map, shard_for_customer, shard_for_stop,
+    replicate_customer, order_stats, id_allocator, CustomerMovingError,
+    SHARDING_ENABLED, SHARD_COUNT, SHARD_SCATTER_MAX_ROWS
+)
 from schemas import (
-    CustomerCreate, CustomerResponse,
-    OrderCreate, OrderUpdate, OrderResponse, OrderListResponse
+    CustomerCreate, CustomerResponse, CustomerSummaryResponse, CustomerSearchResponse,
+    OrderCreate, OrderUpdate, OrderPatch, OrderPatchResponse,
+    OrderResponse, OrderListResponse, OrderSummaryListResponse, RouteOptimizationResponse,
+    AtRiskStopResponse, OrderBatchGet, OrderBatchResponse, OrderSummaryBatchResponse, BATCH_GET_MAX_IDS
 )
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup - Create tables
-    Base.metadata.create_all(bind=engine)
+    # Startup - Only check the schema version; migrations run via migrate.py
+    if memory_database is not None:
+        # ...except for an in-memory SQLite database, which only exists in this process
+        await asyncio.to_thread(upgrade, engine, log=lambda message: None)
+    for shard_engine in shard_engines:
+        verify_schema(shard_engine)
+    # Pay first-request costs before the worker accepts traffic
+    await asyncio.to_thread(warm_up)
+    if WRITE_BEHIND_ENABLED:
+        # One buffer per shard, so each flush is a single transaction
+        app.state.stop_status_buffers = [StopStatusBuffer(factory) for factory in shard_session_factories]
+        for buffer in app.state.stop_status_buffers:
+            await buffer.start()
+    archiver_stop = asyncio.Event()
+    archivers = [
+        asyncio.create_task(run_archiver(archiver_stop, bind=shard_engine)) for shard_engine in shard_engines
+    ] if ARCHIVE_ENABLED else []
+    # Side effects of writes are delivered from the outbox, off the request path
+    outbox_stop = asyncio.Event()
+    outbox_workers = []
+    if OUTBOX_WORKER_ENABLED:
+        app.state.outbox_workers = [OutboxWorker(shard_engine) for shard_engine in shard_engines]
+        outbox_workers = [asyncio.create_task(worker.run(outbox_stop)) for worker in app.state.outbox_workers]
+    replica_checks = asyncio.create_task(check_replicas()) if replicas.replicas else None
+    snapshots_stop = asyncio.Event()
+    snapshots = None
+    if memory_database is not None:
+        snapshots = asyncio.create_task(
+            memory_database.run_snapshots(snapshots_stop, SQLITE_SNAPSHOT_INTERVAL_SECONDS)
+        )
     yield
-    # Shutdown
-    pass
+    if replica_checks is not None:
+        replica_checks.cancel()
+    # Shutdown - drain queued stop status writes before exiting
+    for buffer in app.state.stop_status_buffers:
+        await buffer.drain()
+    archiver_stop.set()
+    for archiver in archivers:
+        await archiver
+    outbox_stop.set()
+    for outbox_worker in outbox_workers:
+        await outbox_worker
+    # Last, so the final snapshot has everything the tasks above wrote
+    if snapshots is not None:
+        snapshots_stop.set()
+        await snapshots
+
+
+def warm_up():
+    """
+    Configure mappers, fill the connection pool, compile the hot SQL shapes and
+    build the OpenAPI schema, so the first real requests don't pay for them.
+    """
+    configure_mappers()
+    
+    connections = [engine.connect() for _ in range(engine.pool.size())] if hasattr(engine.pool, "size") else []
+    for connection in connections:
+        connection.close()
+    
+    unfiltered, _ = order_filter_params(None, None, None)
+    db = SessionLocal()
+    try:
+        for sort_by in SORT_COLUMNS:
+            for sort_order in SORT_ORDERS:
+                db.execute(
+                    order_list_statement(Order, *unfiltered, sort_by, sort_order),
+                    {"offset": 0, "limit": 1}
+                ).unique().scalars().all()
+        db.execute(order_count_statement(Order, *unfiltered)).scalar()
+        db.execute(order_detail_statement(Order), {"order_id": 0}).unique().scalars().first()
+        db.query(Customer).order_by(Customer.id).limit(1).all()
+    finally:
+        db.close()
+    
+    app.openapi()
+
+
+async def check_replicas():
+    """Refresh replica health and lag in the background"""
+    while True:
+        await asyncio.to_thread(replicas.check_all)
+        await asyncio.sleep(REPLICA_CHECK_INTERVAL_SECONDS)
+
 
 app = FastAPI(title="Fleet Management API", lifespan=lifespan)
+app.state.stop_status_buffers = []
+app.state.outbox_workers = []
+
+# Rate limits, concurrency caps and load shedding (inside CORS, so 429/503
+# responses still carry CORS headers for the dispatch UI)
+app.add_middleware(AdmissionMiddleware)
 
 # CORS middleware
 app.add_middleware(
@@ -29,7 +155,44 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Last-Modified", "X-Export-Until", "Retry-After"],
 )
+# Negotiated zstd/br/gzip for responses over COMPRESSION_MIN_SIZE
+app.add_middleware(CompressionMiddleware)
+
+
+@app.exception_handler(CustomerMovingError)
+async def customer_moving(request: Request, exc: CustomerMovingError):
+    """Writes for a customer being moved between shards are refused for a few seconds"""
+    return JSONResponse(
+        status_code=503, content={"detail": str(exc)}, headers={"Retry-After": str(exc.retry_after)}
+    )
+
+
+@app.middleware("http")
+async def read_your_writes(request: Request, call_next):
+    """After a successful write, keep this client's reads on the primary"""
+    response = await call_next(request)
+    if request.method in ("POST", "PUT", "PATCH", "DELETE") and response.status_code < 400:
+        mark_recent_write(request, response)
+    return response
+
+
+def parse_if_match(if_match: Optional[str]) -> Optional[int]:
+    """
+    Extract the row version from an If-Match header (3, "3" or W/"3"; the
+    "3.7" form that GET /api/orders/{id} returns carries the stops' versions
+    after the dot, which writes don't check)
+    """
+    if if_match is None or if_match.strip() == "*":
+        return None
+    tag = if_match.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    try:
+        return int(tag.strip('"').split(".", 1)[0])
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Malformed If-Match header")
 
 
 # ============= Customer Endpoints =============
@@ -39,8 +202,13 @@ async def create_customer(customer: CustomerCreate, db: Session = Depends(get_db
     """Create a new customer"""
     db_customer = Customer(**customer.dict())
     db.add(db_customer)
+    if SHARDING_ENABLED:
+        db.flush()
+        shard_map.place(db.connection(), db_customer.id)
     db.commit()
     db.refresh(db_customer)
+    # Customers are on every shard (the order read model joins them)
+    replicate_customer(db_customer.id)
     return db_customer
 
 
@@ -48,56 +216,178 @@ async def create_customer(customer: CustomerCreate, db: Session = Depends(get_db
 async def get_customers(
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    after_id: Optional[int] = None,
+    db: Session = Depends(get_read_db)
 ):
-    """Get all customers"""
-    customers = db.query(Customer).offset(skip).limit(limit).all()
+    """Get all customers (pass the last id seen as `after_id` for keyset paging)"""
+    query = db.query(Customer).order_by(Customer.id)
+    if after_id is not None:
+        query = query.filter(Customer.id > after_id)
+    else:
+        query = query.offset(skip)
+    customers = query.limit(limit).all()
     return customers
 
 
-@app.get("/api/customers/{customer_id}", response_model=CustomerResponse)
-async def get_customer(customer_id: int, db: Session = Depends(get_db)):
-    """Get a specific customer"""
-    customer = db.query(Customer).filter(Customer.id == customer_id).first()
+def encode_cursor(*values) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def text_match(expr, term: str, match: str, is_postgres: bool):
+    """Prefix or substring match on an already lower-cased expression, index friendly"""
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    if match == "contains":
+        # pg_trgm GIN index on PostgreSQL; a scan on SQLite
+        return expr.like(f"%{escaped}%", escape="\\")
+    if is_postgres:
+        # text_pattern_ops index serves LIKE 'abc%'
+        return expr.like(f"{escaped}%", escape="\\")
+    # SQLite: a range on the expression index is exact under BINARY collation
+    upper = term[:-1] + chr(ord(term[-1]) + 1)
+    return and_(expr >= term, expr < upper)
+
+
+@app.get("/api/customers/search", response_model=CustomerSearchResponse)
+async def search_customers(
+    q: str = Query(..., min_length=1, max_length=100),
+    match: str = Query("prefix", pattern="^(prefix|contains)$"),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
+    """Type-ahead search on name or email, ordered by name, with keyset paging"""
+    term = q.strip().lower()
+    if not term:
+        raise HTTPException(status_code=400, detail="Empty search term")
+    is_postgres = db.get_bind().dialect.name == "postgresql"
+    name_key = func.lower(Customer.name)
+    
+    query = db.query(Customer, name_key).options(joinedload(Customer.order_stats)).filter(or_(
+        text_match(name_key, term, match, is_postgres),
+        text_match(func.lower(Customer.email), term, match, is_postgres)
+    ))
+    if cursor:
+        last_name, last_id = decode_cursor(cursor)
+        query = query.filter(tuple_(name_key, Customer.id) > tuple_(literal(last_name), literal(last_id)))
+    
+    rows = query.order_by(name_key, Customer.id).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        # Use the database's lower(), not Python's, so the next page lines up
+        next_cursor = encode_cursor(rows[-1][1], rows[-1][0].id)
+    
+    return {"customers": with_order_stats([customer for customer, _ in rows]), "next_cursor": next_cursor}
+
+
+@app.get("/api/customers/{customer_id}", response_model=CustomerSummaryResponse)
+async def get_customer(customer_id: int, request: Request, response: Response, db: Session = Depends(get_read_db)):
+    """Get a specific customer, with active order count and last order time (ETag, If-None-Match)"""
+    if is_conditional(request):
+        # Validate from the customer row and its order stats before loading anything
+        row = db.execute(
+            select(Customer.updated_at, CustomerOrderStats.active_order_count, CustomerOrderStats.last_order_at)
+            .outerjoin(CustomerOrderStats, CustomerOrderStats.customer_id == Customer.id)
+            .where(Customer.id == customer_id)
+        ).first()
+        if row is not None:
+            updated_at, active_order_count, last_order_at = row
+            if SHARDING_ENABLED:
+                active_order_count, last_order_at = order_stats([customer_id]).get(customer_id, (0, None))
+            cached = not_modified(request, customer_etag(updated_at, active_order_count or 0, last_order_at))
+            if cached is not None:
+                return cached
+    
+    customer = db.query(Customer).options(
+        joinedload(Customer.order_stats)
+    ).filter(Customer.id == customer_id).first()
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
+    customer = with_order_stats([customer])[0]
+    if SHARDING_ENABLED:
+        etag = customer_etag(customer["updated_at"], customer["active_order_count"], customer["last_order_at"])
+    else:
+        etag = customer_etag(customer.updated_at, customer.active_order_count, customer.last_order_at)
+    set_validators(response, etag)
     return customer
 
 
+def customer_etag(updated_at, active_order_count: int, last_order_at) -> str:
+    # Customers have no version column; the order stats change without touching updated_at
+    return digest_etag(updated_at, active_order_count, last_order_at)
+
+
+def with_order_stats(customers):
+    """With shards, a customer's order stats are kept on its own shard rather than shard 0"""
+    if not SHARDING_ENABLED:
+        return customers
+    stats = order_stats([customer.id for customer in customers])
+    return [
+        {
+            **CustomerResponse.model_validate(customer).model_dump(),
+            "active_order_count": stats.get(customer.id, (0, None))[0],
+            "last_order_at": stats.get(customer.id, (0, None))[1],
+        }
+        for customer in customers
+    ]
+
+
 # ============= Order Endpoints =============
 
+def order_for_response(db, order_id: int) -> Order:
+    """
+    The order with its customer and stops, read inside the write transaction
+    and kept loaded past its commit, so the handler returns as soon as the
+    commit does
+    """
+    db.flush()
+    order = db.execute(
+        order_detail_statement(Order).execution_options(populate_existing=True), {"order_id": order_id}
+    ).unique().scalar_one()
+    db.expire_on_commit = False
+    return order
+
+
 @app.post("/api/orders", response_model=OrderResponse)
-async def create_order(order_data: OrderCreate, db: Session = Depends(get_db)):
+async def create_order(order_data: OrderCreate, shards: ShardRouter = Depends(get_shards)):
     """Create a new order with stops using transaction"""
+    # The customer's shard; refuses the write (503) while the customer is being moved
+    db = shards.for_customer(order_data.customer_id, write=True)
+    stop_ids = reserve_stop_ids(order_data.stops)
     try:
         # Start transaction (automatic with SQLAlchemy session)
         
         # Verify customer exists
         customer = db.query(Customer).filter(Customer.id == order_data.customer_id).first()
+        if not customer and replicate_customer(order_data.customer_id):
+            # Created before its shard was added
+            customer = db.query(Customer).filter(Customer.id == order_data.customer_id).first()
         if not customer:
             raise HTTPException(status_code=404, detail="Customer not found")
         
         # Create order
         order_dict = order_data.dict(exclude={'stops'})
+        # Route length and extent are stored with the order (route_metrics.py)
+        order_dict.update(route_metrics(order_data.route_geometry, order_data.stops))
         db_order = Order(**order_dict)
         db.add(db_order)
         db.flush()  # Get order ID without committing
         
-        # Create stops
-        for stop_data in order_data.stops:
-            stop_dict = stop_data.dict()
-            db_stop = Stop(**stop_dict, order_id=db_order.id)
-            db.add(db_stop)
+        # Create stops - one executemany, no ORM objects (bulk_load.py)
+        insert_stops(db.connection(), db_order.id, order_data.stops, stop_ids)
+        stops_changed(db)
+        db_order = order_for_response(db, db_order.id)
         
-        # Commit transaction
+        # Commit transaction - the outbox row for any side effects commits with it
         db.commit()
-        db.refresh(db_order)
-        
-        # Return with relationships loaded
-        return db.query(Order).options(
-            joinedload(Order.customer),
-            joinedload(Order.stops)
-        ).filter(Order.id == db_order.id).first()
+        return db_order
         
     except Exception as e:
         db.rollback()
@@ -106,91 +396,326 @@ async def create_order(order_data: OrderCreate, db: Session = Depends(get_db)):
 
 @app.get("/api/orders", response_model=OrderListResponse)
 async def get_orders(
+    request: Request,
+    response: Response,
     page: int = Query(1, ge=1),
     limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page, instead of page"),
     search: Optional[str] = None,
     status: Optional[str] = None,
     customer_id: Optional[int] = None,
+    min_distance: Optional[float] = Query(None, ge=0, description="km, route length"),
+    max_distance: Optional[float] = Query(None, ge=0, description="km, route length"),
+    bbox: Optional[str] = Query(None, description="west,south,east,north in degrees"),
     sort_by: str = Query("created_at", pattern="^(created_at|updated_at|status|id)$"),
     sort_order: str = Query("desc", pattern="^(asc|desc)$"),
-    db: Session = Depends(get_db)
+    include_archived: bool = False,
+    view: str = Query("full", pattern="^(full|summary)$"),
+    shards: ShardRouter = Depends(get_read_shards)
 ):
-    """Get all orders with pagination, search, and filters"""
-    
-    # Base query with joins
-    query = db.query(Order).options(
-        joinedload(Order.customer),
-        joinedload(Order.stops)
+    """
+    Get all orders with pagination, search, and filters (JSON or MessagePack).
+    view=summary returns list columns, stop count and next stop from the
+    order_summaries read model instead of full orders with stops.
+    min_distance/max_distance and bbox (routes whose bounding box overlaps it)
+    use the route columns precomputed on write; orders without coordinates
+    never match them.
+    A full page comes with next_cursor; passing it back as `cursor` fetches
+    the next page by key rather than by offset, which stays cheap however
+    deep the page (and across shards, see sharding.py).
+    """
+    offset = (page - 1) * limit
+    # Statements are prebuilt per filter/sort shape; only the values are bound here
+    shape, params = order_filter_params(
+        search, status, customer_id, min_distance, max_distance, parse_bbox(bbox)
     )
+    after = None
+    if cursor is not None:
+        if include_archived:
+            raise HTTPException(status_code=400, detail="cursor is not supported with include_archived")
+        after = decode_order_cursor(cursor, sort_by, sort_order)
+        offset = 0
+    if view == "summary" and include_archived:
+        raise HTTPException(status_code=400, detail="include_archived is not supported with view=summary")
     
-    # Apply filters
-    if search:
-        search_term = f"%{search}%"
-        query = query.filter(
-            (Order.pickup_location.ilike(search_term)) |
-            (Order.delivery_location.ilike(search_term)) |
-            (Order.cargo_type.ilike(search_term)) |
-            (Order.reference_number.ilike(search_term))
-        )
-    
-    if status:
-        query = query.filter(Order.status == status)
-    
-    if customer_id:
-        query = query.filter(Order.customer_id == customer_id)
+    # One customer's orders are on its shard; otherwise every shard has some
+    shard_ids = [shard_for_customer(customer_id) or 0] if customer_id else list(range(SHARD_COUNT))
+    sessions = [shards.session(shard) for shard in shard_ids]
+    if len(sessions) > 1 and offset + limit > SHARD_SCATTER_MAX_ROWS:
+        raise HTTPException(status_code=400, detail="Page too deep across shards; page with cursor instead")
+    # Each shard returns its first offset + limit rows, which are merged below
+    shard_offset, shard_limit = (offset, limit) if len(sessions) == 1 else (0, offset + limit)
+    model = OrderSummary if view == "summary" else Order
     
-    # Count total
-    total = query.count()
+    def validate(db):
+        """
+        (count, newest updated_at) of the filtered set, per table, the newest
+        stop change and the shard's write counter - all database state, so
+        every worker computes the same ETag
+        """
+        sets = [tuple(db.execute(order_list_validator_statement(model, *shape), params).one())]
+        if include_archived:
+            sets.append(tuple(db.execute(order_list_validator_statement(ArchivedOrder, *shape), params).one()))
+        return sets, db.execute(select(func.max(Stop.updated_at))).scalar(), db.execute(order_changes_statement).scalar()
     
-    # Apply sorting
-    if sort_order == "desc":
-        query = query.order_by(getattr(Order, sort_by).desc())
-    else:
-        query = query.order_by(getattr(Order, sort_by).asc())
+    # Validate before loading the page: an unchanged list is a 304 without reading it
+    validators = await scatter(sessions, validate)
+    total = sum(count for sets, _, _ in validators for count, _ in sets)
+    changes = [newest for sets, _, _ in validators for _, newest in sets] + [stops for _, stops, _ in validators]
+    last_modified = max((as_utc(change) for change in changes if change is not None), default=None)
+    etag = digest_etag(str(request.query_params), wants_msgpack(request), validators)
+    cached = not_modified(request, etag, last_modified, exact_last_modified=False, vary="Accept")
+    if cached is not None:
+        return cached
     
-    # Apply pagination
-    offset = (page - 1) * limit
-    orders = query.offset(offset).limit(limit).all()
+    def fetch(db):
+        if include_archived:
+            return get_orders_with_archive(db, shard_offset, shard_limit, shape, params, sort_by, sort_order)
+        if after is not None:
+            statement = order_keyset_statement(model, *shape, sort_by, sort_order)
+            values = {
+                **params, "limit": shard_limit,
+                "after_key": keyset_value(after[0], db.get_bind().dialect.name), "after_id": after[1]
+            }
+        elif model is OrderSummary:
+            statement = order_summary_list_statement(*shape, sort_by, sort_order)
+            values = {**params, "offset": shard_offset, "limit": shard_limit}
+        else:
+            statement = order_list_statement(Order, *shape, sort_by, sort_order)
+            values = {**params, "offset": shard_offset, "limit": shard_limit}
+        result = db.execute(statement, values)
+        return (result.scalars() if model is OrderSummary else result.unique().scalars()).all()
     
-    total_pages = math.ceil(total / limit)
+    pages = await scatter(sessions, fetch)
+    orders = pages[0] if len(pages) == 1 else merge_pages(pages, sort_by, sort_order, offset, limit)
     
-    return {
+    content = {
         "orders": orders,
         "total": total,
         "page": page,
         "limit": limit,
-        "total_pages": total_pages
+        "total_pages": math.ceil(total / limit),
+        "next_cursor": encode_order_cursor(orders[-1], sort_by, sort_order)
+        if len(orders) == limit and not include_archived else None
     }
+    response_model = OrderSummaryListResponse if model is OrderSummary else OrderListResponse
+    if wants_msgpack(request):
+        encoded = msgpack_response(response_model, content)
+    elif model is OrderSummary:
+        encoded = json_response(response_model, content)
+    else:
+        encoded = None  # FastAPI serializes it through response_model
+    target = response if encoded is None else encoded
+    set_validators(target, etag, last_modified)
+    target.headers["Vary"] = "Accept"
+    return content if encoded is None else encoded
+
+
+def as_utc(value: datetime) -> datetime:
+    return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+
+
+def encode_order_cursor(order, sort_by: str, sort_order: str) -> str:
+    key = getattr(order, sort_by)
+    return encode_cursor(sort_by, sort_order, key.isoformat() if isinstance(key, datetime) else key, order.id)
+
+
+def decode_order_cursor(cursor: str, sort_by: str, sort_order: str) -> tuple:
+    """(sort key, id) of the last order of the previous page"""
+    try:
+        cursor_sort_by, cursor_sort_order, key, order_id = decode_cursor(cursor)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if (cursor_sort_by, cursor_sort_order) != (sort_by, sort_order):
+        raise HTTPException(status_code=400, detail="cursor belongs to a different sort_by/sort_order")
+    if sort_by in ("created_at", "updated_at"):
+        try:
+            key = datetime.fromisoformat(key)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    return key, order_id
+
+
+def parse_bbox(bbox: Optional[str]):
+    """(west, south, east, north) from "west,south,east,north" (GeoJSON bbox order)"""
+    if bbox is None:
+        return None
+    try:
+        west, south, east, north = (float(v) for v in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox must be west,south,east,north")
+    if not (-180 <= west <= east <= 180 and -90 <= south <= north <= 90):
+        raise HTTPException(status_code=400, detail="bbox must satisfy west <= east and south <= north")
+    return west, south, east, north
+
+
+def get_orders_with_archive(db, offset, limit, shape, params, sort_by, sort_order):
+    """
+    Page over live and archived orders as one list.
+    
+    The paging is done on narrow (id, sort key, source) rows; the page's orders
+    are then loaded from their own tables.
+    """
+    _, page = combined_order_statements(*shape, sort_by, sort_order)
+    page_rows = db.execute(page, {**params, "offset": offset, "limit": limit}).all()
+    
+    loaded = {}
+    for model, archived in ((Order, False), (ArchivedOrder, True)):
+        ids = [row.id for row in page_rows if bool(row.archived) == archived]
+        if ids:
+            for order in db.execute(orders_by_id_statement(model), {"ids": ids}).unique().scalars():
+                loaded[(order.id, archived)] = order
+    
+    return [loaded[(row.id, bool(row.archived))] for row in page_rows]
+
+
+@app.post("/api/orders/batch-get", response_model=OrderBatchResponse)
+async def batch_get_orders(batch: OrderBatchGet, request: Request, shards: ShardRouter = Depends(get_read_shards)):
+    """
+    Many orders by id in one request, in the order asked for (duplicates
+    dropped); ids that don't exist are listed in `missing`. view=summary
+    returns order_summaries rows as the list endpoint does.
+    """
+    return await order_batch(request, shards, batch.ids, batch.view, batch.include_archived)
+
+
+# Registered before /api/orders/{order_id}, which would otherwise claim the path
+@app.get("/api/orders/batch-get", response_model=OrderBatchResponse)
+async def batch_get_orders_by_query(
+    request: Request,
+    ids: str = Query(..., description="comma-separated order ids"),
+    view: str = Query("full", pattern="^(full|summary)$"),
+    include_archived: bool = False,
+    shards: ShardRouter = Depends(get_read_shards)
+):
+    """GET form of POST /api/orders/batch-get: ?ids=3,1,2"""
+    try:
+        order_ids = [int(order_id) for order_id in ids.split(",") if order_id.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be comma-separated integers")
+    if not 1 <= len(order_ids) <= BATCH_GET_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"Between 1 and {BATCH_GET_MAX_IDS} ids")
+    return await order_batch(request, shards, order_ids, view, include_archived)
+
+
+async def order_batch(request: Request, shards: ShardRouter, ids: list, view: str, include_archived: bool):
+    """
+    Load with one IN-list query per BATCH_GET_CHUNK_SIZE ids and table (per
+    shard when sharded), customers and stops joined in
+    """
+    if view == "summary" and include_archived:
+        raise HTTPException(status_code=400, detail="include_archived is not supported with view=summary")
+    ids = list(dict.fromkeys(ids))
+    if view == "summary":
+        models = (OrderSummary,)
+    else:
+        models = (Order, ArchivedOrder) if include_archived else (Order,)
+    
+    def fetch(db):
+        found = {}
+        for model in models:
+            wanted = [order_id for order_id in ids if order_id not in found]
+            for start in range(0, len(wanted), BATCH_GET_CHUNK_SIZE):
+                chunk = wanted[start:start + BATCH_GET_CHUNK_SIZE]
+                for order in db.execute(orders_by_id_statement(model), {"ids": chunk}).unique().scalars():
+                    found[order.id] = order
+        return found
+    
+    found = merge_found(await scatter(shards.all(), fetch))
+    content = {
+        "orders": [found[order_id] for order_id in ids if order_id in found],
+        "missing": [order_id for order_id in ids if order_id not in found]
+    }
+    response_model = OrderSummaryBatchResponse if view == "summary" else OrderBatchResponse
+    if wants_msgpack(request):
+        return msgpack_response(response_model, content)
+    return json_response(response_model, content)
 
 
 @app.get("/api/orders/{order_id}", response_model=OrderResponse)
-async def get_order(order_id: int, db: Session = Depends(get_db)):
-    """Get a specific order"""
-    order = db.query(Order).options(
-        joinedload(Order.customer),
-        joinedload(Order.stops)
-    ).filter(Order.id == order_id).first()
+async def get_order(
+    order_id: int,
+    request: Request,
+    response: Response,
+    include_archived: bool = False,
+    shards: ShardRouter = Depends(get_read_shards)
+):
+    """Get a specific order (ETag and Last-Modified; If-None-Match / If-Modified-Since give 304)"""
+    db = shards.for_order(order_id, include_archived=include_archived)
+    models = (Order, ArchivedOrder) if include_archived else (Order,)
+    
+    if is_conditional(request):
+        # The versions alone decide; nothing is loaded for a 304
+        for model in models:
+            row = db.execute(order_validator_statement(model), {"order_id": order_id}).first()
+            if row is not None:
+                cached = not_modified(request, *order_validators(*row))
+                if cached is not None:
+                    return cached
+                break
+    
+    for model in models:
+        order = db.execute(order_detail_statement(model), {"order_id": order_id}).unique().scalars().first()
+        if order:
+            break
     
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
+    set_validators(response, *order_validators(
+        order.version, order.updated_at,
+        sum(stop.version for stop in order.stops), max((stop.updated_at for stop in order.stops), default=None)
+    ))
     return order
 
 
+@app.get("/api/orders/{order_id}/status-history")
+async def get_order_status_history(order_id: int, shards: ShardRouter = Depends(get_read_shards)):
+    """The order's and its stops' status changes, oldest first (archived orders included)"""
+    db = shards.for_order(order_id, include_archived=True)
+    history = order_history(db.connection(), order_id)
+    if not history:
+        raise HTTPException(status_code=404, detail="No status history for this order")
+    return history
+
+
+def order_validators(version: int, updated_at, stop_versions: int, stops_updated_at):
+    """
+    ETag "<order version>.<sum of stop versions>" - a stop status change
+    doesn't bump the order's version - and the newest change of either
+    """
+    changes = [as_utc(value) for value in (updated_at, stops_updated_at) if value is not None]
+    return f'"{version}.{stop_versions}"', max(changes, default=None)
+
+
 @app.put("/api/orders/{order_id}", response_model=OrderResponse)
 async def update_order(
     order_id: int,
     order_update: OrderUpdate,
-    db: Session = Depends(get_db)
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    shards: ShardRouter = Depends(get_shards)
 ):
-    """Update an order with transaction"""
+    """Update an order with transaction (optimistic concurrency via If-Match)"""
+    expected_version = parse_if_match(if_match)
+    db = shards.for_order(order_id, write=True)
+    stop_ids = reserve_stop_ids(order_update.stops or ())
     try:
         # Get existing order
         db_order = db.query(Order).filter(Order.id == order_id).first()
         if not db_order:
             raise HTTPException(status_code=404, detail="Order not found")
         
+        # Fail fast if the client edited a stale copy
+        if expected_version is not None and db_order.version != expected_version:
+            raise HTTPException(
+                status_code=412,
+                detail=f"Order has been modified (current version {db_order.version})"
+            )
+        
         # Update order fields
         update_data = order_update.dict(exclude_unset=True, exclude={'stops'})
+        if update_data.get("status") is not None:
+            check_transition("order", db_order.status, update_data["status"])
         for field, value in update_data.items():
             setattr(db_order, field, value)
         
@@ -200,54 +725,473 @@ async def update_order(
             db.query(Stop).filter(Stop.order_id == order_id).delete()
             
             # Create new stops
-            for stop_data in order_update.stops:
-                stop_dict = stop_data.dict()
-                db_stop = Stop(**stop_dict, order_id=order_id)
-                db.add(db_stop)
+            insert_stops(db.connection(), order_id, order_update.stops, stop_ids)
+            
+            # Replacing stops is a change to the aggregate - bump the order version
+            db_order.updated_at = func.now()
+        
+        if "route_geometry" in update_data or order_update.stops is not None:
+            apply_route_metrics(db_order, order_update.stops)
         
+        stops_changed(db)
+        # The UPDATE (flushed here) carries "WHERE version = :read_version", so a
+        # concurrent writer that committed after our read makes this raise StaleDataError
+        db_order = order_for_response(db, order_id)
         db.commit()
-        db.refresh(db_order)
+        response.headers["ETag"] = f'"{db_order.version}"'
+        return db_order
+        
+    except StaleDataError:
+        db.rollback()
+        raise HTTPException(status_code=412, detail="Order has been modified by another request")
+    except InvalidTransition as e:
+        db.rollback()
+        raise HTTPException(status_code=409, detail=str(e))
+    except HTTPException:
+        db.rollback()
+        raise
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _check_stop_patches(db: Session, order_id: int, stop_patches):
+    """404 unless every patched stop is on the order; 409 for a status change it can't make"""
+    if not stop_patches:
+        return
+    current_stops = db.execute(
+        select(Stop.id, Stop.sequence, Stop.status).where(Stop.order_id == order_id).with_for_update()
+    ).all()
+    by_id = {stop.id: stop.status for stop in current_stops}
+    by_sequence = {stop.sequence: stop.status for stop in current_stops}
+    for stop_patch in stop_patches:
+        current_status = by_id if stop_patch.id is not None else by_sequence
+        address = stop_patch.id if stop_patch.id is not None else stop_patch.sequence
+        if address not in current_status:
+            raise HTTPException(status_code=404, detail="Stop not found on this order")
+        if stop_patch.status is not None:
+            check_transition("stop", current_status[address], stop_patch.status)
+
+
+@app.patch("/api/orders/{order_id}", response_model=OrderPatchResponse)
+async def patch_order(
+    order_id: int,
+    patch: OrderPatch,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    shards: ShardRouter = Depends(get_shards)
+):
+    """Partially update an order (JSON Merge Patch) without reloading the aggregate"""
+    expected_version = parse_if_match(if_match)
+    db = shards.for_order(order_id, write=True)
+    order_values = patch.dict(exclude_unset=True, exclude={'stops'})
+    
+    # Group stop patches by (address, column set) so each shape is a single executemany
+    stop_groups = {}
+    for stop_patch in patch.stops or []:
+        values = stop_patch.dict(exclude_unset=True, exclude={'id'})
+        if stop_patch.id is not None:
+            key = ("id", tuple(sorted(values)))
+            values["_address"] = stop_patch.id
+        elif stop_patch.sequence is not None:
+            values.pop("sequence")
+            key = ("sequence", tuple(sorted(values)))
+            values["_address"] = stop_patch.sequence
+        else:
+            raise HTTPException(status_code=400, detail="Stop patch needs an id or a sequence")
+        if len(key[1]) == 0:
+            continue
+        stop_groups.setdefault(key, []).append(values)
+    
+    try:
+        # A patch that moves the route also rewrites its precomputed length and extent
+        route_values = patched_route_metrics(
+            db, order_id, order_values, [stop_patch.dict(exclude_unset=True) for stop_patch in patch.stops or []]
+        )
+        
+        if not (order_values or route_values or stop_groups):
+            # Nothing to write: no version bump, the same 404 and 412 as a write
+            current_version = db.execute(select(Order.version).where(Order.id == order_id)).scalar()
+            if current_version is None:
+                raise HTTPException(status_code=404, detail="Order not found")
+            if expected_version is not None and current_version != expected_version:
+                raise HTTPException(
+                    status_code=412,
+                    detail=f"Order has been modified (current version {current_version})"
+                )
+            _check_stop_patches(db, order_id, patch.stops or [])
+            db.commit()
+            response.headers["ETag"] = f'"{current_version}"'
+            return {"id": order_id, "version": current_version, "updated_fields": [], "stops_updated": 0}
+        
+        # One UPDATE on orders: changed columns plus the version bump. The
+        # version check (If-Match) rides in the WHERE clause, so no pre-read.
+        stmt = (
+            update(Order)
+            .where(Order.id == order_id)
+            .values(**order_values, **(route_values or {}), version=Order.version + 1, updated_at=func.now())
+            .execution_options(synchronize_session=False)
+        )
+        if expected_version is not None:
+            stmt = stmt.where(Order.version == expected_version)
+        target_status = order_values.get("status")
+        if target_status is not None:
+            # The transition check rides in the WHERE clause too
+            stmt = stmt.where(or_(
+                Order.status.in_(sources("order", target_status)), Order.status.notin_(ORDER_STATUS_CODES)
+            ))
         
-        return db.query(Order).options(
-            joinedload(Order.customer),
-            joinedload(Order.stops)
-        ).filter(Order.id == order_id).first()
+        if db.get_bind().dialect.update_returning:
+            new_version = db.execute(stmt.returning(Order.version)).scalar()
+        else:
+            new_version = None
+            if db.execute(stmt).rowcount:
+                new_version = db.execute(
+                    select(Order.version).where(Order.id == order_id)
+                ).scalar()
         
+        if new_version is None:
+            # Only on failure do we look at the row, to tell 404 from 412 from 409
+            current = db.execute(select(Order.version, Order.status).where(Order.id == order_id)).first()
+            if current is None:
+                raise HTTPException(status_code=404, detail="Order not found")
+            if expected_version is not None and current.version != expected_version:
+                raise HTTPException(
+                    status_code=412,
+                    detail=f"Order has been modified (current version {current.version})"
+                )
+            raise HTTPException(status_code=409, detail=str(InvalidTransition("order", current.status, target_status)))
+        
+        # Stop patches are checked against the stops as they are now; the
+        # order UPDATE above already holds the write lock on SQLite
+        _check_stop_patches(db, order_id, patch.stops or [])
+        
+        # One UPDATE per stop patch shape, executed as executemany
+        stops_table = Stop.__table__
+        stops_updated = 0
+        for (address, columns), rows in stop_groups.items():
+            address_col = stops_table.c.id if address == "id" else stops_table.c.sequence
+            stop_stmt = (
+                stops_table.update()
+                .where(stops_table.c.order_id == order_id)
+                .where(address_col == bindparam("_address"))
+                .values(
+                    **{col: bindparam(col) for col in columns},
+                    version=stops_table.c.version + 1,
+                    updated_at=func.now()
+                )
+            )
+            db.connection().execute(stop_stmt, rows)
+            stops_updated += len(rows)
+        
+        stops_changed(db)
+        db.commit()
+        
+    except InvalidTransition as e:
+        db.rollback()
+        raise HTTPException(status_code=409, detail=str(e))
+    except HTTPException:
+        db.rollback()
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
+    
+    response.headers["ETag"] = f'"{new_version}"'
+    return {
+        "id": order_id,
+        "version": new_version,
+        "updated_fields": sorted(order_values),
+        "stops_updated": stops_updated
+    }
+
+
+@app.post("/api/orders/{order_id}/optimize", response_model=RouteOptimizationResponse)
+async def optimize_order_route(
+    order_id: int,
+    response: Response,
+    apply: bool = True,
+    window_minutes: float = Query(DEFAULT_WINDOW_MINUTES, ge=0),
+    if_match: Optional[str] = Header(None),
+    shards: ShardRouter = Depends(get_shards)
+):
+    """Reorder an order's stops to minimise distance (pickups before deliveries, time windows kept)"""
+    expected_version = parse_if_match(if_match)
+    db = shards.for_order(order_id, write=True)
+    order = db.query(Order).options(selectinload(Order.stops)).filter(Order.id == order_id).first()
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    if expected_version is not None and order.version != expected_version:
+        raise HTTPException(
+            status_code=412,
+            detail=f"Order has been modified (current version {order.version})"
+        )
+    
+    try:
+        # CPU-bound - keep it off the event loop
+        ordered, result = await asyncio.to_thread(optimize_stops, order.stops, window_minutes)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    applied = False
+    if apply and result.optimized_distance_km < result.original_distance_km:
+        for sequence, stop in enumerate(ordered, start=1):
+            stop.sequence = sequence
+        apply_route_metrics(order)
+        order.updated_at = func.now()  # resequencing is an order change - bump its version
+        stops_changed(db)
+        try:
+            db.commit()
+        except StaleDataError:
+            db.rollback()
+            raise HTTPException(status_code=412, detail="Order has been modified by another request")
+        db.refresh(order)
+        applied = True
+    
+    response.headers["ETag"] = f'"{order.version}"'
+    return {
+        "order_id": order_id,
+        "stop_ids": [stop.id for stop in ordered],
+        "original_distance_km": result.original_distance_km,
+        "optimized_distance_km": result.optimized_distance_km,
+        "feasible": result.feasible,
+        "applied": applied,
+        "version": order.version,
+        "elapsed_ms": result.elapsed_seconds * 1000
+    }
 
 
 @app.delete("/api/orders/{order_id}")
-async def delete_order(order_id: int, db: Session = Depends(get_db)):
+async def delete_order(order_id: int, shards: ShardRouter = Depends(get_shards)):
     """Delete an order (and its stops via cascade)"""
+    db = shards.for_order(order_id, write=True)
     db_order = db.query(Order).filter(Order.id == order_id).first()
     if not db_order:
         raise HTTPException(status_code=404, detail="Order not found")
     
     db.delete(db_order)
+    stops_changed(db)
     db.commit()
     return {"message": "Order deleted successfully"}
 
 
 # ============= Stop Endpoints =============
 
+@app.get("/api/stops/at-risk", response_model=list[AtRiskStopResponse])
+async def get_at_risk_stops(
+    slack_minutes: float = Query(15, ge=0),
+    limit: int = Query(50, ge=1, le=1000),
+    shards: ShardRouter = Depends(get_read_shards)
+):
+    """Pending stops of active orders whose ETA is within `slack_minutes` of (or past) schedule, latest first"""
+    per_shard = await asyncio.gather(*(
+        asyncio.to_thread(at_risk_stops, db, stop_array_caches[shard], slack_minutes, limit)
+        for shard, db in enumerate(shards.all())
+    ))
+    ranked = sorted((stop for stops in per_shard for stop in stops), key=lambda stop: -stop[0])
+    return [result for _, result in ranked[:limit]]
+
+
+def at_risk_stops(db, cache, slack_minutes: float, limit: int) -> list:
+    """(seconds late, response row) of one shard's `limit` latest at-risk stops, latest first"""
+    arrays = cache.get(db)
+    rows, eta, lateness = compute_etas(arrays)
+    
+    at_risk = np.flatnonzero(lateness > -slack_minutes * 60)
+    ranked = at_risk[np.argsort(-lateness[at_risk], kind="stable")][:limit]
+    if len(ranked) == 0:
+        return []
+    
+    stop_ids = arrays.stop_id[rows[ranked]].tolist()
+    details = {
+        stop.id: (stop, vehicle_type)
+        for stop, vehicle_type in db.query(Stop, Order.vehicle_type)
+        .join(Order, Order.id == Stop.order_id)
+        .filter(Stop.id.in_(stop_ids))
+    }
+    
+    results = []
+    for stop_id, eta_seconds, late_seconds in zip(stop_ids, eta[ranked], lateness[ranked]):
+        if stop_id not in details:
+            continue  # changed since the cached snapshot
+        stop, vehicle_type = details[stop_id]
+        results.append((float(late_seconds), {
+            "stop_id": stop.id,
+            "order_id": stop.order_id,
+            "sequence": stop.sequence,
+            "location": stop.location,
+            "vehicle_type": vehicle_type,
+            "scheduled_time": stop.scheduled_time,
+            "eta": datetime.fromtimestamp(float(eta_seconds), tz=timezone.utc),
+            "minutes_late": round(float(late_seconds) / 60, 1)
+        }))
+    return results
+
+
 @app.patch("/api/stops/{stop_id}/status")
 async def update_stop_status(
     stop_id: int,
-    status: str,
-    db: Session = Depends(get_db)
+    response: Response,
+    status: str = Query(..., pattern=STOP_STATUS_PATTERN),
+    shards: ShardRouter = Depends(get_shards)
 ):
-    """Update stop status (for tracking)"""
+    """Update stop status (for tracking); 409 if the stop can't move to it from where it is"""
+    if app.state.stop_status_buffers:
+        # The stop's shard; refuses the write (503) while its customer is being moved
+        shard = shard_for_stop(stop_id, write=True) or 0
+        buffer = app.state.stop_status_buffers[shard]
+        if buffer.durability == "buffered":
+            # A 202 promises the stop exists; the transition is checked when the batch is written
+            if shards.session(shard).execute(select(Stop.id).where(Stop.id == stop_id)).first() is None:
+                raise HTTPException(status_code=404, detail="Stop not found")
+        try:
+            found = await buffer.submit(stop_id, status)
+        except InvalidTransition as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        if found is None:
+            response.status_code = 202
+            return {"message": "Stop status update queued"}
+        if not found:
+            raise HTTPException(status_code=404, detail="Stop not found")
+        return {"message": "Stop status updated"}
+    
+    db = shards.for_stop(stop_id, write=True)
     db_stop = db.query(Stop).filter(Stop.id == stop_id).first()
     if not db_stop:
         raise HTTPException(status_code=404, detail="Stop not found")
+    try:
+        check_transition("stop", db_stop.status, status)
+    except InvalidTransition as e:
+        raise HTTPException(status_code=409, detail=str(e))
     
     db_stop.status = status
-    db.commit()
+    stops_changed(db)
+    try:
+        db.commit()
+    except StaleDataError:
+        db.rollback()
+        raise HTTPException(status_code=412, detail="Stop has been modified by another request")
     return {"message": "Stop status updated"}
 
 
+# ============= Analytics Export =============
+
+@app.get("/api/export/parquet")
+async def export_parquet(
+    table: str = Query("orders", pattern="^(orders|stops)$"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+):
+    """
+    Stream `table` as Parquet, limited to rows with since <= updated_at < until.
+    `until` defaults to now minus the safety lag and is returned in
+    X-Export-Until; pass it as `since` next time to fetch only the changes.
+    """
+    until = until or export_until()
+    return StreamingResponse(
+        stream_parquet(table, since, until),
+        media_type=PARQUET_MEDIA_TYPE,
+        headers={
+            "Content-Disposition": f'attachment; filename="{table}-{until.strftime("%Y%m%dT%H%M%S")}.parquet"',
+            "X-Export-Until": until.isoformat(),
+        }
+    )
+
+
+# ============= Diagnostics =============
+
+@app.get("/api/stats/query-cache")
+async def get_query_cache_stats():
+    """Compiled SQL cache hit rate and prebuilt statement usage for this worker"""
+    return {
+        "compiled_cache": compiled_cache_stats.stats(engine),
+        "statement_templates": template_cache_info()
+    }
+
+
+@app.get("/api/stats/admission")
+async def get_admission_stats():
+    """Requests in flight and rejections by reason for this worker"""
+    return admission.stats()
+
+
+@app.get("/api/stats/database")
+async def get_database_stats():
+    """SQLite mode, write queueing and snapshots for this worker"""
+    if IS_POSTGRES:
+        return {"dialect": "postgresql"}
+    return {
+        "dialect": "sqlite",
+        "sqlite_mode": SQLITE_MODE,
+        "writer_queue": writer_queue.stats() if writer_queue is not None else None,
+        "memory_database": memory_database.stats() if memory_database is not None else None,
+    }
+
+
+@app.get("/api/stats/outbox")
+async def get_outbox_stats(shards: ShardRouter = Depends(get_shards)):
+    """Outbox backlog, plus delivery counters when this worker runs the outbox worker - per shard when sharded"""
+    workers = app.state.outbox_workers
+    per_shard = [
+        {**backlog(db.connection()), "worker": workers[shard].stats() if workers else None}
+        for shard, db in enumerate(shards.all())
+    ]
+    if len(per_shard) == 1:
+        return per_shard[0]
+    ages = [s["oldest_pending_seconds"] for s in per_shard if s["oldest_pending_seconds"] is not None]
+    return {
+        "pending": sum(s["pending"] for s in per_shard),
+        "failed": sum(s["failed"] for s in per_shard),
+        "oldest_pending_seconds": max(ages) if ages else None,
+        "shards": per_shard,
+    }
+
+
+@app.get("/api/stats/status-dwell")
+async def get_status_dwell(
+    status: str,
+    entity: str = Query("order", pattern="^(order|stop)$"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    shards: ShardRouter = Depends(get_read_shards)
+):
+    """Seconds spent in a status by the orders or stops that left it in [since, until), over all shards"""
+    try:
+        parts = await scatter(shards.all(), lambda db: dwell(db.connection(), entity, status, since, until))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"entity": entity, "status": status, **merge_dwell(parts)}
+
+
+@app.get("/api/stats/status-throughput")
+async def get_status_throughput(
+    status: str,
+    entity: str = Query("order", pattern="^(order|stop)$"),
+    bucket: str = Query("hour", pattern="^(hour|day)$"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    shards: ShardRouter = Depends(get_read_shards)
+):
+    """How many orders or stops entered a status per hour or day in [since, until), over all shards"""
+    try:
+        parts = await scatter(
+            shards.all(), lambda db: throughput(db.connection(), entity, status, since, until, bucket)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"entity": entity, "status": status, "bucket": bucket, "buckets": merge_throughput(parts)}
+
+
+@app.get("/api/stats/sharding")
+async def get_sharding_stats():
+    """Shard count, customer map cache and id blocks for this worker"""
+    return {
+        "shards": len(shard_engines),
+        "shard_map": shard_map.stats(),
+        "id_blocks_taken": id_allocator.blocks_taken,
+    }
+
+
 @app.get("/")
 async def root():
     return {
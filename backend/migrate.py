@@ -0,0 +1,62 @@
+"""
+Schema migration CLI
+
+    python migrate.py upgrade          # apply all pending migrations
+    python migrate.py upgrade --to 2   # stop at a specific version
+    python migrate.py status           # show applied / pending migrations
+    python migrate.py reset            # drop every table and migrate from scratch (dev only)
+
+With SHARD_DATABASE_URLS set, every command acts on each shard in turn.
+"""
+import argparse
+import sys
+
+from sqlalchemy import MetaData
+
+from database import shard_engines, memory_database
+from migrations import upgrade, current_version, discover
+
+
+def status(engine):
+    current = current_version(engine)
+    print(f"Database: {engine.url.render_as_string(hide_password=True)}")
+    print(f"Current version: {current}")
+    for version, name, _ in discover():
+        marker = "✅" if version <= current else "⏳"
+        print(f"  {marker} {version:04d} {name}")
+
+
+def reset(engine):
+    metadata = MetaData()
+    metadata.reflect(bind=engine)
+    metadata.drop_all(bind=engine)
+    print("✅ Dropped all tables")
+    version = upgrade(engine)
+    print(f"✅ Database rebuilt at version {version}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fleet Management schema migrations")
+    sub = parser.add_subparsers(dest="command", required=True)
+    up = sub.add_parser("upgrade", help="apply pending migrations")
+    up.add_argument("--to", type=int, default=None, help="target version")
+    sub.add_parser("status", help="show migration status")
+    sub.add_parser("reset", help="drop all tables and re-run every migration")
+    args = parser.parse_args()
+
+    for engine in shard_engines:
+        if args.command == "upgrade":
+            version = upgrade(engine, target=args.to)
+            print(f"✅ {engine.url.render_as_string(hide_password=True)} at version {version}")
+        elif args.command == "status":
+            status(engine)
+        elif args.command == "reset":
+            reset(engine)
+    if memory_database is not None and args.command != "status":
+        # SQLITE_MODE=memory: write the result back to the database file
+        memory_database.snapshot()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
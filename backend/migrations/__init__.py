@@ -0,0 +1,108 @@
+"""
+Versioned schema migrations for SQLite and PostgreSQL.
+
+Each module in migrations/versions is named vNNNN_description.py and defines
+`upgrade(engine)`. Applied versions are recorded in the `schema_version` table.
+Migrations may span several transactions (online index builds, chunked
+backfills), so every step must be safe to re-run if a migration is interrupted.
+
+The app only verifies the schema version at startup; apply migrations with
+`python migrate.py upgrade`.
+"""
+import importlib
+import pkgutil
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+from sqlalchemy.engine import Engine
+
+import migrations.versions
+
+schema_version_metadata = MetaData()
+schema_version = Table(
+    "schema_version",
+    schema_version_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String(255), nullable=False),
+    Column("applied_at", DateTime(timezone=True), nullable=False),
+)
+
+# Arbitrary key for pg_advisory_lock so two deployers cannot migrate at once
+ADVISORY_LOCK_KEY = 727274
+
+
+class SchemaVersionError(RuntimeError):
+    """Raised when the database schema does not match the code"""
+
+
+def discover():
+    """Return [(version, name, module)] for all migrations, ordered by version"""
+    found = []
+    for info in pkgutil.iter_modules(migrations.versions.__path__):
+        if not info.name.startswith("v"):
+            continue
+        number, _, name = info.name[1:].partition("_")
+        module = importlib.import_module(f"migrations.versions.{info.name}")
+        found.append((int(number), name, module))
+    found.sort(key=lambda m: m[0])
+    versions = [m[0] for m in found]
+    if len(versions) != len(set(versions)):
+        raise SchemaVersionError(f"Duplicate migration versions: {versions}")
+    return found
+
+
+def head_version() -> int:
+    found = discover()
+    return found[-1][0] if found else 0
+
+
+def current_version(engine: Engine) -> int:
+    """Highest applied migration, or 0 for a database that has never been migrated"""
+    if not inspect(engine).has_table("schema_version"):
+        return 0
+    with engine.connect() as conn:
+        return conn.execute(select(schema_version.c.version).order_by(schema_version.c.version.desc())).scalar() or 0
+
+
+def upgrade(engine: Engine, target: int = None, log=print) -> int:
+    """Apply pending migrations up to `target` (default: head). Returns the new version."""
+    schema_version_metadata.create_all(bind=engine, checkfirst=True)
+    is_postgres = engine.dialect.name == "postgresql"
+
+    lock_conn = engine.connect() if is_postgres else None
+    try:
+        if lock_conn is not None:
+            lock_conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": ADVISORY_LOCK_KEY})
+
+        current = current_version(engine)
+        for version, name, module in discover():
+            if version <= current or (target is not None and version > target):
+                continue
+            log(f"Applying migration {version:04d} {name}...")
+            module.upgrade(engine)
+            with engine.begin() as conn:
+                conn.execute(schema_version.insert().values(
+                    version=version, name=name, applied_at=datetime.now(timezone.utc)
+                ))
+            current = version
+        return current
+    finally:
+        if lock_conn is not None:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": ADVISORY_LOCK_KEY})
+            lock_conn.close()
+
+
+def verify_schema(engine: Engine):
+    """Cheap startup check - one indexed query, no DDL"""
+    current = current_version(engine)
+    head = head_version()
+    if current < head:
+        raise SchemaVersionError(
+            f"Database schema is at version {current}, code expects {head}. "
+            f"Run `python migrate.py upgrade`."
+        )
+    if current > head:
+        raise SchemaVersionError(
+            f"Database schema version {current} is newer than this code ({head}). "
+            f"Deploy the matching release."
+        )
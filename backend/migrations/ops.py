@@ -0,0 +1,100 @@
+"""
+Building blocks for migrations. All of them are idempotent.
+"""
+import time
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+
+
+def is_postgres(engine: Engine) -> bool:
+    return engine.dialect.name == "postgresql"
+
+
+def has_column(engine: Engine, table: str, column: str, schema: str = None) -> bool:
+    return column in {c["name"] for c in inspect(engine).get_columns(table, schema=schema)}
+
+
+def add_column(engine: Engine, table: str, column: str, ddl: str, schema: str = None):
+    """
+    ALTER TABLE ... ADD COLUMN if it is missing.
+
+    Keep `ddl` to a nullable column or a NOT NULL column with a constant
+    default: both are metadata-only changes on PostgreSQL 11+ and SQLite, so
+    large tables are not rewritten or locked. Anything else (computed values)
+    belongs in `backfill`. `schema` targets e.g. the archive tables.
+    """
+    if has_column(engine, table, column, schema):
+        return
+    qualified = f"{schema}.{table}" if schema else table
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {qualified} ADD COLUMN {column} {ddl}"))
+
+
+def create_index(engine: Engine, name: str, table: str, columns, unique: bool = False,
+                 where: str = None, using: str = None):
+    """
+    Create an index without blocking writes. `columns` may be expressions,
+    `using` selects the access method (PostgreSQL, e.g. "gin").
+
+    On PostgreSQL this runs CREATE INDEX CONCURRENTLY outside a transaction.
+    A concurrent build that fails leaves an INVALID index behind, so an existing
+    invalid index of the same name is dropped and rebuilt.
+    """
+    unique_sql = "UNIQUE " if unique else ""
+    using_sql = f" USING {using}" if using else ""
+    where_sql = f" WHERE {where}" if where else ""
+    column_sql = ", ".join(columns)
+
+    if not is_postgres(engine):
+        with engine.begin() as conn:
+            conn.execute(text(
+                f"CREATE {unique_sql}INDEX IF NOT EXISTS {name} ON {table}{using_sql} ({column_sql}){where_sql}"
+            ))
+        return
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        invalid = conn.execute(text(
+            "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = :name AND NOT i.indisvalid"
+        ), {"name": name}).first()
+        if invalid:
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        conn.execute(text(
+            f"CREATE {unique_sql}INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table}{using_sql} ({column_sql}){where_sql}"
+        ))
+
+
+def drop_index(engine: Engine, name: str):
+    if is_postgres(engine):
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+    else:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+
+def backfill(engine: Engine, table: str, set_sql: str, where_sql: str,
+             chunk_size: int = 5000, pause: float = 0.0, params: dict = None, log=print) -> int:
+    """
+    Run `UPDATE table SET set_sql WHERE where_sql` in primary-key chunks.
+
+    Each chunk is its own short transaction, so row locks are held briefly and
+    other writers interleave. `where_sql` must stop matching a row once it has
+    been updated (e.g. "new_col IS NULL"), which also makes the backfill
+    resumable. Returns the number of rows updated.
+    """
+    total = 0
+    while True:
+        with engine.begin() as conn:
+            result = conn.execute(text(
+                f"UPDATE {table} SET {set_sql} WHERE id IN "
+                f"(SELECT id FROM {table} WHERE {where_sql} ORDER BY id LIMIT :chunk_size)"
+            ), {**(params or {}), "chunk_size": chunk_size})
+        if result.rowcount <= 0:
+            break
+        total += result.rowcount
+        log(f"  backfilled {total} rows in {table}")
+        if pause:
+            time.sleep(pause)
+    return total
@@ -0,0 +1,84 @@
+"""
+Baseline schema: customers, orders, stops.
+
+Table definitions are frozen here rather than imported from models.py, so this
+migration keeps producing the same schema as the models evolve. Databases
+created by the old `create_all` startup or migrate_db.py are adopted as-is.
+"""
+from sqlalchemy import Column, DateTime, Float, ForeignKey, Integer, JSON, MetaData, String, Table, Text
+from sqlalchemy.sql import func
+
+from migrations import ops
+
+metadata = MetaData()
+
+Table(
+    "customers", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("name", String(255), nullable=False),
+    Column("email", String(255), unique=True, index=True),
+    Column("phone", String(50)),
+    Column("address", Text),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    Column("updated_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+Table(
+    "orders", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("customer_id", Integer, ForeignKey("customers.id"), nullable=False),
+    Column("pickup_location", String(255), nullable=False),
+    Column("delivery_location", String(255), nullable=False),
+    Column("pickup_date", DateTime, nullable=False),
+    Column("delivery_date", DateTime, nullable=False),
+    Column("cargo_type", String(100), nullable=False),
+    Column("weight", Float, nullable=False),
+    Column("dimensions", String(100)),
+    Column("vehicle_type", String(100)),
+    Column("contact_person", String(255)),
+    Column("contact_phone", String(50)),
+    Column("contact_email", String(255)),
+    Column("route_geometry", JSON),
+    Column("bill_of_lading", String(100)),
+    Column("container_number", String(100)),
+    Column("seal_number", String(100)),
+    Column("carrier", String(100)),
+    Column("reference_number", String(100)),
+    Column("po_number", String(100)),
+    Column("customer_reference", String(100)),
+    Column("special_instructions", Text),
+    Column("internal_notes", Text),
+    Column("quote_amount", Float),
+    Column("status", String(50), nullable=False),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    Column("updated_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+Table(
+    "stops", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("order_id", Integer, ForeignKey("orders.id"), nullable=False),
+    Column("sequence", Integer, nullable=False),
+    Column("location", String(255), nullable=False),
+    Column("stop_type", String(50), nullable=False),
+    Column("scheduled_time", DateTime, nullable=False),
+    Column("contact_person", String(100)),
+    Column("contact_phone", String(50)),
+    Column("latitude", Float),
+    Column("longitude", Float),
+    Column("status", String(50)),
+    Column("actual_arrival_time", DateTime),
+    Column("actual_departure_time", DateTime),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    Column("updated_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+
+def upgrade(engine):
+    metadata.create_all(bind=engine, checkfirst=True)
+
+    # Columns that migrate_db.py used to add by hand to older databases
+    ops.add_column(engine, "orders", "vehicle_type", "VARCHAR(100)")
+    ops.add_column(engine, "orders", "contact_person", "VARCHAR(255)")
+    ops.add_column(engine, "orders", "contact_phone", "VARCHAR(50)")
+    ops.add_column(engine, "orders", "contact_email", "VARCHAR(255)")
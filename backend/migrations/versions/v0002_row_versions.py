@@ -0,0 +1,10 @@
+"""
+Optimistic concurrency version columns on orders and stops.
+"""
+from migrations import ops
+
+
+def upgrade(engine):
+    # Constant default - metadata-only on both backends, no table rewrite
+    ops.add_column(engine, "orders", "version", "INTEGER NOT NULL DEFAULT 1")
+    ops.add_column(engine, "stops", "version", "INTEGER NOT NULL DEFAULT 1")
@@ -0,0 +1,14 @@
+"""
+Indexes for the foreign keys and the default list ordering.
+
+Neither customer_id nor order_id was indexed, so loading an order's stops and
+filtering orders by customer scanned the whole table.
+"""
+from migrations import ops
+
+
+def upgrade(engine):
+    ops.create_index(engine, "ix_stops_order_id", "stops", ["order_id"])
+    ops.create_index(engine, "ix_orders_customer_id", "orders", ["customer_id"])
+    ops.create_index(engine, "ix_orders_status_created_at", "orders", ["status", "created_at"])
+    ops.create_index(engine, "ix_orders_created_at", "orders", ["created_at"])
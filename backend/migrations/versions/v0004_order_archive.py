@@ -0,0 +1,94 @@
+"""
+Archive tables for completed orders and their stops.
+
+PostgreSQL: `archive` schema with tables range-partitioned by the order's
+created_at; monthly partitions are created on demand by archive.py, with a
+DEFAULT partition as a safety net. SQLite: the same tables inside the attached
+archive database (see database.py).
+"""
+from sqlalchemy import (Column, DateTime, Float, Index, Integer, JSON, MetaData, PrimaryKeyConstraint,
+                        String, Table, Text, text)
+
+from database import ARCHIVE_SCHEMA
+from migrations import ops
+
+metadata = MetaData(schema=ARCHIVE_SCHEMA)
+
+archive_orders = Table(
+    "orders", metadata,
+    Column("id", Integer, nullable=False),
+    Column("customer_id", Integer, nullable=False),
+    Column("pickup_location", String(255), nullable=False),
+    Column("delivery_location", String(255), nullable=False),
+    Column("pickup_date", DateTime, nullable=False),
+    Column("delivery_date", DateTime, nullable=False),
+    Column("cargo_type", String(100), nullable=False),
+    Column("weight", Float, nullable=False),
+    Column("dimensions", String(100)),
+    Column("vehicle_type", String(100)),
+    Column("contact_person", String(255)),
+    Column("contact_phone", String(50)),
+    Column("contact_email", String(255)),
+    Column("route_geometry", JSON),
+    Column("bill_of_lading", String(100)),
+    Column("container_number", String(100)),
+    Column("seal_number", String(100)),
+    Column("carrier", String(100)),
+    Column("reference_number", String(100)),
+    Column("po_number", String(100)),
+    Column("customer_reference", String(100)),
+    Column("special_instructions", Text),
+    Column("internal_notes", Text),
+    Column("quote_amount", Float),
+    Column("status", String(50), nullable=False),
+    Column("created_at", DateTime(timezone=True), nullable=False),
+    Column("updated_at", DateTime(timezone=True)),
+    Column("version", Integer, nullable=False),
+    Column("archived_at", DateTime(timezone=True)),
+    # The partition key has to be part of the primary key on PostgreSQL
+    PrimaryKeyConstraint("id", "created_at"),
+    Index("ix_archive_orders_customer_id", "customer_id"),
+    Index("ix_archive_orders_created_at", "created_at"),
+    postgresql_partition_by="RANGE (created_at)",
+)
+
+archive_stops = Table(
+    "stops", metadata,
+    Column("id", Integer, nullable=False),
+    Column("order_id", Integer, nullable=False),
+    Column("sequence", Integer, nullable=False),
+    Column("location", String(255), nullable=False),
+    Column("stop_type", String(50), nullable=False),
+    Column("scheduled_time", DateTime, nullable=False),
+    Column("contact_person", String(100)),
+    Column("contact_phone", String(50)),
+    Column("latitude", Float),
+    Column("longitude", Float),
+    Column("status", String(50)),
+    Column("actual_arrival_time", DateTime),
+    Column("actual_departure_time", DateTime),
+    Column("created_at", DateTime(timezone=True)),
+    Column("updated_at", DateTime(timezone=True)),
+    Column("version", Integer, nullable=False),
+    Column("order_created_at", DateTime(timezone=True), nullable=False),
+    PrimaryKeyConstraint("id", "order_created_at"),
+    Index("ix_archive_stops_order_id", "order_id"),
+    postgresql_partition_by="RANGE (order_created_at)",
+)
+
+
+def upgrade(engine):
+    if ops.is_postgres(engine):
+        with engine.begin() as conn:
+            conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}"))
+
+    # Brand new tables, so plain (non-concurrent) index builds are fine
+    metadata.create_all(bind=engine, checkfirst=True)
+
+    if ops.is_postgres(engine):
+        with engine.begin() as conn:
+            for table in ("orders", "stops"):
+                conn.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {ARCHIVE_SCHEMA}.{table}_default "
+                    f"PARTITION OF {ARCHIVE_SCHEMA}.{table} DEFAULT"
+                ))
@@ -0,0 +1,143 @@
+"""
+Customer type-ahead search indexes and the customer_order_stats rollup.
+
+customer_order_stats holds each customer's active order count and last order
+time. Triggers on `orders` keep it current for every write path (ORM, Core
+UPDATEs, bulk loads, archival), so reads never GROUP BY orders.
+"""
+import logging
+
+from sqlalchemy import text
+
+from migrations import ops
+
+logger = logging.getLogger(__name__)
+
+# Frozen copy of models.ORDER_TERMINAL_STATUSES at the time of this migration
+TERMINAL = "('completed', 'delivered', 'cancelled')"
+
+SQLITE_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_orders_stats_insert AFTER INSERT ON orders
+    BEGIN
+        INSERT INTO customer_order_stats (customer_id, active_order_count, last_order_at)
+        VALUES (NEW.customer_id, 0, NULL) ON CONFLICT (customer_id) DO NOTHING;
+        UPDATE customer_order_stats
+        SET active_order_count = active_order_count + (CASE WHEN NEW.status IN {TERMINAL} THEN 0 ELSE 1 END),
+            last_order_at = CASE WHEN last_order_at IS NULL OR NEW.created_at > last_order_at
+                                 THEN NEW.created_at ELSE last_order_at END
+        WHERE customer_id = NEW.customer_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_orders_stats_update AFTER UPDATE OF status, customer_id ON orders
+    WHEN (OLD.status IN {TERMINAL}) != (NEW.status IN {TERMINAL}) OR OLD.customer_id != NEW.customer_id
+    BEGIN
+        UPDATE customer_order_stats
+        SET active_order_count = active_order_count - (CASE WHEN OLD.status IN {TERMINAL} THEN 0 ELSE 1 END)
+        WHERE customer_id = OLD.customer_id;
+        INSERT INTO customer_order_stats (customer_id, active_order_count, last_order_at)
+        VALUES (NEW.customer_id, 0, NULL) ON CONFLICT (customer_id) DO NOTHING;
+        UPDATE customer_order_stats
+        SET active_order_count = active_order_count + (CASE WHEN NEW.status IN {TERMINAL} THEN 0 ELSE 1 END),
+            last_order_at = CASE WHEN last_order_at IS NULL OR NEW.created_at > last_order_at
+                                 THEN NEW.created_at ELSE last_order_at END
+        WHERE customer_id = NEW.customer_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_orders_stats_delete AFTER DELETE ON orders
+    BEGIN
+        UPDATE customer_order_stats
+        SET active_order_count = active_order_count - (CASE WHEN OLD.status IN {TERMINAL} THEN 0 ELSE 1 END),
+            last_order_at = CASE WHEN OLD.created_at >= last_order_at
+                                 THEN (SELECT MAX(created_at) FROM orders WHERE customer_id = OLD.customer_id)
+                                 ELSE last_order_at END
+        WHERE customer_id = OLD.customer_id;
+    END
+    """,
+]
+
+POSTGRES_FUNCTION = f"""
+CREATE OR REPLACE FUNCTION customer_order_stats_apply(p_customer_id INTEGER, p_delta INTEGER, p_created_at TIMESTAMPTZ)
+RETURNS void AS $$
+BEGIN
+    INSERT INTO customer_order_stats AS s (customer_id, active_order_count, last_order_at)
+    VALUES (p_customer_id, GREATEST(p_delta, 0), p_created_at)
+    ON CONFLICT (customer_id) DO UPDATE
+    SET active_order_count = s.active_order_count + p_delta,
+        last_order_at = GREATEST(s.last_order_at, EXCLUDED.last_order_at);
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION trg_orders_stats() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.status NOT IN {TERMINAL} THEN
+        PERFORM customer_order_stats_apply(OLD.customer_id, -1, NULL);
+    END IF;
+    IF TG_OP = 'DELETE' THEN
+        UPDATE customer_order_stats
+        SET last_order_at = (SELECT MAX(created_at) FROM orders WHERE customer_id = OLD.customer_id)
+        WHERE customer_id = OLD.customer_id AND last_order_at <= OLD.created_at;
+        RETURN OLD;
+    END IF;
+    PERFORM customer_order_stats_apply(
+        NEW.customer_id,
+        CASE WHEN NEW.status IN {TERMINAL} THEN 0 ELSE 1 END,
+        NEW.created_at
+    );
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_orders_stats ON orders;
+CREATE TRIGGER trg_orders_stats AFTER INSERT OR DELETE OR UPDATE OF status, customer_id ON orders
+FOR EACH ROW EXECUTE FUNCTION trg_orders_stats();
+"""
+
+BACKFILL = f"""
+INSERT INTO customer_order_stats (customer_id, active_order_count, last_order_at)
+SELECT customer_id,
+       SUM(CASE WHEN status IN {TERMINAL} THEN 0 ELSE 1 END),
+       MAX(created_at)
+FROM orders
+GROUP BY customer_id
+"""
+
+
+def upgrade(engine):
+    postgres = ops.is_postgres(engine)
+    timestamp = "TIMESTAMP WITH TIME ZONE" if postgres else "DATETIME"
+
+    # Triggers and backfill share one transaction so no write falls in between
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS customer_order_stats (
+                customer_id INTEGER NOT NULL PRIMARY KEY REFERENCES customers (id),
+                active_order_count INTEGER NOT NULL DEFAULT 0,
+                last_order_at {timestamp}
+            )
+        """))
+        if postgres:
+            conn.execute(text(POSTGRES_FUNCTION))
+        else:
+            for trigger in SQLITE_TRIGGERS:
+                conn.execute(text(trigger))
+        conn.execute(text("DELETE FROM customer_order_stats"))
+        conn.execute(text(BACKFILL))
+
+    # Prefix search: expression indexes on lower(name) / lower(email)
+    if postgres:
+        ops.create_index(engine, "ix_customers_name_prefix", "customers", ["lower(name) text_pattern_ops", "id"])
+        ops.create_index(engine, "ix_customers_email_prefix", "customers", ["lower(email) text_pattern_ops"])
+        try:
+            with engine.begin() as conn:
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        except Exception as e:
+            logger.warning("pg_trgm unavailable, contains-search will scan: %s", e)
+        else:
+            ops.create_index(engine, "ix_customers_name_trgm", "customers", ["lower(name) gin_trgm_ops"], using="gin")
+            ops.create_index(engine, "ix_customers_email_trgm", "customers", ["lower(email) gin_trgm_ops"], using="gin")
+    else:
+        ops.create_index(engine, "ix_customers_name_prefix", "customers", ["lower(name)", "id"])
+        ops.create_index(engine, "ix_customers_email_prefix", "customers", ["lower(email)"])
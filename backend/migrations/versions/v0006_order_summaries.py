@@ -0,0 +1,194 @@
+"""
+order_summaries read model for the order list view.
+
+One row per live order: the list columns, the customer name, the stop count
+and the next pending stop. Triggers on orders, stops and customers recompute
+an order's row whenever anything it is derived from changes, in the same
+transaction as the write, for every write path.
+"""
+from sqlalchemy import text
+
+from migrations import ops
+
+# Frozen copy of models.STOP_DONE_STATUSES at the time of this migration
+STOP_DONE = "('completed', 'failed')"
+
+SUMMARY_COLUMNS = (
+    "id, customer_id, customer_name, pickup_location, delivery_location, pickup_date, delivery_date, "
+    "cargo_type, vehicle_type, weight, status, reference_number, created_at, updated_at, version, "
+    "stop_count, next_stop_id, next_stop_sequence, next_stop_location, next_stop_scheduled_time"
+)
+
+ORDER_COLUMNS = (
+    "customer_id, pickup_location, delivery_location, pickup_date, delivery_date, cargo_type, "
+    "vehicle_type, weight, status, reference_number, created_at, updated_at, version"
+)
+STOP_COLUMNS = "order_id, sequence, status, location, scheduled_time"
+
+
+def summary_select(where: str) -> str:
+    return f"""
+        SELECT o.id, o.customer_id, c.name, o.pickup_location, o.delivery_location,
+               o.pickup_date, o.delivery_date, o.cargo_type, o.vehicle_type, o.weight,
+               o.status, o.reference_number, o.created_at, o.updated_at, o.version,
+               (SELECT COUNT(*) FROM stops s WHERE s.order_id = o.id),
+               ns.id, ns.sequence, ns.location, ns.scheduled_time
+        FROM orders o
+        LEFT JOIN customers c ON c.id = o.customer_id
+        LEFT JOIN stops ns ON ns.id = (
+            SELECT s.id FROM stops s
+            WHERE s.order_id = o.id AND COALESCE(s.status, 'pending') NOT IN {STOP_DONE}
+            ORDER BY s.sequence, s.id
+            LIMIT 1
+        )
+        WHERE {where}
+    """
+
+
+def _sqlite_refresh(order_id: str, condition: str = "1 = 1") -> str:
+    where = f"o.id = {order_id} AND {condition}"
+    return f"INSERT OR REPLACE INTO order_summaries ({SUMMARY_COLUMNS}) {summary_select(where)};"
+
+
+SQLITE_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_order_summaries_order_insert AFTER INSERT ON orders
+    BEGIN
+        {_sqlite_refresh("NEW.id")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_order_summaries_order_update AFTER UPDATE OF {ORDER_COLUMNS} ON orders
+    BEGIN
+        {_sqlite_refresh("NEW.id")}
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_order_summaries_order_delete AFTER DELETE ON orders
+    BEGIN
+        DELETE FROM order_summaries WHERE id = OLD.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_order_summaries_stop_insert AFTER INSERT ON stops
+    BEGIN
+        {_sqlite_refresh("NEW.order_id")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_order_summaries_stop_update AFTER UPDATE OF {STOP_COLUMNS} ON stops
+    BEGIN
+        {_sqlite_refresh("NEW.order_id")}
+        {_sqlite_refresh("OLD.order_id", "OLD.order_id != NEW.order_id")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_order_summaries_stop_delete AFTER DELETE ON stops
+    BEGIN
+        {_sqlite_refresh("OLD.order_id")}
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_order_summaries_customer_name AFTER UPDATE OF name ON customers
+    BEGIN
+        UPDATE order_summaries SET customer_name = NEW.name WHERE customer_id = NEW.id;
+    END
+    """,
+]
+
+_UPSERT_SET = ", ".join(
+    f"{column} = EXCLUDED.{column}" for column in (c.strip() for c in SUMMARY_COLUMNS.split(",")) if column != "id"
+)
+
+POSTGRES_FUNCTIONS = f"""
+CREATE OR REPLACE FUNCTION order_summary_refresh(p_order_id INTEGER) RETURNS void AS $$
+BEGIN
+    INSERT INTO order_summaries ({SUMMARY_COLUMNS})
+    {summary_select("o.id = p_order_id")}
+    ON CONFLICT (id) DO UPDATE SET {_UPSERT_SET};
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION trg_order_summaries_order() RETURNS trigger AS $$
+BEGIN
+    PERFORM order_summary_refresh(NEW.id);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION trg_order_summaries_stop() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM order_summary_refresh(OLD.order_id);
+    END IF;
+    IF TG_OP = 'INSERT' OR (TG_OP = 'UPDATE' AND NEW.order_id <> OLD.order_id) THEN
+        PERFORM order_summary_refresh(NEW.order_id);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION trg_order_summaries_customer() RETURNS trigger AS $$
+BEGIN
+    UPDATE order_summaries SET customer_name = NEW.name WHERE customer_id = NEW.id;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_order_summaries_order ON orders;
+CREATE TRIGGER trg_order_summaries_order AFTER INSERT OR UPDATE OF {ORDER_COLUMNS} ON orders
+FOR EACH ROW EXECUTE FUNCTION trg_order_summaries_order();
+
+DROP TRIGGER IF EXISTS trg_order_summaries_stop ON stops;
+CREATE TRIGGER trg_order_summaries_stop AFTER INSERT OR DELETE OR UPDATE OF {STOP_COLUMNS} ON stops
+FOR EACH ROW EXECUTE FUNCTION trg_order_summaries_stop();
+
+DROP TRIGGER IF EXISTS trg_order_summaries_customer ON customers;
+CREATE TRIGGER trg_order_summaries_customer AFTER UPDATE OF name ON customers
+FOR EACH ROW EXECUTE FUNCTION trg_order_summaries_customer();
+"""
+
+
+def upgrade(engine):
+    postgres = ops.is_postgres(engine)
+    timestamp = "TIMESTAMP WITH TIME ZONE" if postgres else "DATETIME"
+    naive = "TIMESTAMP WITHOUT TIME ZONE" if postgres else "DATETIME"
+
+    # Triggers and backfill share one transaction so no write falls in between
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS order_summaries (
+                id INTEGER NOT NULL PRIMARY KEY REFERENCES orders (id) ON DELETE CASCADE,
+                customer_id INTEGER NOT NULL,
+                customer_name VARCHAR(255),
+                pickup_location VARCHAR(255) NOT NULL,
+                delivery_location VARCHAR(255) NOT NULL,
+                pickup_date {naive} NOT NULL,
+                delivery_date {naive} NOT NULL,
+                cargo_type VARCHAR(100) NOT NULL,
+                vehicle_type VARCHAR(100),
+                weight FLOAT NOT NULL,
+                status VARCHAR(50) NOT NULL,
+                reference_number VARCHAR(100),
+                created_at {timestamp},
+                updated_at {timestamp},
+                version INTEGER NOT NULL,
+                stop_count INTEGER NOT NULL DEFAULT 0,
+                next_stop_id INTEGER,
+                next_stop_sequence INTEGER,
+                next_stop_location VARCHAR(255),
+                next_stop_scheduled_time {naive}
+            )
+        """))
+        if postgres:
+            conn.execute(text(POSTGRES_FUNCTIONS))
+        else:
+            for trigger in SQLITE_TRIGGERS:
+                conn.execute(text(trigger))
+        conn.execute(text("DELETE FROM order_summaries"))
+        conn.execute(text(f"INSERT INTO order_summaries ({SUMMARY_COLUMNS}) {summary_select('1 = 1')}"))
+
+    ops.create_index(engine, "ix_order_summaries_created_at", "order_summaries", ["created_at"])
+    ops.create_index(engine, "ix_order_summaries_updated_at", "order_summaries", ["updated_at"])
+    ops.create_index(engine, "ix_order_summaries_status_created_at", "order_summaries", ["status", "created_at"])
+    ops.create_index(engine, "ix_order_summaries_customer_created_at", "order_summaries", ["customer_id", "created_at"])
@@ -0,0 +1,109 @@
+"""
+Transactional outbox for side effects of order, stop and customer changes.
+
+Triggers append a row to outbox_events for every insert, update and delete,
+in the same transaction as the change, so an event exists if and only if the
+change committed - whichever write path made it. outbox.py delivers them.
+Stop events use their order as the aggregate so an order's events stay in
+sequence.
+"""
+from sqlalchemy import text
+
+from migrations import ops
+
+OUTBOX_COLUMNS = "aggregate_type, aggregate_id, event_type, payload"
+
+# (table, aggregate type, aggregate id column, event prefix,
+#  payload fields as (key, column), extra field for updates as (key, OLD column))
+SOURCES = [
+    ("orders", "order", "id", "order", [
+        ("order_id", "id"), ("customer_id", "customer_id"), ("status", "status"), ("version", "version"),
+    ], ("previous_status", "status")),
+    ("stops", "order", "order_id", "stop", [
+        ("stop_id", "id"), ("order_id", "order_id"), ("sequence", "sequence"), ("status", "status"),
+        ("version", "version"),
+    ], ("previous_status", "status")),
+    ("customers", "customer", "id", "customer", [
+        ("customer_id", "id"), ("name", "name"), ("email", "email"),
+    ], ("previous_name", "name")),
+]
+
+OPERATIONS = [("INSERT", "created", "NEW"), ("UPDATE", "updated", "NEW"), ("DELETE", "deleted", "OLD")]
+
+
+def _sqlite_triggers():
+    triggers = []
+    for table, aggregate_type, aggregate_id, prefix, fields, previous in SOURCES:
+        for operation, suffix, row in OPERATIONS:
+            pairs = [f"'{key}', {row}.{column}" for key, column in fields]
+            if operation == "UPDATE":
+                pairs.append(f"'{previous[0]}', OLD.{previous[1]}")
+            triggers.append(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_outbox_{table}_{operation.lower()} AFTER {operation} ON {table}
+                BEGIN
+                    INSERT INTO outbox_events ({OUTBOX_COLUMNS})
+                    VALUES ('{aggregate_type}', {row}.{aggregate_id}, '{prefix}.{suffix}', json_object({", ".join(pairs)}));
+                END
+            """)
+    return triggers
+
+
+def _postgres_functions():
+    statements = []
+    for table, aggregate_type, aggregate_id, prefix, fields, previous in SOURCES:
+        new_pairs = ", ".join(f"'{key}', NEW.{column}" for key, column in fields)
+        old_pairs = ", ".join(f"'{key}', OLD.{column}" for key, column in fields)
+        statements.append(f"""
+CREATE OR REPLACE FUNCTION trg_outbox_{table}() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO outbox_events ({OUTBOX_COLUMNS})
+        VALUES ('{aggregate_type}', NEW.{aggregate_id}, '{prefix}.created', jsonb_build_object({new_pairs}));
+    ELSIF TG_OP = 'UPDATE' THEN
+        INSERT INTO outbox_events ({OUTBOX_COLUMNS})
+        VALUES ('{aggregate_type}', NEW.{aggregate_id}, '{prefix}.updated', jsonb_build_object({new_pairs}, '{previous[0]}', OLD.{previous[1]}));
+    ELSE
+        INSERT INTO outbox_events ({OUTBOX_COLUMNS})
+        VALUES ('{aggregate_type}', OLD.{aggregate_id}, '{prefix}.deleted', jsonb_build_object({old_pairs}));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_outbox_{table} ON {table};
+CREATE TRIGGER trg_outbox_{table} AFTER INSERT OR UPDATE OR DELETE ON {table}
+FOR EACH ROW EXECUTE FUNCTION trg_outbox_{table}();
+""")
+    return "\n".join(statements)
+
+
+def upgrade(engine):
+    postgres = ops.is_postgres(engine)
+    timestamp = "TIMESTAMP WITH TIME ZONE" if postgres else "DATETIME"
+
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS outbox_events (
+                id {"SERIAL PRIMARY KEY" if postgres else "INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT"},
+                aggregate_type VARCHAR(50) NOT NULL,
+                aggregate_id INTEGER NOT NULL,
+                event_type VARCHAR(100) NOT NULL,
+                payload {"JSONB" if postgres else "JSON"} NOT NULL,
+                created_at {timestamp} NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                available_at {timestamp} NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                failed_at {timestamp}
+            )
+        """))
+        if postgres:
+            conn.execute(text(_postgres_functions()))
+        else:
+            for trigger in _sqlite_triggers():
+                conn.execute(text(trigger))
+
+    ops.create_index(engine, "ix_outbox_events_pending", "outbox_events", ["id"], where="failed_at IS NULL")
+    ops.create_index(
+        engine, "ix_outbox_events_aggregate_pending", "outbox_events",
+        ["aggregate_type", "aggregate_id", "id"], where="failed_at IS NULL"
+    )
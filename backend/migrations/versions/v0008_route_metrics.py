@@ -0,0 +1,31 @@
+"""
+Precomputed route distance, bounding box and stop-to-stop legs on orders.
+
+Nullable columns, so adding them does not rewrite the table; the archive
+copy of orders gets them too, since archive.py moves rows column for column.
+The values are computed in Python (route_metrics.py) on every order write;
+rows that predate this migration keep leg_distances_km NULL until
+`python route_metrics.py backfill` fills them in.
+"""
+from database import ARCHIVE_SCHEMA
+from migrations import ops
+
+COLUMNS = [
+    ("route_distance_km", "FLOAT"),
+    ("bbox_min_lat", "FLOAT"),
+    ("bbox_min_lon", "FLOAT"),
+    ("bbox_max_lat", "FLOAT"),
+    ("bbox_max_lon", "FLOAT"),
+    ("leg_distances_km", "JSON"),  # JSON like route_geometry, not JSONB
+]
+
+
+def upgrade(engine):
+    for schema in (None, ARCHIVE_SCHEMA):
+        for column, ddl in COLUMNS:
+            ops.add_column(engine, "orders", column, ddl, schema=schema)
+
+    ops.create_index(engine, "ix_orders_route_distance_km", "orders", ["route_distance_km"])
+    ops.create_index(
+        engine, "ix_orders_bbox", "orders", ["bbox_min_lat", "bbox_max_lat", "bbox_min_lon", "bbox_max_lon"]
+    )
@@ -0,0 +1,28 @@
+"""
+Shard map and id allocator for orders sharded by customer (sharding.py).
+
+Every shard runs every migration, so these tables exist everywhere, but only
+shard 0's are read.
+"""
+from sqlalchemy import text
+
+from migrations import ops
+
+
+def upgrade(engine):
+    timestamp = "TIMESTAMP WITH TIME ZONE" if ops.is_postgres(engine) else "DATETIME"
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS customer_shards (
+                customer_id INTEGER NOT NULL PRIMARY KEY REFERENCES customers (id),
+                shard INTEGER NOT NULL,
+                moving_to INTEGER,
+                updated_at {timestamp} DEFAULT CURRENT_TIMESTAMP
+            )
+        """))
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS shard_id_blocks (
+                name VARCHAR(50) NOT NULL PRIMARY KEY,
+                next_id INTEGER NOT NULL
+            )
+        """))
@@ -0,0 +1,13 @@
+"""
+Indexes on orders.updated_at and stops.updated_at.
+
+The list endpoints' ETags include the newest stop change (a max() the index
+answers from its last entry), and incremental Parquet exports range over
+updated_at on both tables.
+"""
+from migrations import ops
+
+
+def upgrade(engine):
+    ops.create_index(engine, "ix_orders_updated_at", "orders", ["updated_at"])
+    ops.create_index(engine, "ix_stops_updated_at", "stops", ["updated_at"])
@@ -0,0 +1,127 @@
+"""
+status_events: append-only history of order and stop status changes.
+
+Triggers on orders and stops append a row when one is created and whenever
+its status changes, in the same transaction, for every write path. Statuses
+are stored as small integers (statuses.py; 0 for a value outside the
+vocabulary), and each row carries when the previous status was entered, so
+the time spent in a status is one row's changed_at - entered_at:
+
+  - ix_status_events_from (entity_type, from_status, changed_at, entered_at):
+    dwell time in a status over a period, from the index alone
+  - ix_status_events_to (entity_type, to_status, changed_at): how many
+    entered a status per period
+  - ix_status_events_entity (entity_type, entity_id, changed_at): one row's
+    history, and the entered_at lookup in the triggers
+  - ix_status_events_order (order_id, id): an order's and its stops' history
+
+Rows are never updated or deleted (archival leaves them; a shard move takes
+them along). Orders and stops that predate this migration have no history:
+their first change has no entered_at.
+"""
+from sqlalchemy import text
+
+from migrations import ops
+
+# Frozen copies of statuses.ORDER_STATUS_CODES / STOP_STATUS_CODES / ENTITY_CODES
+ORDER_CODES = {
+    "pending": 1, "assigned": 2, "in_progress": 3, "in_transit": 4,
+    "delivered": 5, "completed": 6, "cancelled": 7,
+}
+STOP_CODES = {"pending": 1, "arrived": 2, "in_progress": 3, "completed": 4, "failed": 5}
+ENTITIES = {"orders": (1, ORDER_CODES, "id"), "stops": (2, STOP_CODES, "order_id")}
+
+COLUMNS = "entity_type, entity_id, order_id, from_status, to_status, entered_at, changed_at"
+
+
+def _code(codes: dict, value: str) -> str:
+    whens = " ".join(f"WHEN '{name}' THEN {code}" for name, code in codes.items())
+    return f"CASE {value} {whens} ELSE 0 END"
+
+
+def _status(table: str, row: str) -> str:
+    # A stop's NULL status is pending
+    return f"COALESCE({row}.status, 'pending')" if table == "stops" else f"{row}.status"
+
+
+def _values(table: str, insert: bool, now: str) -> str:
+    entity, codes, order_column = ENTITIES[table]
+    if insert:
+        return f"{entity}, NEW.id, NEW.{order_column}, NULL, {_code(codes, _status(table, 'NEW'))}, NULL, {now}"
+    entered = f"(SELECT MAX(changed_at) FROM status_events WHERE entity_type = {entity} AND entity_id = NEW.id)"
+    return (
+        f"{entity}, NEW.id, NEW.{order_column}, {_code(codes, _status(table, 'OLD'))}, "
+        f"{_code(codes, _status(table, 'NEW'))}, {entered}, {now}"
+    )
+
+
+def _sqlite_triggers():
+    triggers = []
+    for table in ENTITIES:
+        triggers.append(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_status_events_{table}_insert AFTER INSERT ON {table}
+            BEGIN
+                INSERT INTO status_events ({COLUMNS}) VALUES ({_values(table, True, "CURRENT_TIMESTAMP")});
+            END
+        """)
+        triggers.append(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_status_events_{table}_update AFTER UPDATE OF status ON {table}
+            WHEN {_status(table, 'OLD')} IS NOT {_status(table, 'NEW')}
+            BEGIN
+                INSERT INTO status_events ({COLUMNS}) VALUES ({_values(table, False, "CURRENT_TIMESTAMP")});
+            END
+        """)
+    return triggers
+
+
+def _postgres_functions():
+    statements = []
+    for table in ENTITIES:
+        statements.append(f"""
+CREATE OR REPLACE FUNCTION trg_status_events_{table}() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO status_events ({COLUMNS}) VALUES ({_values(table, True, "now()")});
+    ELSIF {_status(table, 'OLD')} IS DISTINCT FROM {_status(table, 'NEW')} THEN
+        INSERT INTO status_events ({COLUMNS}) VALUES ({_values(table, False, "now()")});
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_status_events_{table} ON {table};
+CREATE TRIGGER trg_status_events_{table} AFTER INSERT OR UPDATE OF status ON {table}
+FOR EACH ROW EXECUTE FUNCTION trg_status_events_{table}();
+""")
+    return "\n".join(statements)
+
+
+def upgrade(engine):
+    postgres = ops.is_postgres(engine)
+    timestamp = "TIMESTAMP WITH TIME ZONE" if postgres else "DATETIME"
+
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS status_events (
+                id {"SERIAL PRIMARY KEY" if postgres else "INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT"},
+                entity_type SMALLINT NOT NULL,
+                entity_id INTEGER NOT NULL,
+                order_id INTEGER NOT NULL,
+                from_status SMALLINT,
+                to_status SMALLINT NOT NULL,
+                entered_at {timestamp},
+                changed_at {timestamp} NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """))
+        if postgres:
+            conn.execute(text(_postgres_functions()))
+        else:
+            for trigger in _sqlite_triggers():
+                conn.execute(text(trigger))
+
+    ops.create_index(
+        engine, "ix_status_events_from", "status_events", ["entity_type", "from_status", "changed_at", "entered_at"]
+    )
+    ops.create_index(engine, "ix_status_events_to", "status_events", ["entity_type", "to_status", "changed_at"])
+    ops.create_index(engine, "ix_status_events_entity", "status_events", ["entity_type", "entity_id", "changed_at"])
+    ops.create_index(engine, "ix_status_events_order", "status_events", ["order_id", "id"])
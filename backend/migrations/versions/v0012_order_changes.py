@@ -0,0 +1,76 @@
+"""
+order_changes: a count of committed writes to orders, stops and customers.
+
+The order list ETag is built from it (with the filtered set's count and newest
+updated_at), so it is the same on every worker and moves with every write,
+even one within the second that SQLite's CURRENT_TIMESTAMP resolves to. It is
+bumped by triggers in the writing transaction, so a reader sees it move
+together with the data.
+
+  - PostgreSQL: one bump per statement, into one of SLOTS rows picked by the
+    backend's pid, so concurrent writers rarely wait on the same row lock.
+    The counter is the sum of the slots.
+  - SQLite: writers are serialised anyway, so there is one slot, bumped per
+    row (SQLite has no statement triggers).
+"""
+from sqlalchemy import text
+
+from migrations import ops
+
+SLOTS = 16
+TABLES = ("orders", "stops", "customers")
+
+
+def _sqlite_triggers():
+    return [
+        f"""
+            CREATE TRIGGER IF NOT EXISTS trg_order_changes_{table}_{operation.lower()}
+            AFTER {operation} ON {table}
+            BEGIN
+                UPDATE order_changes SET changes = changes + 1 WHERE slot = 0;
+            END
+        """
+        for table in TABLES
+        for operation in ("INSERT", "UPDATE", "DELETE")
+    ]
+
+
+def _postgres_functions():
+    triggers = "\n".join(
+        f"""
+DROP TRIGGER IF EXISTS trg_order_changes_{table} ON {table};
+CREATE TRIGGER trg_order_changes_{table} AFTER INSERT OR UPDATE OR DELETE ON {table}
+FOR EACH STATEMENT EXECUTE FUNCTION trg_order_changes();
+"""
+        for table in TABLES
+    )
+    return f"""
+CREATE OR REPLACE FUNCTION trg_order_changes() RETURNS trigger AS $$
+BEGIN
+    UPDATE order_changes SET changes = changes + 1 WHERE slot = pg_backend_pid() % {SLOTS};
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+{triggers}"""
+
+
+def upgrade(engine):
+    postgres = ops.is_postgres(engine)
+    slots = SLOTS if postgres else 1
+
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS order_changes (
+                slot INTEGER NOT NULL PRIMARY KEY,
+                changes BIGINT NOT NULL DEFAULT 0
+            )
+        """))
+        present = set(conn.execute(text("SELECT slot FROM order_changes")).scalars())
+        for slot in range(slots):
+            if slot not in present:
+                conn.execute(text("INSERT INTO order_changes (slot, changes) VALUES (:slot, 0)"), {"slot": slot})
+        if postgres:
+            conn.execute(text(_postgres_functions()))
+        else:
+            for trigger in _sqlite_triggers():
+                conn.execute(text(trigger))
@@ -0,0 +1,83 @@
+"""
+Outbox recording is opt-in.
+
+The 0007 triggers wrote an outbox_events row for every insert, update and
+delete of orders, stops and customers - bulk loads, backfills and archival
+included - whether or not anything delivered them. They now only do so while
+outbox_settings.recording is set, which it isn't until the outbox worker
+starts (outbox.py) or `python outbox.py enable` is run. The check is one row
+of a one-row table per trigger.
+"""
+from sqlalchemy import text
+
+from migrations import ops
+from migrations.versions.v0007_outbox import OPERATIONS, OUTBOX_COLUMNS, SOURCES
+
+RECORDING = "(SELECT recording FROM outbox_settings WHERE id = 1)"
+
+
+def _sqlite_triggers():
+    triggers = []
+    for table, aggregate_type, aggregate_id, prefix, fields, previous in SOURCES:
+        for operation, suffix, row in OPERATIONS:
+            pairs = [f"'{key}', {row}.{column}" for key, column in fields]
+            if operation == "UPDATE":
+                pairs.append(f"'{previous[0]}', OLD.{previous[1]}")
+            triggers.append(f"DROP TRIGGER IF EXISTS trg_outbox_{table}_{operation.lower()}")
+            triggers.append(f"""
+                CREATE TRIGGER trg_outbox_{table}_{operation.lower()} AFTER {operation} ON {table}
+                WHEN {RECORDING} = 1
+                BEGIN
+                    INSERT INTO outbox_events ({OUTBOX_COLUMNS})
+                    VALUES ('{aggregate_type}', {row}.{aggregate_id}, '{prefix}.{suffix}', json_object({", ".join(pairs)}));
+                END
+            """)
+    return triggers
+
+
+def _postgres_functions():
+    statements = []
+    for table, aggregate_type, aggregate_id, prefix, fields, previous in SOURCES:
+        new_pairs = ", ".join(f"'{key}', NEW.{column}" for key, column in fields)
+        old_pairs = ", ".join(f"'{key}', OLD.{column}" for key, column in fields)
+        statements.append(f"""
+CREATE OR REPLACE FUNCTION trg_outbox_{table}() RETURNS trigger AS $$
+BEGIN
+    IF NOT COALESCE({RECORDING}, false) THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO outbox_events ({OUTBOX_COLUMNS})
+        VALUES ('{aggregate_type}', NEW.{aggregate_id}, '{prefix}.created', jsonb_build_object({new_pairs}));
+    ELSIF TG_OP = 'UPDATE' THEN
+        INSERT INTO outbox_events ({OUTBOX_COLUMNS})
+        VALUES ('{aggregate_type}', NEW.{aggregate_id}, '{prefix}.updated', jsonb_build_object({new_pairs}, '{previous[0]}', OLD.{previous[1]}));
+    ELSE
+        INSERT INTO outbox_events ({OUTBOX_COLUMNS})
+        VALUES ('{aggregate_type}', OLD.{aggregate_id}, '{prefix}.deleted', jsonb_build_object({old_pairs}));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+""")
+    return "\n".join(statements)
+
+
+def upgrade(engine):
+    postgres = ops.is_postgres(engine)
+
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS outbox_settings (
+                id INTEGER NOT NULL PRIMARY KEY,
+                recording {"BOOLEAN NOT NULL DEFAULT false" if postgres else "INTEGER NOT NULL DEFAULT 0"}
+            )
+        """))
+        if conn.execute(text("SELECT count(*) FROM outbox_settings")).scalar() == 0:
+            conn.execute(text("INSERT INTO outbox_settings (id) VALUES (1)"))
+        if postgres:
+            # The triggers themselves are unchanged; only their functions check the switch
+            conn.execute(text(_postgres_functions()))
+        else:
+            for trigger in _sqlite_triggers():
+                conn.execute(text(trigger))
@@ -0,0 +1,95 @@
+"""
+Bulk loads can skip the per-row insert triggers.
+
+The order_summaries, status_events and outbox triggers ran once per loaded
+order and stop - the summary was recomputed for every stop of an order - and
+were about half the cost of a bulk load. bulk_load.py now switches them off
+for its own write transactions and writes the summaries and status history
+of a whole chunk with one INSERT ... SELECT each (no outbox rows: a load is
+not an event).
+
+  - PostgreSQL: the triggers fire only WHEN the transaction hasn't set
+    fleet.bulk_load (SET LOCAL, so it ends with the transaction)
+  - SQLite: there are no session variables a trigger can read, so the loader
+    inserts a row into bulk_load_flag at the start of its transaction and
+    deletes it before committing; other connections never see it, and the
+    triggers check the (otherwise empty) table
+
+customer_order_stats (one row update per order) and order_changes keep
+running during loads.
+"""
+from sqlalchemy import text
+
+from migrations import ops
+from migrations.versions.v0006_order_summaries import ORDER_COLUMNS, STOP_COLUMNS, _sqlite_refresh
+from migrations.versions.v0007_outbox import OUTBOX_COLUMNS, SOURCES
+from migrations.versions.v0011_status_events import COLUMNS as STATUS_COLUMNS, ENTITIES, _values
+from migrations.versions.v0013_outbox_recording import RECORDING
+
+NOT_LOADING_SQLITE = "NOT EXISTS (SELECT 1 FROM bulk_load_flag)"
+NOT_LOADING_POSTGRES = "current_setting('fleet.bulk_load', true) IS DISTINCT FROM 'on'"
+
+
+def _sqlite_triggers():
+    # (name, table, body, extra condition) of every INSERT trigger the loader sets off
+    triggers = [
+        ("trg_order_summaries_order_insert", "orders", _sqlite_refresh("NEW.id"), None),
+        ("trg_order_summaries_stop_insert", "stops", _sqlite_refresh("NEW.order_id"), None),
+    ]
+    for table in ENTITIES:
+        triggers.append((
+            f"trg_status_events_{table}_insert", table,
+            f"INSERT INTO status_events ({STATUS_COLUMNS}) VALUES ({_values(table, True, 'CURRENT_TIMESTAMP')});",
+            None,
+        ))
+    for table, aggregate_type, aggregate_id, prefix, fields, _ in SOURCES:
+        pairs = ", ".join(f"'{key}', NEW.{column}" for key, column in fields)
+        triggers.append((
+            f"trg_outbox_{table}_insert", table,
+            f"INSERT INTO outbox_events ({OUTBOX_COLUMNS}) "
+            f"VALUES ('{aggregate_type}', NEW.{aggregate_id}, '{prefix}.created', json_object({pairs}));",
+            f"{RECORDING} = 1",
+        ))
+
+    statements = []
+    for name, table, body, condition in triggers:
+        when = NOT_LOADING_SQLITE if condition is None else f"{condition} AND {NOT_LOADING_SQLITE}"
+        statements.append(f"DROP TRIGGER IF EXISTS {name}")
+        statements.append(f"""
+            CREATE TRIGGER {name} AFTER INSERT ON {table}
+            WHEN {when}
+            BEGIN
+                {body}
+            END
+        """)
+    return statements
+
+
+def _postgres_triggers():
+    # The functions are unchanged; the triggers get a WHEN
+    triggers = [
+        ("trg_order_summaries_order", f"INSERT OR UPDATE OF {ORDER_COLUMNS} ON orders"),
+        ("trg_order_summaries_stop", f"INSERT OR DELETE OR UPDATE OF {STOP_COLUMNS} ON stops"),
+    ]
+    triggers += [(f"trg_status_events_{table}", f"INSERT OR UPDATE OF status ON {table}") for table in ENTITIES]
+    triggers += [(f"trg_outbox_{table}", f"INSERT OR UPDATE OR DELETE ON {table}") for table, *_ in SOURCES]
+    return "\n".join(
+        f"""
+DROP TRIGGER IF EXISTS {name} ON {event.rsplit(' ON ', 1)[1]};
+CREATE TRIGGER {name} AFTER {event}
+FOR EACH ROW WHEN ({NOT_LOADING_POSTGRES}) EXECUTE FUNCTION {name}();
+"""
+        for name, event in triggers
+    )
+
+
+def upgrade(engine):
+    postgres = ops.is_postgres(engine)
+
+    with engine.begin() as conn:
+        if postgres:
+            conn.execute(text(_postgres_triggers()))
+        else:
+            conn.execute(text("CREATE TABLE IF NOT EXISTS bulk_load_flag (id INTEGER NOT NULL PRIMARY KEY)"))
+            for statement in _sqlite_triggers():
+                conn.execute(text(statement))
@@ -1,7 +1,13 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, JSON
+from sqlalchemy import BigInteger, Boolean, Column, Integer, SmallInteger, String, Float, DateTime, ForeignKey, Text, JSON, Index, Table
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
-from database import Base
+from database import Base, ARCHIVE_SCHEMA
+
+# Orders in these statuses are finished: no ETAs, eligible for archival
+ORDER_TERMINAL_STATUSES = ("completed", "delivered", "cancelled")
+# Stops in these statuses are done; the next stop is the first one that isn't
+STOP_DONE_STATUSES = ("completed", "failed")
+
 
 class Customer(Base):
     __tablename__ = "customers"
@@ -16,13 +22,37 @@ class Customer(Base):
 
     # Relationships
     orders = relationship("Order", back_populates="customer")
+    order_stats = relationship("CustomerOrderStats", uselist=False, viewonly=True)
+
+    @property
+    def active_order_count(self):
+        return self.order_stats.active_order_count if self.order_stats else 0
+
+    @property
+    def last_order_at(self):
+        return self.order_stats.last_order_at if self.order_stats else None
+
+    # Type-ahead prefix search (text_pattern_ops / pg_trgm variants on PostgreSQL)
+    __table_args__ = (
+        Index("ix_customers_name_prefix", func.lower(name), id),
+        Index("ix_customers_email_prefix", func.lower(email)),
+    )
+
+
+class CustomerOrderStats(Base):
+    """Per-customer rollup, maintained by triggers on orders (migration 0005)"""
+    __tablename__ = "customer_order_stats"
+
+    customer_id = Column(Integer, ForeignKey("customers.id"), primary_key=True)
+    active_order_count = Column(Integer, nullable=False, default=0, server_default="0")
+    last_order_at = Column(DateTime(timezone=True))
 
 
 class Order(Base):
     __tablename__ = "orders"
 
     id = Column(Integer, primary_key=True, index=True)
-    customer_id = Column(Integer, ForeignKey("customers.id"), nullable=False)
+    customer_id = Column(Integer, ForeignKey("customers.id"), nullable=False, index=True)
     
     # Order details
     pickup_location = Column(String(255), nullable=False)
@@ -41,6 +71,14 @@ class Order(Base):
     
     # Route geometry - GeoJSON LineString
     route_geometry = Column(JSON)  # Store as GeoJSON: {"type": "LineString", "coordinates": [[lng, lat], ...]}
+
+    # Derived from route_geometry and the stops on every write (route_metrics.py)
+    route_distance_km = Column(Float)
+    bbox_min_lat = Column(Float)
+    bbox_min_lon = Column(Float)
+    bbox_max_lat = Column(Float)
+    bbox_max_lon = Column(Float)
+    leg_distances_km = Column(JSON)  # [km between stop 1 and 2, 2 and 3, ...]
     
     # Shipment information
     bill_of_lading = Column(String(100))
@@ -64,19 +102,33 @@ class Order(Base):
     status = Column(String(50), nullable=False, default="pending")
     
     # Timestamps
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
     updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
 
+    # Optimistic concurrency - bumped on every UPDATE, checked in the WHERE clause
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+
     # Relationships
     customer = relationship("Customer", back_populates="orders")
     stops = relationship("Stop", back_populates="order", cascade="all, delete-orphan")
 
+    archived = False
+
+    __table_args__ = (
+        Index("ix_orders_status_created_at", "status", "created_at"),
+        Index("ix_orders_route_distance_km", "route_distance_km"),
+        Index("ix_orders_bbox", "bbox_min_lat", "bbox_max_lat", "bbox_min_lon", "bbox_max_lon"),
+        # Newest change, for the list ETag and incremental exports
+        Index("ix_orders_updated_at", "updated_at"),
+    )
+    __mapper_args__ = {"version_id_col": version}
+
 
 class Stop(Base):
     __tablename__ = "stops"
 
     id = Column(Integer, primary_key=True, index=True)
-    order_id = Column(Integer, ForeignKey("orders.id"), nullable=False)
+    order_id = Column(Integer, ForeignKey("orders.id"), nullable=False, index=True)
     
     # Stop details
     sequence = Column(Integer, nullable=False)  # Order of stops in the route
@@ -100,5 +152,196 @@ class Stop(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
 
+    # Optimistic concurrency
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+
     # Relationships
     order = relationship("Order", back_populates="stops")
+
+    __table_args__ = (
+        Index("ix_stops_updated_at", "updated_at"),
+    )
+    __mapper_args__ = {"version_id_col": version}
+
+
+class OrderSummary(Base):
+    """
+    Read model for the order list: one row per live order with the customer
+    name, stop count and next pending stop. Maintained by triggers on orders,
+    stops and customers (migration 0006); check/rebuild with order_summaries.py.
+    """
+    __tablename__ = "order_summaries"
+
+    id = Column(Integer, ForeignKey("orders.id", ondelete="CASCADE"), primary_key=True)
+    customer_id = Column(Integer, nullable=False)
+    customer_name = Column(String(255))
+    pickup_location = Column(String(255), nullable=False)
+    delivery_location = Column(String(255), nullable=False)
+    pickup_date = Column(DateTime, nullable=False)
+    delivery_date = Column(DateTime, nullable=False)
+    cargo_type = Column(String(100), nullable=False)
+    vehicle_type = Column(String(100))
+    weight = Column(Float, nullable=False)
+    status = Column(String(50), nullable=False)
+    reference_number = Column(String(100))
+    created_at = Column(DateTime(timezone=True))
+    updated_at = Column(DateTime(timezone=True))
+    version = Column(Integer, nullable=False)
+    stop_count = Column(Integer, nullable=False, default=0, server_default="0")
+    next_stop_id = Column(Integer)
+    next_stop_sequence = Column(Integer)
+    next_stop_location = Column(String(255))
+    next_stop_scheduled_time = Column(DateTime)
+
+    # The list view's filter/sort combinations
+    __table_args__ = (
+        Index("ix_order_summaries_created_at", "created_at"),
+        Index("ix_order_summaries_updated_at", "updated_at"),
+        Index("ix_order_summaries_status_created_at", "status", "created_at"),
+        Index("ix_order_summaries_customer_created_at", "customer_id", "created_at"),
+    )
+
+
+class OutboxEvent(Base):
+    """
+    Change events written by triggers on orders, stops and customers in the
+    same transaction as the change (migration 0007) while recording is on
+    (OutboxSettings), drained by outbox.py. Stop events carry their order as
+    the aggregate, so one order's events are delivered in id order.
+    """
+    __tablename__ = "outbox_events"
+
+    id = Column(Integer, primary_key=True)
+    aggregate_type = Column(String(50), nullable=False)
+    aggregate_id = Column(Integer, nullable=False)
+    event_type = Column(String(100), nullable=False)
+    payload = Column(JSON, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    available_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    last_error = Column(Text)
+    # Set when delivery was given up after OUTBOX_MAX_ATTEMPTS (dead letter)
+    failed_at = Column(DateTime(timezone=True))
+
+    # Delivered events are deleted, so these only cover the backlog
+    __table_args__ = (
+        Index(
+            "ix_outbox_events_pending", "id",
+            sqlite_where=failed_at.is_(None),
+            postgresql_where=failed_at.is_(None),
+        ),
+        Index(
+            "ix_outbox_events_aggregate_pending", "aggregate_type", "aggregate_id", "id",
+            sqlite_where=failed_at.is_(None),
+            postgresql_where=failed_at.is_(None),
+        ),
+        # Never reuse an id, so receivers can deduplicate on it
+        {"sqlite_autoincrement": True},
+    )
+
+
+class OutboxSettings(Base):
+    """One row (id 1): whether the outbox triggers record events (migration 0013)"""
+    __tablename__ = "outbox_settings"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    recording = Column(Boolean, nullable=False, default=False)
+
+
+class StatusEvent(Base):
+    """
+    Order and stop status changes, appended by triggers (migration 0011) and
+    by bulk_load.py for the rows it loads. Statuses are the integer codes of
+    statuses.py; entered_at is when the from_status began, so changed_at -
+    entered_at is the time spent in it.
+    """
+    __tablename__ = "status_events"
+
+    id = Column(Integer, primary_key=True)
+    entity_type = Column(SmallInteger, nullable=False)  # statuses.ENTITY_CODES
+    entity_id = Column(Integer, nullable=False)
+    order_id = Column(Integer, nullable=False)  # the stop's order, for a stop
+    from_status = Column(SmallInteger)  # NULL when the row was created
+    to_status = Column(SmallInteger, nullable=False)
+    entered_at = Column(DateTime(timezone=True))
+    changed_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index("ix_status_events_from", "entity_type", "from_status", "changed_at", "entered_at"),
+        Index("ix_status_events_to", "entity_type", "to_status", "changed_at"),
+        Index("ix_status_events_entity", "entity_type", "entity_id", "changed_at"),
+        Index("ix_status_events_order", "order_id", "id"),
+        {"sqlite_autoincrement": True},
+    )
+
+
+class OrderChanges(Base):
+    """
+    Committed writes to orders, stops and customers, counted by triggers
+    (migration 0012); the sum over the slots is the order list's change counter.
+    """
+    __tablename__ = "order_changes"
+
+    slot = Column(Integer, primary_key=True, autoincrement=False)
+    changes = Column(BigInteger, nullable=False, default=0)
+
+
+class CustomerShard(Base):
+    """Which shard holds a customer's orders (sharding.py). Only read on shard 0."""
+    __tablename__ = "customer_shards"
+
+    customer_id = Column(Integer, ForeignKey("customers.id"), primary_key=True)
+    shard = Column(Integer, nullable=False)
+    # Set while the customer is being moved; writes for it are refused until the move ends
+    moving_to = Column(Integer)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class ShardIdBlock(Base):
+    """Next unhanded id per table, so order and stop ids are unique across shards. Shard 0 only."""
+    __tablename__ = "shard_id_blocks"
+
+    name = Column(String(50), primary_key=True)
+    next_id = Column(Integer, nullable=False)
+
+
+# ============= Archive =============
+# Delivered/cancelled orders are moved here by archive.py. The archive tables
+# mirror the live ones column for column (no foreign keys or secondary
+# indexes); on PostgreSQL they are partitioned by created_at month, which is
+# why the partition key is part of the primary key.
+
+def _archive_columns(source, primary_key, *extra):
+    columns = [Column(c.name, c.type, nullable=c.nullable) for c in source.columns] + list(extra)
+    for c in columns:
+        if c.name in primary_key:
+            c.primary_key = True
+            c.nullable = False
+    return columns
+
+
+class ArchivedOrder(Base):
+    __table__ = Table(
+        "orders", Base.metadata,
+        *_archive_columns(Order.__table__, ("id", "created_at"), Column("archived_at", DateTime(timezone=True))),
+        Index("ix_archive_orders_customer_id", "customer_id"),
+        Index("ix_archive_orders_created_at", "created_at"),
+        schema=ARCHIVE_SCHEMA
+    )
+    archived = True
+
+    customer = relationship(
+        Customer, primaryjoin="foreign(ArchivedOrder.customer_id) == Customer.id", viewonly=True
+    )
+    stops = relationship(
+        "ArchivedStop", primaryjoin="ArchivedOrder.id == foreign(ArchivedStop.order_id)", viewonly=True
+    )
+
+
+class ArchivedStop(Base):
+    __table__ = Table(
+        "stops", Base.metadata,
+        *_archive_columns(Stop.__table__, ("id", "order_created_at"), Column("order_created_at", DateTime(timezone=True))),
+        Index("ix_archive_stops_order_id", "order_id"),
+        schema=ARCHIVE_SCHEMA
+    )
@@ -0,0 +1,264 @@
+"""
+Prebuilt statements for the order list and detail endpoints.
+
+Building an ORM query per request (options, filters, ordering) costs more CPU
+than running it: SQLAlchemy has to construct the statement and derive its
+cache key before it can even look up the compiled SQL. Here every combination
+of filters and sort is built once, with bound parameters for the values, and
+reused - so a request only binds values and hits the compiled cache.
+
+A shape is which filters are present plus the sort column and direction:
+64 filter combinations x 4 sort columns x 2 directions per table - only the
+shapes that are actually requested get built. Pages are ordered by (sort key,
+id), so pages from several shards merge into one order (sharding.py).
+"""
+from datetime import datetime
+from functools import lru_cache
+
+from sqlalchemy import bindparam, exists, func, literal, select, tuple_, union_all
+from sqlalchemy.orm import joinedload
+
+from models import Order, Stop, ArchivedOrder, ArchivedStop, OrderChanges, OrderSummary
+
+SORT_COLUMNS = ("created_at", "updated_at", "status", "id")
+SORT_ORDERS = ("asc", "desc")
+# Ids per IN list for the batch read, well under SQLite's bound-parameter limit
+BATCH_GET_CHUNK_SIZE = 500
+
+
+def _direction(column, sort_order):
+    return column.desc() if sort_order == "desc" else column.asc()
+
+
+def _ordering(model, sort_by, sort_order):
+    return _direction(getattr(model, sort_by), sort_order), _direction(model.id, sort_order)
+
+
+def route_filters(model, has_min_distance: bool, has_max_distance: bool, has_bbox: bool):
+    """Distance range and bounding-box overlap on the precomputed route columns (route_metrics.py)"""
+    clauses = []
+    if has_min_distance:
+        clauses.append(model.route_distance_km >= bindparam("min_distance"))
+    if has_max_distance:
+        clauses.append(model.route_distance_km <= bindparam("max_distance"))
+    if has_bbox:
+        clauses += [
+            model.bbox_min_lat <= bindparam("bbox_north"),
+            model.bbox_max_lat >= bindparam("bbox_south"),
+            model.bbox_min_lon <= bindparam("bbox_east"),
+            model.bbox_max_lon >= bindparam("bbox_west"),
+        ]
+    return clauses
+
+
+def order_filters(model, has_search: bool, has_status: bool, has_customer: bool,
+                  has_min_distance: bool = False, has_max_distance: bool = False, has_bbox: bool = False):
+    """WHERE clauses for a filter shape; values are bound by order_filter_params()"""
+    clauses = []
+    if has_search:
+        term = bindparam("search_term")
+        clauses.append(
+            model.pickup_location.ilike(term) |
+            model.delivery_location.ilike(term) |
+            model.cargo_type.ilike(term) |
+            model.reference_number.ilike(term)
+        )
+    if has_status:
+        clauses.append(model.status == bindparam("status"))
+    if has_customer:
+        clauses.append(model.customer_id == bindparam("customer_id"))
+    route = (has_min_distance, has_max_distance, has_bbox)
+    if any(route):
+        if model is OrderSummary:
+            # The read model doesn't carry the route columns - check them on the order
+            clauses.append(exists().where(Order.id == OrderSummary.id, *route_filters(Order, *route)))
+        else:
+            clauses += route_filters(model, *route)
+    return clauses
+
+
+def order_filter_params(search, status, customer_id, min_distance=None, max_distance=None, bbox=None):
+    """
+    (shape flags, bind values) for the filters of a request. `bbox` is
+    (west, south, east, north) in degrees.
+    """
+    shape = (
+        bool(search), bool(status), bool(customer_id),
+        min_distance is not None, max_distance is not None, bbox is not None
+    )
+    params = {}
+    if search:
+        params["search_term"] = f"%{search}%"
+    if status:
+        params["status"] = status
+    if customer_id:
+        params["customer_id"] = customer_id
+    if min_distance is not None:
+        params["min_distance"] = min_distance
+    if max_distance is not None:
+        params["max_distance"] = max_distance
+    if bbox is not None:
+        params["bbox_west"], params["bbox_south"], params["bbox_east"], params["bbox_north"] = bbox
+    return shape, params
+
+
+@lru_cache(maxsize=None)
+def order_list_statement(model, *shape_and_sort):
+    """One page of orders with customer and stops; binds offset and limit"""
+    *shape, sort_by, sort_order = shape_and_sort
+    return (
+        select(model)
+        .options(joinedload(model.customer), joinedload(model.stops))
+        .where(*order_filters(model, *shape))
+        .order_by(*_ordering(model, sort_by, sort_order))
+        .offset(bindparam("offset"))
+        .limit(bindparam("limit"))
+    )
+
+
+@lru_cache(maxsize=None)
+def order_summary_list_statement(*shape_and_sort):
+    """One page of order_summaries rows - no joins; binds offset and limit"""
+    *shape, sort_by, sort_order = shape_and_sort
+    return (
+        select(OrderSummary)
+        .where(*order_filters(OrderSummary, *shape))
+        .order_by(*_ordering(OrderSummary, sort_by, sort_order))
+        .offset(bindparam("offset"))
+        .limit(bindparam("limit"))
+    )
+
+
+@lru_cache(maxsize=None)
+def order_keyset_statement(model, *shape_and_sort):
+    """
+    The page after a given row of orders (with customer and stops) or
+    order_summaries; binds after_key (see keyset_value), after_id and limit
+    """
+    *shape, sort_by, sort_order = shape_and_sort
+    after = tuple_(getattr(model, sort_by), model.id)
+    bound = tuple_(bindparam("after_key"), bindparam("after_id"))
+    statement = select(model)
+    if model is not OrderSummary:
+        statement = statement.options(joinedload(model.customer), joinedload(model.stops))
+    return (
+        statement
+        .where(*order_filters(model, *shape), after < bound if sort_order == "desc" else after > bound)
+        .order_by(*_ordering(model, sort_by, sort_order))
+        .limit(bindparam("limit"))
+    )
+
+
+def keyset_value(value, dialect_name: str):
+    """
+    A sort key as after_key. SQLite compares the stored datetime text, which
+    has no fraction when CURRENT_TIMESTAMP wrote it, so it gets the same text.
+    """
+    if isinstance(value, datetime) and dialect_name == "sqlite":
+        return value.strftime("%Y-%m-%d %H:%M:%S.%f" if value.microsecond else "%Y-%m-%d %H:%M:%S")
+    return value
+
+
+@lru_cache(maxsize=None)
+def order_count_statement(model, *shape):
+    return (
+        select(func.count())
+        .select_from(model)
+        .where(*order_filters(model, *shape))
+    )
+
+
+@lru_cache(maxsize=None)
+def order_list_validator_statement(model, *shape):
+    """
+    (count, max updated_at) of the filtered set: the total and, with the
+    shard's order_changes counter, the inputs of the list ETag in one pass
+    """
+    return (
+        select(func.count(), func.max(model.updated_at))
+        .select_from(model)
+        .where(*order_filters(model, *shape))
+    )
+
+
+# Every committed write to orders, stops or customers moves it (migration 0012),
+# including one within the second that updated_at resolves to on SQLite
+order_changes_statement = select(func.coalesce(func.sum(OrderChanges.changes), 0))
+
+
+@lru_cache(maxsize=None)
+def order_validator_statement(model):
+    """(version, updated_at, sum of stop versions, max stop updated_at) of one order; binds order_id"""
+    stop_model = ArchivedStop if model is ArchivedOrder else Stop
+    return (
+        select(
+            model.version, model.updated_at,
+            func.coalesce(func.sum(stop_model.version), 0), func.max(stop_model.updated_at)
+        )
+        .select_from(model)
+        .outerjoin(stop_model, stop_model.order_id == model.id)
+        .where(model.id == bindparam("order_id"))
+        .group_by(model.id, model.version, model.updated_at)
+    )
+
+
+@lru_cache(maxsize=None)
+def order_detail_statement(model):
+    """One order with customer and stops; binds order_id"""
+    return (
+        select(model)
+        .options(joinedload(model.customer), joinedload(model.stops))
+        .where(model.id == bindparam("order_id"))
+    )
+
+
+@lru_cache(maxsize=None)
+def orders_by_id_statement(model):
+    """Orders with customer and stops (or order_summaries rows) for an expanding list of ids"""
+    statement = select(model)
+    if model is not OrderSummary:
+        statement = statement.options(joinedload(model.customer), joinedload(model.stops))
+    return statement.where(model.id.in_(bindparam("ids", expanding=True)))
+
+
+@lru_cache(maxsize=None)
+def combined_order_statements(*shape_and_sort):
+    """
+    (count, page) over live and archived orders. The UNION ALL only carries
+    (id, sort key, source); the page binds offset and limit.
+    """
+    *shape, sort_by, sort_order = shape_and_sort
+
+    def keys(model, archived):
+        return select(
+            model.id.label("id"),
+            getattr(model, sort_by).label("sort_key"),
+            literal(archived).label("archived")
+        ).where(*order_filters(model, *shape))
+
+    combined = union_all(keys(Order, False), keys(ArchivedOrder, True)).subquery()
+    count = select(func.count()).select_from(combined)
+    page = (
+        select(combined.c.id, combined.c.archived)
+        .order_by(_direction(combined.c.sort_key, sort_order), _direction(combined.c.id, sort_order))
+        .offset(bindparam("offset"))
+        .limit(bindparam("limit"))
+    )
+    return count, page
+
+
+def template_cache_info():
+    return {
+        name: fn.cache_info()._asdict()
+        for name, fn in (
+            ("order_list", order_list_statement),
+            ("order_summary_list", order_summary_list_statement),
+            ("order_keyset", order_keyset_statement),
+            ("order_count", order_count_statement),
+            ("order_list_validator", order_list_validator_statement),
+            ("order_validator", order_validator_statement),
+            ("order_detail", order_detail_statement),
+            ("orders_by_id", orders_by_id_statement),
+            ("combined_orders", combined_order_statements),
+        )
+    }
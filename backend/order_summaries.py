@@ -0,0 +1,137 @@
+"""
+Consistency check and rebuild for the order_summaries read model.
+
+The triggers from migration 0006 keep order_summaries in step with orders,
+stops and customers. This module recomputes what the table should contain
+from the source tables, reports rows that differ, and rewrites them:
+
+    python order_summaries.py check            # exit status 1 on drift
+    python order_summaries.py check --repair   # rewrite only the drifted rows
+    python order_summaries.py rebuild          # rewrite everything, in chunks
+
+Rebuild works in id chunks, each in its own short transaction, so the API
+keeps serving (and the triggers keep maintaining the table) while it runs.
+"""
+import argparse
+import os
+import sys
+
+from sqlalchemy import and_, delete, except_, func, insert, literal_column, select, union
+
+from database import engine
+from models import Customer, Order, OrderSummary, Stop, STOP_DONE_STATUSES
+
+REBUILD_CHUNK_SIZE = int(os.getenv("ORDER_SUMMARY_REBUILD_CHUNK_SIZE", "5000"))
+
+SUMMARY_COLUMNS = [c.name for c in OrderSummary.__table__.columns]
+
+
+def expected_summaries(*where):
+    """SELECT producing the rows order_summaries should hold, in SUMMARY_COLUMNS order"""
+    next_stop_id = (
+        select(Stop.id)
+        .where(Stop.order_id == Order.id, func.coalesce(Stop.status, "pending").notin_(STOP_DONE_STATUSES))
+        .order_by(Stop.sequence, Stop.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    stop_count = select(func.count()).select_from(Stop).where(Stop.order_id == Order.id).scalar_subquery()
+    next_stop = Stop.__table__.alias("next_stop")
+    columns = [
+        Order.id, Order.customer_id, Customer.name, Order.pickup_location, Order.delivery_location,
+        Order.pickup_date, Order.delivery_date, Order.cargo_type, Order.vehicle_type, Order.weight,
+        Order.status, Order.reference_number, Order.created_at, Order.updated_at, Order.version,
+        stop_count, next_stop.c.id, next_stop.c.sequence, next_stop.c.location, next_stop.c.scheduled_time,
+    ]
+    return (
+        select(*[column.label(name) for column, name in zip(columns, SUMMARY_COLUMNS)])
+        .select_from(Order)
+        .outerjoin(Customer, Customer.id == Order.customer_id)
+        .outerjoin(next_stop, next_stop.c.id == next_stop_id)
+        .where(*where)
+    )
+
+
+def _actual(*where):
+    return select(*[OrderSummary.__table__.c[name] for name in SUMMARY_COLUMNS]).where(*where)
+
+
+def find_drift(conn, low: int = None, high: int = None, limit: int = None):
+    """Ids whose summary is missing, stale or orphaned, optionally within [low, high)"""
+    order_range, summary_range = [], []
+    if low is not None:
+        order_range.append(Order.id >= low)
+        summary_range.append(OrderSummary.id >= low)
+    if high is not None:
+        order_range.append(Order.id < high)
+        summary_range.append(OrderSummary.id < high)
+    expected = expected_summaries(*order_range)
+    actual = _actual(*summary_range)
+    differences = union(
+        select(literal_column("id")).select_from(except_(expected, actual).subquery()),
+        select(literal_column("id")).select_from(except_(actual, expected).subquery()),
+    ).subquery()
+    query = select(differences.c.id).order_by(differences.c.id)
+    if limit is not None:
+        query = query.limit(limit)
+    return [row.id for row in conn.execute(query)]
+
+
+def rewrite(conn, where_orders, where_summaries):
+    conn.execute(delete(OrderSummary).where(where_summaries))
+    conn.execute(insert(OrderSummary.__table__).from_select(SUMMARY_COLUMNS, expected_summaries(where_orders)))
+
+
+def _id_chunks(chunk_size: int):
+    with engine.connect() as conn:
+        high = max(
+            conn.execute(select(func.max(Order.id))).scalar() or 0,
+            conn.execute(select(func.max(OrderSummary.id))).scalar() or 0,
+        )
+    for low in range(0, high + 1, chunk_size):
+        yield low, low + chunk_size
+
+
+def check(repair: bool = False, chunk_size: int = REBUILD_CHUNK_SIZE, log=print) -> list:
+    """Return the drifted ids (after repairing them, with `repair`)"""
+    drifted = []
+    for low, high in _id_chunks(chunk_size):
+        with engine.begin() as conn:
+            ids = find_drift(conn, low, high)
+            if ids and repair:
+                rewrite(conn, Order.id.in_(ids), OrderSummary.id.in_(ids))
+        drifted.extend(ids)
+    if drifted:
+        shown = ", ".join(str(i) for i in drifted[:20]) + (" ..." if len(drifted) > 20 else "")
+        log(f"  {len(drifted)} order summaries {'repaired' if repair else 'out of date'}: {shown}")
+    return drifted
+
+
+def rebuild(chunk_size: int = REBUILD_CHUNK_SIZE, log=print) -> int:
+    """Recompute every summary row; returns the number of live orders"""
+    for low, high in _id_chunks(chunk_size):
+        with engine.begin() as conn:
+            rewrite(
+                conn,
+                and_(Order.id >= low, Order.id < high),
+                and_(OrderSummary.id >= low, OrderSummary.id < high),
+            )
+        log(f"  rebuilt ids {low}..{high - 1}")
+    with engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(OrderSummary)).scalar()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check or rebuild the order_summaries read model")
+    parser.add_argument("command", choices=["check", "rebuild"])
+    parser.add_argument("--repair", action="store_true", help="with check: rewrite drifted rows")
+    parser.add_argument("--chunk-size", type=int, default=REBUILD_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    if args.command == "rebuild":
+        print(f"✅ Rebuilt {rebuild(args.chunk_size)} order summaries")
+    else:
+        drifted = check(args.repair, args.chunk_size)
+        if drifted and not args.repair:
+            sys.exit(1)
+        print("✅ Order summaries are consistent" if not drifted else "✅ Order summaries repaired")
@@ -0,0 +1,346 @@
+"""
+Delivery of outbox events to side-effect handlers.
+
+Triggers from migration 0007 append an outbox_events row for every change to
+orders, stops and customers, in the same transaction as the change, while
+recording is on (migration 0013). Request handlers therefore only pay for the
+core commit; webhooks, cache invalidation, search indexing and the like run
+here, after the fact:
+
+    from outbox import register
+    register("order.updated", reindex_order)      # or "order.*", or "*"
+
+The worker delivers due events in id order, in batches of OUTBOX_BATCH_SIZE.
+Delivery is at-least-once: an event is deleted once every handler for it has
+returned, and a failure retries the whole event after an exponential backoff
+(OUTBOX_RETRY_BASE_SECONDS doubling up to OUTBOX_RETRY_MAX_SECONDS), so
+handlers must be idempotent - the event id is stable for deduplication.
+After OUTBOX_MAX_ATTEMPTS the event is dead-lettered (failed_at is set).
+
+Events of one aggregate (an order with its stops, or a customer) are
+delivered in id order: while an aggregate has an event waiting for a retry,
+its later events wait too. That needs a single deliverer, so each process
+first takes a lock - a PostgreSQL advisory lock, or a lock file next to the
+SQLite database - and only the holder delivers; the others stand by. On
+SQLite, id order is commit order (one writer at a time). On PostgreSQL it is
+best-effort: two concurrent transactions on one order (say, status updates of
+two of its stops) draw ids before either commits and may commit the other way
+round, so the later id can be delivered first. Handlers that must not apply an
+older state over a newer one compare the payload's `version`.
+
+Recording and delivery are opt-in, as every write pays for the event row:
+the API runs the worker in the background when OUTBOX_WORKER_ENABLED=true,
+one per shard (sharding.py) with a lock each, and a starting worker turns
+recording on. It can also run on its own, or be drained once, for the
+DATABASE_URL database:
+
+    python outbox.py run | drain | status | retry-failed | enable | disable
+
+`disable` stops recording (until a worker starts again); events already
+recorded are still delivered.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List
+
+import httpx
+from sqlalchemy import Connection, bindparam, delete, exists, func, select, text, update
+from sqlalchemy.orm import aliased
+
+from database import engine, memory_database
+from models import OutboxEvent, OutboxSettings
+
+try:
+    import fcntl
+except ImportError:  # POSIX only; without it the lock file is skipped
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_WORKER_ENABLED = os.getenv("OUTBOX_WORKER_ENABLED", "false").lower() in ("1", "true", "yes")
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_POLL_INTERVAL_MS = int(os.getenv("OUTBOX_POLL_INTERVAL_MS", "500"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+OUTBOX_RETRY_BASE_SECONDS = float(os.getenv("OUTBOX_RETRY_BASE_SECONDS", "1"))
+OUTBOX_RETRY_MAX_SECONDS = float(os.getenv("OUTBOX_RETRY_MAX_SECONDS", "300"))
+# Every event is POSTed here as JSON when set
+OUTBOX_WEBHOOK_URL = os.getenv("OUTBOX_WEBHOOK_URL", "")
+OUTBOX_WEBHOOK_TIMEOUT_SECONDS = float(os.getenv("OUTBOX_WEBHOOK_TIMEOUT_SECONDS", "5"))
+
+# Arbitrary key for pg_try_advisory_lock, distinct from the migration lock
+OUTBOX_LOCK_KEY = 727275
+
+Handler = Callable[[dict], None]
+_handlers: Dict[str, List[Handler]] = {}
+
+
+def register(event_type: str, handler: Handler):
+    """Call handler(event) for `event_type` ("order.updated"), a family ("order.*") or everything ("*")"""
+    _handlers.setdefault(event_type, []).append(handler)
+
+
+def handlers_for(event_type: str) -> List[Handler]:
+    family = event_type.split(".", 1)[0] + ".*"
+    return _handlers.get(event_type, []) + _handlers.get(family, []) + _handlers.get("*", [])
+
+
+def post_webhook(event: dict):
+    response = httpx.post(
+        OUTBOX_WEBHOOK_URL,
+        json={**event, "created_at": event["created_at"].isoformat()},
+        headers={"Idempotency-Key": f"outbox-{event['id']}"},
+        timeout=OUTBOX_WEBHOOK_TIMEOUT_SECONDS,
+    )
+    response.raise_for_status()
+
+
+if OUTBOX_WEBHOOK_URL:
+    register("*", post_webhook)
+
+
+def _due_events_statement():
+    """Due events whose aggregate has no earlier event still waiting for a retry, oldest first"""
+    earlier = aliased(OutboxEvent)
+    waiting = (
+        select(earlier.id)
+        .where(
+            earlier.aggregate_type == OutboxEvent.aggregate_type,
+            earlier.aggregate_id == OutboxEvent.aggregate_id,
+            earlier.failed_at.is_(None),
+            earlier.id < OutboxEvent.id,
+            earlier.available_at > bindparam("now"),
+        )
+    )
+    return (
+        select(
+            OutboxEvent.id, OutboxEvent.aggregate_type, OutboxEvent.aggregate_id,
+            OutboxEvent.event_type, OutboxEvent.payload, OutboxEvent.created_at, OutboxEvent.attempts,
+        )
+        .where(OutboxEvent.failed_at.is_(None), OutboxEvent.available_at <= bindparam("now"), ~exists(waiting))
+        .order_by(OutboxEvent.id)
+        .limit(bindparam("limit"))
+    )
+
+
+DUE_EVENTS = _due_events_statement()
+
+
+def set_recording(recording: bool, bind=engine):
+    """Turn the outbox triggers on or off for every writer of `bind`"""
+    with bind.begin() as conn:
+        conn.execute(update(OutboxSettings).where(OutboxSettings.id == 1).values(recording=recording))
+
+
+def is_recording(conn) -> bool:
+    return bool(conn.execute(select(OutboxSettings.recording).where(OutboxSettings.id == 1)).scalar())
+
+
+def retry_delay(attempts: int) -> float:
+    return min(OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1), OUTBOX_RETRY_MAX_SECONDS)
+
+
+def acquire_leadership(bind=engine):
+    """A handle to pass to release_leadership() if this process may deliver from `bind`, else None"""
+    if bind.dialect.name == "postgresql":
+        conn = bind.connect().execution_options(isolation_level="AUTOCOMMIT")
+        if conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": OUTBOX_LOCK_KEY}).scalar():
+            return conn
+        conn.close()
+        return None
+
+    database = bind.url.database
+    if fcntl is None or memory_database is not None or not database or database == ":memory:":
+        return True
+    lock_file = open(database + ".outbox.lock", "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def release_leadership(handle):
+    if isinstance(handle, Connection):
+        try:
+            handle.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": OUTBOX_LOCK_KEY})
+        finally:
+            handle.close()
+    elif handle is not True:
+        handle.close()
+
+
+class OutboxWorker:
+    """Delivers the outbox events of one database in batches while this process holds its delivery lock"""
+
+    def __init__(self, bind=engine, batch_size: int = OUTBOX_BATCH_SIZE,
+                 poll_interval_ms: int = OUTBOX_POLL_INTERVAL_MS):
+        self.bind = bind
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval_ms / 1000
+        self.leader = False
+
+        # Counters for observability
+        self.delivered = 0
+        self.retried = 0
+        self.dead_lettered = 0
+        self.batches = 0
+
+    def drain_batch(self) -> int:
+        """Deliver one batch of due events. Returns how many were attempted."""
+        # "now" is bound rather than CURRENT_TIMESTAMP, which SQLite truncates to seconds
+        now = datetime.now(timezone.utc)
+        with self.bind.connect() as conn:
+            events = [dict(row) for row in conn.execute(DUE_EVENTS, {"now": now, "limit": self.batch_size}).mappings()]
+        if not events:
+            return 0
+
+        delivered, failures, blocked = [], [], set()
+        for event in events:
+            aggregate = (event["aggregate_type"], event["aggregate_id"])
+            if aggregate in blocked:
+                continue  # an earlier event of this aggregate just failed
+            try:
+                for handler in handlers_for(event["event_type"]):
+                    handler(event)
+            except Exception as e:
+                logger.warning("Outbox event %d (%s) failed: %r", event["id"], event["event_type"], e)
+                failures.append((event, e))
+                blocked.add(aggregate)
+            else:
+                delivered.append(event["id"])
+
+        now = datetime.now(timezone.utc)
+        with self.bind.begin() as conn:
+            if delivered:
+                conn.execute(delete(OutboxEvent).where(OutboxEvent.id.in_(delivered)))
+            for event, error in failures:
+                attempts = event["attempts"] + 1
+                dead = attempts >= OUTBOX_MAX_ATTEMPTS
+                conn.execute(
+                    update(OutboxEvent)
+                    .where(OutboxEvent.id == event["id"])
+                    .values(
+                        attempts=attempts,
+                        available_at=now + timedelta(seconds=retry_delay(attempts)),
+                        last_error=repr(error)[:1000],
+                        failed_at=now if dead else None,
+                    )
+                )
+                if dead:
+                    self.dead_lettered += 1
+                    logger.error("Outbox event %d dead-lettered after %d attempts", event["id"], attempts)
+                else:
+                    self.retried += 1
+
+        self.batches += 1
+        self.delivered += len(delivered)
+        return len(delivered) + len(failures)
+
+    def drain(self) -> int:
+        """Deliver batches until nothing is due. Returns how many were delivered."""
+        before = self.delivered
+        while self.drain_batch():
+            pass
+        return self.delivered - before
+
+    async def run(self, stop_event: asyncio.Event):
+        """Background loop for the API process. Batches run in a worker thread."""
+        handle = None
+        recording = False
+        try:
+            while not stop_event.is_set():
+                try:
+                    if not recording:
+                        # Every worker, leader or not: it is here to deliver what gets recorded
+                        await asyncio.to_thread(set_recording, True, self.bind)
+                        recording = True
+                    if handle is None:
+                        handle = await asyncio.to_thread(acquire_leadership, self.bind)
+                        self.leader = handle is not None
+                    if handle is not None:
+                        while not stop_event.is_set() and await asyncio.to_thread(self.drain_batch):
+                            pass
+                except Exception:
+                    logger.exception("Outbox delivery failed; retrying next interval")
+                try:
+                    await asyncio.wait_for(stop_event.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            if handle is not None:
+                await asyncio.to_thread(release_leadership, handle)
+                self.leader = False
+
+    def stats(self) -> dict:
+        return {
+            "leader": self.leader,
+            "delivered": self.delivered,
+            "retried": self.retried,
+            "dead_lettered": self.dead_lettered,
+            "batches": self.batches,
+        }
+
+
+def backlog(conn) -> dict:
+    """Undelivered and dead-lettered event counts, and the age of the oldest undelivered event"""
+    pending, oldest = conn.execute(
+        select(func.count(), func.min(OutboxEvent.created_at)).where(OutboxEvent.failed_at.is_(None))
+    ).one()
+    failed = conn.execute(select(func.count()).where(OutboxEvent.failed_at.is_not(None))).scalar()
+    recording = is_recording(conn)
+    if oldest is not None and oldest.tzinfo is None:
+        oldest = oldest.replace(tzinfo=timezone.utc)  # SQLite returns naive UTC
+    return {
+        "recording": recording,
+        "pending": pending,
+        "failed": failed,
+        "oldest_pending_seconds": (datetime.now(timezone.utc) - oldest).total_seconds() if oldest else None,
+    }
+
+
+def retry_failed() -> int:
+    """Put dead-lettered events back in the queue; returns how many"""
+    with engine.begin() as conn:
+        return conn.execute(
+            update(OutboxEvent)
+            .where(OutboxEvent.failed_at.is_not(None))
+            .values(failed_at=None, attempts=0, available_at=func.now())
+        ).rowcount
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Deliver outbox events")
+    parser.add_argument("command", choices=["run", "drain", "status", "retry-failed", "enable", "disable"])
+    parser.add_argument("--batch-size", type=int, default=OUTBOX_BATCH_SIZE)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    worker = OutboxWorker(engine, args.batch_size)
+    if args.command == "status":
+        with engine.connect() as conn:
+            print(backlog(conn))
+    elif args.command in ("enable", "disable"):
+        set_recording(args.command == "enable")
+        print(f"✅ Outbox recording {args.command}d")
+    elif args.command == "retry-failed":
+        print(f"✅ Requeued {retry_failed()} dead-lettered events")
+    elif args.command == "drain":
+        handle = acquire_leadership()
+        if handle is None:
+            raise SystemExit("Another process is delivering outbox events")
+        try:
+            started = time.perf_counter()
+            delivered = worker.drain()
+        finally:
+            release_leadership(handle)
+        print(f"✅ Delivered {delivered} outbox events in {time.perf_counter() - started:.1f}s")
+    else:
+        try:
+            asyncio.run(worker.run(asyncio.Event()))
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,65 @@
+"""
+Alternative response formats chosen through the Accept header.
+
+`Accept: application/msgpack` (or application/x-msgpack) gets the same
+document as the JSON response, MessagePack-encoded - datetimes stay ISO 8601
+strings, so clients decode both formats the same way. Anything else, or a
+server without the `msgpack` package, gets JSON.
+"""
+from typing import Optional
+
+from fastapi import Request, Response
+from pydantic import BaseModel
+
+try:
+    import msgpack
+except ImportError:  # optional
+    msgpack = None
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+MSGPACK_MEDIA_TYPES = (MSGPACK_MEDIA_TYPE, "application/x-msgpack")
+
+
+def _accepted_types(accept: str):
+    """Media types with q > 0, best first"""
+    ranked = []
+    for position, part in enumerate(accept.split(",")):
+        media_type, _, params = part.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if media_type and q > 0:
+            ranked.append((-q, position, media_type.strip().lower()))
+    return [media_type for _, _, media_type in sorted(ranked)]
+
+
+def wants_msgpack(request: Request) -> bool:
+    if msgpack is None:
+        return False
+    for media_type in _accepted_types(request.headers.get("accept", "")):
+        if media_type in MSGPACK_MEDIA_TYPES:
+            return True
+        if media_type in ("application/json", "*/*", "application/*"):
+            return False
+    return False
+
+
+def json_response(model: type[BaseModel], content, headers: Optional[dict] = None) -> Response:
+    """Validate `content` against a model other than the route's response_model and return JSON"""
+    document = model.model_validate(content, from_attributes=True).model_dump_json()
+    response = Response(document, media_type="application/json", headers=headers)
+    response.headers["Vary"] = "Accept"
+    return response
+
+
+def msgpack_response(model: type[BaseModel], content, headers: Optional[dict] = None) -> Response:
+    """Validate `content` against the response model and return it as MessagePack"""
+    document = model.model_validate(content, from_attributes=True).model_dump(mode="json")
+    response = Response(msgpack.packb(document), media_type=MSGPACK_MEDIA_TYPE, headers=headers)
+    response.headers["Vary"] = "Accept"
+    return response
@@ -0,0 +1,225 @@
+"""
+Route length and extent, computed when an order is written.
+
+Every write path that changes an order's route_geometry or its stops'
+coordinates or sequence stores, in the same UPDATE/INSERT:
+
+  - route_distance_km: length of route_geometry (GeoJSON LineString,
+    [lng, lat] pairs) when it has two or more points, else the length of the
+    path through the stops in sequence; NULL when neither is known.
+  - bbox_min_lat/bbox_min_lon/bbox_max_lat/bbox_max_lon: the box around the
+    geometry and the stops, NULL when there are no coordinates.
+  - leg_distances_km: stop-to-stop distances in sequence order (n-1 legs,
+    null for a leg whose stop has no coordinates).
+
+so GET /api/orders can filter on distance (min_distance/max_distance) and
+area (bbox) through indexes, instead of parsing every route_geometry.
+Distances are haversine over the mean earth radius, computed for a whole
+batch of orders at once with NumPy.
+
+leg_distances_km is only ever written as a JSON array, so SQL NULL there
+marks a row written before migration 0008. Fill those in (resumable,
+chunked; archived orders too):
+
+    python route_metrics.py backfill
+"""
+import argparse
+import time
+from typing import Iterable, List, Optional
+
+import numpy as np
+from sqlalchemy import bindparam, select
+
+from models import Order, Stop, ArchivedOrder, ArchivedStop
+from route_optimizer import EARTH_RADIUS_KM
+
+ROUTE_METRIC_COLUMNS = (
+    "route_distance_km", "bbox_min_lat", "bbox_min_lon", "bbox_max_lat", "bbox_max_lon", "leg_distances_km",
+)
+BACKFILL_CHUNK_SIZE = 1000
+
+_NO_POINTS = np.empty((0, 2))
+
+
+def haversine_path(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """Great-circle distances in km between consecutive points (len - 1 of them)"""
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    a = np.sin(np.diff(lat) / 2) ** 2 + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _field(stop, name):
+    return stop[name] if isinstance(stop, dict) else getattr(stop, name)
+
+
+def geometry_points(route_geometry) -> np.ndarray:
+    """(lat, lon) rows of a GeoJSON LineString; no rows for anything else"""
+    if not isinstance(route_geometry, dict) or route_geometry.get("type") != "LineString":
+        return _NO_POINTS
+    try:
+        points = np.asarray(route_geometry.get("coordinates") or [], dtype=np.float64)
+    except (TypeError, ValueError):
+        return _NO_POINTS
+    if points.ndim != 2 or points.shape[1] < 2:
+        return _NO_POINTS
+    return points[:, 1::-1]  # [lng, lat, (alt)] -> [lat, lng]
+
+
+def stop_points(stops) -> np.ndarray:
+    """(lat, lon) rows of ORM stops, schema objects or dicts in sequence order; NaN where unknown"""
+    ordered = sorted(stops, key=lambda s: _field(s, "sequence"))
+    return np.array(
+        [(_field(s, "latitude"), _field(s, "longitude")) for s in ordered], dtype=np.float64
+    ).reshape(-1, 2)  # None becomes NaN
+
+
+def _legs(paths) -> List[np.ndarray]:
+    """Consecutive distances within each path, in one vectorised pass over all of them"""
+    offsets = np.concatenate([[0], np.cumsum([len(p) for p in paths])])
+    points = np.concatenate(paths) if paths else _NO_POINTS
+    legs = haversine_path(points[:, 0], points[:, 1]) if len(points) > 1 else np.empty(0)
+    # Leg i joins points i and i + 1; a path's legs end before the next path's first point
+    return [legs[start:max(end - 1, start)] for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def route_metrics_many(routes: Iterable[tuple]) -> List[dict]:
+    """Column values for many (route_geometry, stops) pairs"""
+    geometries, stop_paths = [], []
+    for route_geometry, stops in routes:
+        geometries.append(geometry_points(route_geometry))
+        stop_paths.append(stop_points(stops))
+
+    legs = _legs(geometries + stop_paths)
+    geometry_legs, stop_legs = legs[:len(geometries)], legs[len(geometries):]
+    results = []
+    for geometry, stops, g_legs, s_legs in zip(geometries, stop_paths, geometry_legs, stop_legs):
+        if len(geometry) > 1:
+            distance = float(g_legs.sum())
+        elif len(stops) and not np.isnan(s_legs).any():
+            distance = float(s_legs.sum())
+        else:
+            distance = None
+
+        points = np.concatenate([geometry, stops])
+        points = points[~np.isnan(points).any(axis=1)]
+        if len(points):
+            (min_lat, min_lon), (max_lat, max_lon) = points.min(axis=0), points.max(axis=0)
+            bbox = (float(min_lat), float(min_lon), float(max_lat), float(max_lon))
+        else:
+            bbox = (None, None, None, None)
+
+        results.append({
+            "route_distance_km": None if distance is None else round(distance, 3),
+            "bbox_min_lat": bbox[0],
+            "bbox_min_lon": bbox[1],
+            "bbox_max_lat": bbox[2],
+            "bbox_max_lon": bbox[3],
+            "leg_distances_km": [None if np.isnan(leg) else round(leg, 3) for leg in s_legs.tolist()],
+        })
+    return results
+
+
+def route_metrics(route_geometry, stops) -> dict:
+    """Column values for one order"""
+    return route_metrics_many([(route_geometry, stops)])[0]
+
+
+def apply_route_metrics(order, stops=None):
+    """Set the columns on an ORM order from its geometry and `stops` (default: order.stops)"""
+    for column, value in route_metrics(order.route_geometry, order.stops if stops is None else stops).items():
+        setattr(order, column, value)
+
+
+def patched_route_metrics(db, order_id: int, order_values: dict, stop_patches: List[dict]) -> Optional[dict]:
+    """
+    Column values after a merge patch (order fields, stop patches as sent),
+    or None when the patch doesn't move the route - the common case, which
+    costs no reads. Otherwise the order's geometry and stop coordinates are
+    read (the order row locked on PostgreSQL) and the patch applied to them.
+    """
+    moves = [
+        p for p in stop_patches
+        if "latitude" in p or "longitude" in p or (p.get("id") is not None and "sequence" in p)
+    ]
+    if "route_geometry" not in order_values and not moves:
+        return None
+
+    geometry = db.execute(
+        select(Order.route_geometry).where(Order.id == order_id).with_for_update()
+    ).scalar()
+    geometry = order_values.get("route_geometry", geometry)
+    stops = [
+        dict(row) for row in db.execute(
+            select(Stop.id, Stop.sequence, Stop.latitude, Stop.longitude).where(Stop.order_id == order_id)
+        ).mappings()
+    ]
+    by_id = {stop["id"]: stop for stop in stops}
+    by_sequence = {stop["sequence"]: stop for stop in stops}
+    for p in moves:
+        stop = by_id.get(p["id"]) if p.get("id") is not None else by_sequence.get(p.get("sequence"))
+        if stop is not None:  # an unknown stop is a 404 before any stop is updated
+            stop.update({k: p[k] for k in ("sequence", "latitude", "longitude") if k in p})
+    return route_metrics(geometry, stops)
+
+
+def backfill_model(engine, order_model, stop_model, chunk_size: int = BACKFILL_CHUNK_SIZE, log=print) -> int:
+    """Compute the columns for every row of order_model that predates them; returns how many"""
+    orders = order_model.__table__
+    stops = stop_model.__table__
+    # updated_at is kept as it was: derived data, not a change to the order
+    write = (
+        orders.update()
+        .where(orders.c.id == bindparam("_id"))
+        .values(**{column: bindparam(column) for column in ROUTE_METRIC_COLUMNS}, updated_at=orders.c.updated_at)
+    )
+
+    total, after = 0, 0
+    while True:
+        # Each chunk is its own short transaction; the id cursor makes it resumable
+        with engine.begin() as conn:
+            rows = conn.execute(
+                select(orders.c.id, orders.c.route_geometry)
+                .where(orders.c.leg_distances_km.is_(None), orders.c.id > after)
+                .order_by(orders.c.id)
+                .limit(chunk_size)
+            ).all()
+            if not rows:
+                break
+            ids = [row.id for row in rows]
+            stops_by_order = {order_id: [] for order_id in ids}
+            for stop in conn.execute(
+                select(stops.c.order_id, stops.c.sequence, stops.c.latitude, stops.c.longitude)
+                .where(stops.c.order_id.in_(ids))
+            ):
+                stops_by_order[stop.order_id].append(stop)
+
+            metrics = route_metrics_many((row.route_geometry, stops_by_order[row.id]) for row in rows)
+            conn.execute(write, [{**m, "_id": row.id} for row, m in zip(rows, metrics)])
+        total += len(rows)
+        after = ids[-1]
+        log(f"  backfilled route metrics for {total} rows in {orders.fullname}")
+    return total
+
+
+def backfill(engine, chunk_size: int = BACKFILL_CHUNK_SIZE, log=print) -> int:
+    """Live and archived orders"""
+    return (
+        backfill_model(engine, Order, Stop, chunk_size, log)
+        + backfill_model(engine, ArchivedOrder, ArchivedStop, chunk_size, log)
+    )
+
+
+if __name__ == "__main__":
+    from database import engine, memory_database
+
+    parser = argparse.ArgumentParser(description="Precomputed route distance and bounding boxes")
+    parser.add_argument("command", choices=["backfill"])
+    parser.add_argument("--chunk-size", type=int, default=BACKFILL_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    updated = backfill(engine, args.chunk_size)
+    if memory_database is not None:
+        memory_database.snapshot()
+    print(f"✅ Backfilled route metrics for {updated} orders in {time.perf_counter() - started:.1f}s")
@@ -1,7 +1,9 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, ConfigDict, EmailStr, Field, field_validator
 from typing import Optional, List
 from datetime import datetime
 
+from statuses import ORDER_STATUS_PATTERN, STOP_STATUS_PATTERN
+
 # Customer Schemas
 class CustomerBase(BaseModel):
     name: str
@@ -21,6 +23,15 @@ class CustomerResponse(CustomerBase):
         from_attributes = True
 
 
+class CustomerSummaryResponse(CustomerResponse):
+    active_order_count: int = 0
+    last_order_at: Optional[datetime] = None
+
+class CustomerSearchResponse(BaseModel):
+    customers: List[CustomerSummaryResponse]
+    next_cursor: Optional[str] = None  # pass back as `cursor` for the next page
+
+
 # Stop Schemas
 class StopBase(BaseModel):
     location: str
@@ -34,6 +45,16 @@ class StopBase(BaseModel):
 class StopCreate(StopBase):
     sequence: int
 
+class AtRiskStopResponse(BaseModel):
+    stop_id: int
+    order_id: int
+    sequence: int
+    location: str
+    vehicle_type: Optional[str] = None
+    scheduled_time: datetime
+    eta: datetime
+    minutes_late: float  # negative = minutes of slack left
+
 class StopResponse(StopBase):
     id: int
     order_id: int
@@ -41,6 +62,7 @@ class StopResponse(StopBase):
     status: str
     actual_arrival_time: Optional[datetime] = None
     actual_departure_time: Optional[datetime] = None
+    version: int
     created_at: datetime
     updated_at: datetime
 
@@ -76,6 +98,8 @@ class OrderBase(BaseModel):
 
 class OrderCreate(OrderBase):
     customer_id: int
+    # Only new input is held to the vocabulary; rows from before it still read back
+    status: str = Field("pending", pattern=ORDER_STATUS_PATTERN)
     stops: List[StopCreate]
 
 class OrderUpdate(BaseModel):
@@ -101,14 +125,97 @@ class OrderUpdate(BaseModel):
     special_instructions: Optional[str] = None
     internal_notes: Optional[str] = None
     quote_amount: Optional[float] = None
-    status: Optional[str] = None
+    status: Optional[str] = Field(None, pattern=ORDER_STATUS_PATTERN)
     stops: Optional[List[StopCreate]] = None
 
+def _not_null(value, info):
+    # A merge patch's null clears a column; these columns can't be cleared
+    if value is None:
+        raise ValueError(f"{info.field_name} cannot be null")
+    return value
+
+class StopPatch(BaseModel):
+    """Per-stop patch operation. Addressed by `id`, or by `sequence` when no id is given."""
+    model_config = ConfigDict(extra="forbid")
+
+    id: Optional[int] = None
+    sequence: Optional[int] = None
+    location: Optional[str] = None
+    stop_type: Optional[str] = None
+    scheduled_time: Optional[datetime] = None
+    contact_person: Optional[str] = None
+    contact_phone: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    status: Optional[str] = Field(None, pattern=STOP_STATUS_PATTERN)
+    actual_arrival_time: Optional[datetime] = None
+    actual_departure_time: Optional[datetime] = None
+
+    _non_nullable = field_validator("sequence", "location", "stop_type", "scheduled_time")(_not_null)
+
+class OrderPatch(BaseModel):
+    """JSON Merge Patch body - absent keys are untouched, null clears the column"""
+    model_config = ConfigDict(extra="forbid")
+
+    pickup_location: Optional[str] = None
+    delivery_location: Optional[str] = None
+    pickup_date: Optional[datetime] = None
+    delivery_date: Optional[datetime] = None
+    cargo_type: Optional[str] = None
+    weight: Optional[float] = None
+    dimensions: Optional[str] = None
+    vehicle_type: Optional[str] = None
+    contact_person: Optional[str] = None
+    contact_phone: Optional[str] = None
+    contact_email: Optional[str] = None
+    route_geometry: Optional[dict] = None  # replaced as a whole, not merged
+    bill_of_lading: Optional[str] = None
+    container_number: Optional[str] = None
+    seal_number: Optional[str] = None
+    carrier: Optional[str] = None
+    reference_number: Optional[str] = None
+    po_number: Optional[str] = None
+    customer_reference: Optional[str] = None
+    special_instructions: Optional[str] = None
+    internal_notes: Optional[str] = None
+    quote_amount: Optional[float] = None
+    status: Optional[str] = Field(None, pattern=ORDER_STATUS_PATTERN)
+    stops: Optional[List[StopPatch]] = None
+
+    _non_nullable = field_validator(
+        "pickup_location", "delivery_location", "pickup_date", "delivery_date", "cargo_type", "weight", "status"
+    )(_not_null)
+
+class OrderPatchResponse(BaseModel):
+    id: int
+    version: int
+    updated_fields: List[str]
+    stops_updated: int
+
+class RouteOptimizationResponse(BaseModel):
+    order_id: int
+    stop_ids: List[int]  # in the optimized visiting order
+    original_distance_km: float
+    optimized_distance_km: float
+    feasible: bool
+    applied: bool
+    version: int
+    elapsed_ms: float
+
 class OrderResponse(OrderBase):
     id: int
     customer_id: int
     customer: CustomerResponse
     stops: List[StopResponse]
+    # Precomputed on write (route_metrics.py); null for orders written before them
+    route_distance_km: Optional[float] = None
+    bbox_min_lat: Optional[float] = None
+    bbox_min_lon: Optional[float] = None
+    bbox_max_lat: Optional[float] = None
+    bbox_max_lon: Optional[float] = None
+    leg_distances_km: Optional[List[Optional[float]]] = None
+    version: int
+    archived: bool = False
     created_at: datetime
     updated_at: datetime
 
@@ -123,3 +230,56 @@ class OrderListResponse(BaseModel):
     page: int
     limit: int
     total_pages: int
+    next_cursor: Optional[str] = None  # pass back as `cursor` for the next page
+
+
+class OrderSummaryResponse(BaseModel):
+    id: int
+    customer_id: int
+    customer_name: Optional[str] = None
+    pickup_location: str
+    delivery_location: str
+    pickup_date: datetime
+    delivery_date: datetime
+    cargo_type: str
+    vehicle_type: Optional[str] = None
+    weight: float
+    status: str
+    reference_number: Optional[str] = None
+    stop_count: int
+    next_stop_id: Optional[int] = None
+    next_stop_sequence: Optional[int] = None
+    next_stop_location: Optional[str] = None
+    next_stop_scheduled_time: Optional[datetime] = None
+    version: int
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class OrderSummaryListResponse(BaseModel):
+    orders: List[OrderSummaryResponse]
+    total: int
+    page: int
+    limit: int
+    total_pages: int
+    next_cursor: Optional[str] = None  # pass back as `cursor` for the next page
+
+
+# Batch read (POST /api/orders/batch-get)
+BATCH_GET_MAX_IDS = 1000
+
+class OrderBatchGet(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=BATCH_GET_MAX_IDS)
+    view: str = Field("full", pattern="^(full|summary)$")
+    include_archived: bool = False
+
+class OrderBatchResponse(BaseModel):
+    orders: List[OrderResponse]  # in request order, each id once
+    missing: List[int]
+
+class OrderSummaryBatchResponse(BaseModel):
+    orders: List[OrderSummaryResponse]
+    missing: List[int]
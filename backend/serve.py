@@ -0,0 +1,57 @@
+"""
+Production launcher: N uvicorn worker processes sharing one listening socket.
+
+    python serve.py                       # one worker per CPU core
+    python serve.py --workers 4 --port 8000
+
+Each worker runs the app's lifespan startup (schema check, warm-up, pool fill)
+before it accepts connections. State that must agree across workers (cache
+generations, read-your-writes markers, rate limits) lives in the store
+configured by SHARED_STATE_URL - see shared_state.py.
+"""
+import argparse
+import logging
+import os
+
+import uvicorn
+
+logger = logging.getLogger("serve")
+
+
+def default_workers() -> int:
+    return int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the Fleet Management API with multiple workers")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "warning"))
+    args = parser.parse_args()
+
+    if args.workers > 1 and os.getenv("SQLITE_MODE") == "memory" \
+            and not os.getenv("DATABASE_URL", "").startswith("postgresql"):
+        parser.error("SQLITE_MODE=memory keeps the database inside one process; use --workers 1")
+
+    from shared_state import shared
+    if args.workers > 1 and not shared.shared_across_processes:
+        logger.warning(
+            "Running %d workers without SHARED_STATE_URL: caches and rate limits are per worker",
+            args.workers
+        )
+
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        log_level=args.log_level,
+        access_log=False,
+        proxy_headers=True,
+        timeout_keep_alive=30,
+    )
+
+
+if __name__ == "__main__":
+    main()
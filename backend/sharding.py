@@ -0,0 +1,663 @@
+"""
+Orders sharded by customer.
+
+With SHARD_DATABASE_URLS set, each customer's orders and stops live in one of
+N databases: shard 0 is DATABASE_URL, shards 1..N-1 are the listed URLs
+(SQLite files or PostgreSQL databases, each migrated with the full schema by
+migrate.py). Without it there is one shard and everything below is a no-op.
+
+  - Customers are a reference table: created on shard 0 and copied to every
+    shard (the order_summaries triggers join them). Shard 0 also holds the
+    map (customer_shards) and the id allocator (shard_id_blocks).
+  - A new customer goes to shard customer_id % N. Customers that predate
+    sharding have no map entry and stay on shard 0, where their orders are.
+  - Order and stop ids are handed out by shard 0 in blocks of
+    SHARD_ID_BLOCK_SIZE per process, so they are unique across shards and an
+    order keeps its id when its customer moves.
+  - Requests that name a customer go to its shard. An order or stop id is
+    found by probing the shards (the hit is remembered per process); the map
+    has the last word while a customer is on two shards during a move.
+  - GET /api/orders without customer_id scatters to every shard and merges
+    the pages on (sort key, id). Its next_cursor gives keyset pagination, so
+    each shard only ever returns one page; page numbers make every shard
+    return all the rows before the page, up to SHARD_SCATTER_MAX_ROWS.
+
+Moving a customer is online:
+
+    python sharding.py move --customer 42 --to 2
+    python sharding.py status
+
+The orders are copied, with their status history, while the customer's
+writes carry on; then its writes are refused (503 with Retry-After) while
+the changes since are copied and the map is switched - a few seconds,
+SHARD_MAP_REFRESH_SECONDS plus SHARD_MOVE_GRACE_SECONDS, for processes to
+notice - and finally the source copy is deleted. Reads carry on throughout.
+An interrupted move leaves the customer's writes refused; run the same move
+again to finish it.
+"""
+import argparse
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Callable, List, Optional
+
+from fastapi import Request
+from sqlalchemy import delete, event, func, insert, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from database import engine, shard_engines, shard_session_factories, reads_from_replica
+from models import (
+    Customer, CustomerOrderStats, CustomerShard, ShardIdBlock, Order, Stop, ArchivedOrder, ArchivedStop,
+    OutboxEvent, StatusEvent
+)
+from archive import ensure_partitions
+from eta import changing_stops
+
+logger = logging.getLogger(__name__)
+
+SHARD_COUNT = len(shard_engines)
+SHARDING_ENABLED = SHARD_COUNT > 1
+# How long a process trusts its copy of a customer's map entry
+SHARD_MAP_REFRESH_SECONDS = float(os.getenv("SHARD_MAP_REFRESH_SECONDS", "5"))
+# Extra wait in a move for requests that read the map just before it changed
+SHARD_MOVE_GRACE_SECONDS = float(os.getenv("SHARD_MOVE_GRACE_SECONDS", "2"))
+SHARD_ID_BLOCK_SIZE = int(os.getenv("SHARD_ID_BLOCK_SIZE", "1000"))
+SHARD_SCATTER_MAX_ROWS = int(os.getenv("SHARD_SCATTER_MAX_ROWS", "10000"))
+SHARD_MOVE_CHUNK_SIZE = 500
+LOCATE_CACHE_SIZE = 100_000
+
+
+class CustomerMovingError(RuntimeError):
+    """A write for a customer whose orders are being moved between shards"""
+
+    retry_after = int(SHARD_MAP_REFRESH_SECONDS + SHARD_MOVE_GRACE_SECONDS) + 1
+
+    def __init__(self, customer_id: int):
+        super().__init__(f"Customer {customer_id} is being moved between shards; retry shortly")
+        self.customer_id = customer_id
+
+
+def _insert_ignore(conn, table, rows):
+    """INSERT ... ON CONFLICT DO NOTHING"""
+    dialect_insert = pg_insert if conn.dialect.name == "postgresql" else sqlite_insert
+    conn.execute(dialect_insert(table).on_conflict_do_nothing(), rows)
+
+
+@contextmanager
+def _without_outbox_events(conn, aggregate_type: str, aggregate_ids):
+    """
+    Drop the outbox events the triggers write for these aggregates inside the
+    block: copying rows between shards is not a change to report.
+    """
+    mark = conn.execute(select(func.coalesce(func.max(OutboxEvent.id), 0))).scalar()
+    yield
+    conn.execute(
+        delete(OutboxEvent).where(
+            OutboxEvent.id > mark,
+            OutboxEvent.aggregate_type == aggregate_type,
+            OutboxEvent.aggregate_id.in_(list(aggregate_ids)),
+        )
+    )
+
+
+# ============= Customer -> shard map =============
+
+class ShardMap:
+    """customer_shards on shard 0, with entries cached per process for SHARD_MAP_REFRESH_SECONDS"""
+
+    def __init__(self, refresh_seconds: float = SHARD_MAP_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._entries = {}  # customer_id -> (shard, moving_to, loaded_at)
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, customer_id: int, fresh: bool = False):
+        """(shard, moving_to) for a customer, or None if there is no such customer"""
+        entry = None if fresh else self._entries.get(customer_id)
+        if entry is not None and time.monotonic() - entry[2] < self.refresh_seconds:
+            self.hits += 1
+            return entry[0], entry[1]
+        self.misses += 1
+        with engine.connect() as conn:
+            row = conn.execute(
+                select(CustomerShard.shard, CustomerShard.moving_to).where(CustomerShard.customer_id == customer_id)
+            ).first()
+        if row is None:
+            row = self._adopt(customer_id)
+            if row is None:
+                return None  # not cached: the customer may be created any moment
+        self._entries[customer_id] = (row[0], row[1], time.monotonic())
+        return row[0], row[1]
+
+    def _adopt(self, customer_id: int):
+        """Map a customer from before sharding to shard 0, where its orders are"""
+        with engine.begin() as conn:
+            if conn.execute(select(Customer.id).where(Customer.id == customer_id)).first() is None:
+                return None
+            _insert_ignore(conn, CustomerShard.__table__, [{"customer_id": customer_id, "shard": 0}])
+            return conn.execute(
+                select(CustomerShard.shard, CustomerShard.moving_to).where(CustomerShard.customer_id == customer_id)
+            ).first()
+
+    def place(self, conn, customer_id: int) -> int:
+        """Assign a new customer a shard, in the transaction that creates it on shard 0"""
+        return self.place_many(conn, [customer_id])[0]
+
+    def place_many(self, conn, customer_ids) -> List[int]:
+        rows = [{"customer_id": customer_id, "shard": customer_id % SHARD_COUNT} for customer_id in customer_ids]
+        conn.execute(insert(CustomerShard.__table__), rows)
+        return [row["shard"] for row in rows]
+
+    def forget(self, customer_id: int):
+        self._entries.pop(customer_id, None)
+
+    def stats(self) -> dict:
+        return {"cached": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+shard_map = ShardMap()
+
+
+def shard_for_customer(customer_id: int, write: bool = False) -> Optional[int]:
+    """The customer's shard (None if it doesn't exist); raises CustomerMovingError for writes during a move"""
+    if not SHARDING_ENABLED:
+        return 0
+    entry = shard_map.lookup(customer_id)
+    if entry is None:
+        return None
+    shard, moving_to = entry
+    if write and moving_to is not None:
+        raise CustomerMovingError(customer_id)
+    return shard
+
+
+def replicate_customer(customer_id: int, shards=None) -> bool:
+    """Copy a customer from shard 0 to other shards (default: all). False if there is nothing to copy."""
+    return replicate_customers([customer_id], shards) > 0
+
+
+def replicate_customers(customer_ids, shards=None) -> int:
+    """Copy customers from shard 0 to other shards (default: all); returns how many were found"""
+    if not SHARDING_ENABLED or not customer_ids:
+        return 0
+    with engine.connect() as conn:
+        rows = [
+            dict(row) for row in
+            conn.execute(select(Customer.__table__).where(Customer.id.in_(list(customer_ids)))).mappings()
+        ]
+    if not rows:
+        return 0
+    for shard in shards if shards is not None else range(1, SHARD_COUNT):
+        with shard_engines[shard].begin() as conn:
+            with _without_outbox_events(conn, "customer", [row["id"] for row in rows]):
+                _insert_ignore(conn, Customer.__table__, rows)
+    return len(rows)
+
+
+def order_stats(customer_ids) -> dict:
+    """customer_id -> (active_order_count, last_order_at), read on each customer's shard"""
+    by_shard = {}
+    for customer_id in customer_ids:
+        by_shard.setdefault(shard_for_customer(customer_id) or 0, []).append(customer_id)
+    stats = {}
+    for shard, ids in by_shard.items():
+        with shard_engines[shard].connect() as conn:
+            for row in conn.execute(
+                select(CustomerOrderStats.customer_id, CustomerOrderStats.active_order_count,
+                       CustomerOrderStats.last_order_at)
+                .where(CustomerOrderStats.customer_id.in_(ids))
+            ):
+                stats[row.customer_id] = (row.active_order_count, row.last_order_at)
+    return stats
+
+
+# ============= Ids =============
+
+class IdAllocator:
+    """
+    Order and stop ids for every shard, from shard_id_blocks on shard 0. A
+    process takes SHARD_ID_BLOCK_SIZE ids at a time in a short transaction of
+    its own; ids of a block it doesn't use up are skipped, never reused.
+    """
+
+    TABLES = {"orders": (Order, ArchivedOrder), "stops": (Stop, ArchivedStop)}
+
+    def __init__(self, block_size: int = SHARD_ID_BLOCK_SIZE):
+        self.block_size = block_size
+        self._blocks = {}  # table -> [next, end)
+        self._lock = threading.Lock()
+        self.blocks_taken = 0
+
+    def top_up(self):
+        """
+        Take fresh blocks below half a block left. Called before a write
+        transaction starts, so next_id() doesn't have to write to shard 0
+        while the request holds a write lock there (SQLite).
+        """
+        with self._lock:
+            for table in self.TABLES:
+                start, end = self._blocks.get(table, (0, 0))
+                if end - start < self.block_size // 2:
+                    self._take(table)
+
+    def next_id(self, table: str) -> int:
+        with self._lock:
+            start, end = self._blocks.get(table, (0, 0))
+            if start >= end:
+                start, end = self._take(table)
+            self._blocks[table] = (start + 1, end)
+            return start
+
+    def reserve(self, table: str, count: int) -> list:
+        """
+        `count` ids at once, taking a block as large as needed. For writes of
+        more rows than top_up() guarantees, before their transaction starts.
+        """
+        with self._lock:
+            ids = []
+            while len(ids) < count:
+                start, end = self._blocks.get(table, (0, 0))
+                if start >= end:
+                    start, end = self._take(table, max(self.block_size, count - len(ids)))
+                taken = min(end - start, count - len(ids))
+                ids.extend(range(start, start + taken))
+                self._blocks[table] = (start + taken, end)
+            return ids
+
+    def _take(self, table: str, size: int = None):
+        size = size or self.block_size
+        with engine.begin() as conn:
+            end = conn.execute(
+                update(ShardIdBlock)
+                .where(ShardIdBlock.name == table)
+                .values(next_id=ShardIdBlock.next_id + size)
+                .returning(ShardIdBlock.next_id)
+            ).scalar()
+            if end is None:
+                # First block: start above every id on every shard
+                _insert_ignore(conn, ShardIdBlock.__table__, [{"name": table, "next_id": self._highest_id(table) + 1}])
+                end = conn.execute(
+                    update(ShardIdBlock)
+                    .where(ShardIdBlock.name == table)
+                    .values(next_id=ShardIdBlock.next_id + size)
+                    .returning(ShardIdBlock.next_id)
+                ).scalar()
+        self._blocks[table] = (end - size, end)
+        self.blocks_taken += 1
+        return self._blocks[table]
+
+    def _highest_id(self, table: str) -> int:
+        highest = 0
+        for shard_engine in shard_engines:
+            with shard_engine.connect() as conn:
+                for model in self.TABLES[table]:
+                    highest = max(highest, conn.execute(select(func.max(model.id))).scalar() or 0)
+        return highest
+
+
+id_allocator = IdAllocator()
+
+if SHARDING_ENABLED:
+    @event.listens_for(Order, "before_insert")
+    @event.listens_for(Stop, "before_insert")
+    def _assign_id(mapper, connection, target):
+        if target.id is None:
+            target.id = id_allocator.next_id(mapper.local_table.name)
+
+
+# ============= Finding orders and stops =============
+
+class _Located:
+    """id -> shard of recently found orders and stops, oldest forgotten first"""
+
+    def __init__(self, size: int = LOCATE_CACHE_SIZE):
+        self.size = size
+        self._shards = {}
+
+    def get(self, key):
+        return self._shards.get(key)
+
+    def remember(self, key, shard: int):
+        if len(self._shards) >= self.size:
+            self._shards.pop(next(iter(self._shards)), None)
+        self._shards[key] = shard
+
+
+_located = _Located()
+
+
+def _probe(key, statement, write: bool) -> Optional[int]:
+    """
+    Shard holding a row: ask the remembered shard first, then the rest.
+    `statement` selects the row's customer_id; the customer's map entry
+    decides when the row is on two shards mid-move.
+    """
+    cached = _located.get(key)
+    order = [cached] + [s for s in range(SHARD_COUNT) if s != cached] if cached is not None else range(SHARD_COUNT)
+    for shard in order:
+        with shard_engines[shard].connect() as conn:
+            customer_id = conn.execute(statement).scalar()
+        if customer_id is None:
+            continue
+        owner = shard_for_customer(customer_id, write)
+        owner = shard if owner is None else owner
+        _located.remember(key, owner)
+        return owner
+    return None
+
+
+def shard_for_order(order_id: int, write: bool = False, include_archived: bool = False) -> Optional[int]:
+    if not SHARDING_ENABLED:
+        return 0
+    shard = _probe(("order", order_id), select(Order.customer_id).where(Order.id == order_id), write)
+    if shard is None and include_archived:
+        shard = _probe(
+            ("archived_order", order_id), select(ArchivedOrder.customer_id).where(ArchivedOrder.id == order_id), write
+        )
+    return shard
+
+
+def shard_for_stop(stop_id: int, write: bool = False) -> Optional[int]:
+    if not SHARDING_ENABLED:
+        return 0
+    return _probe(
+        ("stop", stop_id),
+        select(Order.customer_id).join(Stop, Stop.order_id == Order.id).where(Stop.id == stop_id),
+        write,
+    )
+
+
+# ============= Sessions per request =============
+
+class ShardRouter:
+    """
+    A request's sessions, opened per shard on first use. With one shard every
+    method hands back the same session. Unknown customers, orders and stops
+    route to shard 0, where the handler's own lookup then comes up empty.
+    """
+
+    def __init__(self, read_only: bool = False):
+        self.read_only = read_only
+        self._sessions = {}
+
+    def session(self, shard: int) -> Session:
+        if shard not in self._sessions:
+            db = shard_session_factories[shard]()
+            if shard == 0:
+                db.info["read_only"] = self.read_only
+            self._sessions[shard] = db
+        return self._sessions[shard]
+
+    @property
+    def home(self) -> Session:
+        return self.session(0)
+
+    def _for(self, shard: Optional[int], write: bool) -> Session:
+        if write and SHARDING_ENABLED:
+            id_allocator.top_up()
+        return self.session(shard or 0)
+
+    def for_customer(self, customer_id: int, write: bool = False) -> Session:
+        return self._for(shard_for_customer(customer_id, write), write)
+
+    def for_order(self, order_id: int, write: bool = False, include_archived: bool = False) -> Session:
+        return self._for(shard_for_order(order_id, write, include_archived), write)
+
+    def for_stop(self, stop_id: int, write: bool = False) -> Session:
+        return self._for(shard_for_stop(stop_id, write), write)
+
+    def all(self) -> List[Session]:
+        return [self.session(shard) for shard in range(SHARD_COUNT)]
+
+    def close(self):
+        for db in self._sessions.values():
+            db.close()
+        self._sessions.clear()
+
+
+# Dependency for handlers that route by customer, order or stop
+def get_shards():
+    router = ShardRouter()
+    try:
+        yield router
+    finally:
+        router.close()
+
+
+# Read-only variant - shard 0 may be served by a replica
+def get_read_shards(request: Request):
+    router = ShardRouter(read_only=reads_from_replica(request))
+    try:
+        yield router
+    finally:
+        router.close()
+
+
+async def scatter(sessions: List[Session], fetch: Callable):
+    """fetch(session) on every session at once, one thread each; results in order. One session runs inline."""
+    if len(sessions) == 1:
+        return [fetch(sessions[0])]
+    return await asyncio.gather(*(asyncio.to_thread(fetch, db) for db in sessions))
+
+
+def _comparable(value):
+    # SQLite returns naive UTC datetimes, PostgreSQL aware ones
+    if isinstance(value, datetime) and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def merge_pages(pages, sort_by: str, sort_order: str, offset: int, limit: int) -> list:
+    """k-way merge of per-shard pages, each already in (sort key, id) order"""
+    merged = heapq.merge(
+        *pages,
+        key=lambda row: (_comparable(getattr(row, sort_by)), row.id),
+        reverse=sort_order == "desc",
+    )
+    return list(itertools.islice(merged, offset, offset + limit))
+
+
+def merge_found(found_per_shard) -> dict:
+    """
+    id -> row from per-shard id -> row lookups. A row found on two shards is
+    mid-move; the copy on its customer's mapped shard wins.
+    """
+    if len(found_per_shard) == 1:
+        return found_per_shard[0]
+    found = {}
+    for shard, rows in enumerate(found_per_shard):
+        for row_id, row in rows.items():
+            if row_id not in found or shard_for_customer(row.customer_id) == shard:
+                found[row_id] = row
+    return found
+
+
+# ============= Rebalancing =============
+
+MOVED_TABLES = ((Order, Stop), (ArchivedOrder, ArchivedStop))
+
+
+def _versions(conn, order_model, stop_model, customer_id: int) -> dict:
+    """order id -> (order version, sorted (stop id, stop version)) of a customer's orders"""
+    orders = {
+        row.id: [row.version, []]
+        for row in conn.execute(
+            select(order_model.id, order_model.version).where(order_model.customer_id == customer_id)
+        )
+    }
+    for row in conn.execute(
+        select(stop_model.order_id, stop_model.id, stop_model.version)
+        .join(order_model, order_model.id == stop_model.order_id)
+        .where(order_model.customer_id == customer_id)
+    ):
+        orders[row.order_id][1].append((row.id, row.version))
+    return {order_id: (version, sorted(stops)) for order_id, (version, stops) in orders.items()}
+
+
+def _delete_orders(conn, order_model, stop_model, order_ids):
+    conn.execute(delete(StatusEvent).where(StatusEvent.order_id.in_(order_ids)))
+    if order_model is Order:
+        with _without_outbox_events(conn, "order", order_ids):
+            conn.execute(delete(Stop).where(Stop.order_id.in_(order_ids)))
+            conn.execute(delete(Order).where(Order.id.in_(order_ids)))
+    else:
+        conn.execute(delete(stop_model).where(stop_model.order_id.in_(order_ids)))
+        conn.execute(delete(order_model).where(order_model.id.in_(order_ids)))
+
+
+def _copy_orders(source, target, order_model, stop_model, order_ids):
+    """Replace these orders (and their stops) on target with the source's rows"""
+    orders_table, stops_table = order_model.__table__, stop_model.__table__
+    with source.connect() as conn:
+        orders = [dict(row) for row in conn.execute(
+            select(orders_table).where(orders_table.c.id.in_(order_ids))
+        ).mappings()]
+        stops = [dict(row) for row in conn.execute(
+            select(stops_table).where(stops_table.c.order_id.in_(order_ids))
+        ).mappings()]
+        events_table = StatusEvent.__table__
+        events = [dict(row) for row in conn.execute(
+            select(*(c for c in events_table.c if c.name != "id"))
+            .where(events_table.c.order_id.in_(order_ids))
+            .order_by(events_table.c.id)
+        ).mappings()]
+    with changing_stops(target) as conn:
+        _delete_orders(conn, order_model, stop_model, order_ids)
+        if order_model is ArchivedOrder and target.dialect.name == "postgresql":
+            ensure_partitions(conn, [row["created_at"] for row in orders])
+        if order_model is Order:
+            with _without_outbox_events(conn, "order", order_ids):
+                conn.execute(insert(orders_table), orders)
+                if stops:
+                    conn.execute(insert(stops_table), stops)
+        elif orders:
+            conn.execute(insert(orders_table), orders)
+            if stops:
+                conn.execute(insert(stops_table), stops)
+        # The history comes along; the insert triggers' rows above would say the orders were created just now
+        conn.execute(delete(StatusEvent).where(StatusEvent.order_id.in_(order_ids)))
+        if events:
+            conn.execute(insert(events_table), events)
+
+
+def _sync(source, target, customer_id: int, chunk_size: int, log) -> int:
+    """Make the customer's orders on target match source; returns how many orders were (re)copied or dropped"""
+    changed = 0
+    for order_model, stop_model in MOVED_TABLES:
+        with source.connect() as conn:
+            wanted = _versions(conn, order_model, stop_model, customer_id)
+        with target.connect() as conn:
+            present = _versions(conn, order_model, stop_model, customer_id)
+
+        stale = sorted(order_id for order_id in present if order_id not in wanted)
+        for start in range(0, len(stale), chunk_size):
+            with changing_stops(target) as conn:
+                _delete_orders(conn, order_model, stop_model, stale[start:start + chunk_size])
+        copy = sorted(order_id for order_id, versions in wanted.items() if present.get(order_id) != versions)
+        for start in range(0, len(copy), chunk_size):
+            _copy_orders(source, target, order_model, stop_model, copy[start:start + chunk_size])
+            log(f"  {order_model.__table__.fullname}: copied {min(start + chunk_size, len(copy))}/{len(copy)}")
+        changed += len(stale) + len(copy)
+    return changed
+
+
+def _set_entry(customer_id: int, **values):
+    with engine.begin() as conn:
+        conn.execute(update(CustomerShard).where(CustomerShard.customer_id == customer_id).values(**values))
+    shard_map.forget(customer_id)
+
+
+def move_customer(customer_id: int, target: int, chunk_size: int = SHARD_MOVE_CHUNK_SIZE, log=print) -> int:
+    """Move a customer's live and archived orders to shard `target`. Returns how many orders moved."""
+    if not 0 <= target < SHARD_COUNT:
+        raise ValueError(f"No shard {target}; there are {SHARD_COUNT}")
+    entry = shard_map.lookup(customer_id, fresh=True)
+    if entry is None:
+        raise ValueError(f"Customer {customer_id} not found")
+    source, moving_to = entry
+    if moving_to not in (None, target):
+        raise ValueError(f"Customer {customer_id} is already being moved to shard {moving_to}")
+    if source == target:
+        return 0
+    source_engine, target_engine = shard_engines[source], shard_engines[target]
+    settle = SHARD_MAP_REFRESH_SECONDS + SHARD_MOVE_GRACE_SECONDS
+    replicate_customer(customer_id, [target])
+
+    # 1. Bulk copy while the customer's writes carry on
+    log(f"Copying customer {customer_id} from shard {source} to shard {target}")
+    _sync(source_engine, target_engine, customer_id, chunk_size, log)
+
+    # 2. Refuse its writes, wait until every process has seen that, copy what changed meanwhile
+    _set_entry(customer_id, moving_to=target)
+    log(f"Writes paused; waiting {settle:.0f}s for every process to notice")
+    time.sleep(settle)
+    caught_up = _sync(source_engine, target_engine, customer_id, chunk_size, log)
+    log(f"Caught up {caught_up} orders changed during the copy")
+
+    # 3. Switch; reads that still use the old entry find the source rows until they are deleted
+    _set_entry(customer_id, shard=target, moving_to=None)
+    time.sleep(settle)
+
+    moved = 0
+    for order_model, stop_model in MOVED_TABLES:
+        with source_engine.connect() as conn:
+            order_ids = conn.execute(
+                select(order_model.id).where(order_model.customer_id == customer_id).order_by(order_model.id)
+            ).scalars().all()
+        for start in range(0, len(order_ids), chunk_size):
+            with changing_stops(source_engine) as conn:
+                _delete_orders(conn, order_model, stop_model, order_ids[start:start + chunk_size])
+        moved += len(order_ids)
+    return moved
+
+
+def shard_status() -> list:
+    status = []
+    with engine.connect() as conn:
+        mapped = dict(conn.execute(
+            select(CustomerShard.shard, func.count()).group_by(CustomerShard.shard)
+        ).all())
+        moving = conn.execute(
+            select(CustomerShard.customer_id, CustomerShard.moving_to).where(CustomerShard.moving_to.is_not(None))
+        ).all()
+    for shard, shard_engine in enumerate(shard_engines):
+        with shard_engine.connect() as conn:
+            orders = conn.execute(select(func.count()).select_from(Order)).scalar()
+            archived = conn.execute(select(func.count()).select_from(ArchivedOrder)).scalar()
+        status.append({
+            "shard": shard,
+            "url": shard_engine.url.render_as_string(hide_password=True),
+            "customers": mapped.get(shard, 0),
+            "orders": orders,
+            "archived_orders": archived,
+            "moving_out": [row.customer_id for row in moving if shard_map.lookup(row.customer_id, fresh=True)[0] == shard],
+        })
+    return status
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Orders sharded by customer")
+    sub = parser.add_subparsers(dest="command", required=True)
+    move = sub.add_parser("move", help="move a customer's orders to another shard, online")
+    move.add_argument("--customer", type=int, required=True)
+    move.add_argument("--to", type=int, required=True, help="target shard")
+    move.add_argument("--chunk-size", type=int, default=SHARD_MOVE_CHUNK_SIZE)
+    sub.add_parser("status", help="customers and orders per shard")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        for shard in shard_status():
+            print(shard)
+    else:
+        started = time.perf_counter()
+        moved = move_customer(args.customer, args.to, args.chunk_size)
+        print(f"✅ Moved {moved} orders of customer {args.customer} to shard {args.to} "
+              f"in {time.perf_counter() - started:.1f}s")
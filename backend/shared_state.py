@@ -0,0 +1,157 @@
+"""
+Small key/value store for state that has to agree across worker processes:
+cache generations, read-your-writes markers, rate-limit counters.
+
+With SHARED_STATE_URL=redis://host:6379/0 (needs the `redis` package) every
+worker talks to the same Redis. Without it the store is an in-process dict,
+which is only correct with a single worker; serve.py warns about that.
+"""
+import heapq
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+SHARED_STATE_URL = os.getenv("SHARED_STATE_URL", "")
+KEY_PREFIX = os.getenv("SHARED_STATE_PREFIX", "fleet:")
+
+
+class LocalBackend:
+    """Process-local implementation with the same semantics as RedisBackend"""
+
+    shared_across_processes = False
+    MAX_BUCKETS = 100_000
+
+    def __init__(self):
+        self._data = {}  # key -> (value, expires_at or None)
+        self._buckets = {}  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def _live(self, key, now):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= now:
+            del self._data[key]
+            return None
+        return entry
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._live(key, time.monotonic())
+            return None if entry is None else entry[0]
+
+    def set(self, key: str, value, ttl: float = None):
+        with self._lock:
+            expires = time.monotonic() + ttl if ttl else None
+            self._data[key] = (str(value), expires)
+
+    def incr(self, key: str, amount: int = 1, ttl: float = None) -> int:
+        """Atomically add to an integer; `ttl` is applied when the key is created"""
+        with self._lock:
+            now = time.monotonic()
+            entry = self._live(key, now)
+            if entry is None:
+                value, expires = amount, (now + ttl if ttl else None)
+            else:
+                value, expires = int(entry[0]) + amount, entry[1]
+            self._data[key] = (str(value), expires)
+            return value
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        """
+        Token bucket refilled at `rate` per second up to `burst`. Takes `cost`
+        tokens and returns 0, or returns the seconds until they would be available.
+        """
+        with self._lock:
+            now = time.monotonic()
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            wait = 0.0 if tokens >= cost else (cost - tokens) / rate
+            self._buckets[key] = (tokens - cost if not wait else tokens, now)
+            if len(self._buckets) > self.MAX_BUCKETS:
+                self._prune(now)
+            return wait
+
+    async def take_async(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        return self.take(key, rate, burst, cost)
+
+    def _prune(self, now):
+        # Drop buckets idle long enough to be full again - they hold no state
+        self._buckets = {
+            k: (tokens, updated) for k, (tokens, updated) in self._buckets.items() if now - updated < 60
+        }
+        if len(self._buckets) > self.MAX_BUCKETS // 2:
+            # Still too many clients: keep the most recently used half
+            self._buckets = dict(heapq.nlargest(
+                self.MAX_BUCKETS // 2, self._buckets.items(), key=lambda item: item[1][1]
+            ))
+
+
+class RedisBackend:
+    shared_across_processes = True
+
+    def __init__(self, url: str):
+        import redis  # optional dependency, only needed for multi-worker serving
+        import redis.asyncio
+
+        self._redis = redis.Redis.from_url(url, decode_responses=True, socket_timeout=0.5)
+        # For calls made on the event loop in every request (rate limits)
+        self._async_redis = redis.asyncio.Redis.from_url(url, decode_responses=True, socket_timeout=0.5)
+        self._take = None
+        self._take_async = None
+
+    def get(self, key: str) -> Optional[str]:
+        return self._redis.get(KEY_PREFIX + key)
+
+    def set(self, key: str, value, ttl: float = None):
+        self._redis.set(KEY_PREFIX + key, value, px=int(ttl * 1000) if ttl else None)
+
+    def incr(self, key: str, amount: int = 1, ttl: float = None) -> int:
+        value = self._redis.incrby(KEY_PREFIX + key, amount)
+        if ttl and value == amount:
+            # First increment created the key
+            self._redis.pexpire(KEY_PREFIX + key, int(ttl * 1000))
+        return value
+
+    # Same algorithm as LocalBackend.take, atomic on the Redis server clock
+    TAKE_SCRIPT = """
+    local now = redis.call('TIME')
+    now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+    local rate, burst, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens = tonumber(state[1]) or burst
+    local updated = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+    local wait = 0
+    if tokens >= cost then tokens = tokens - cost else wait = (cost - tokens) / rate end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+    redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+    return tostring(wait)
+    """
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        if self._take is None:
+            self._take = self._redis.register_script(self.TAKE_SCRIPT)
+        return float(self._take(keys=[KEY_PREFIX + key], args=[rate, burst, cost]))
+
+    async def take_async(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        """take() without blocking the event loop"""
+        if self._take_async is None:
+            self._take_async = self._async_redis.register_script(self.TAKE_SCRIPT)
+        return float(await self._take_async(keys=[KEY_PREFIX + key], args=[rate, burst, cost]))
+
+
+def make_backend():
+    if SHARED_STATE_URL:
+        try:
+            return RedisBackend(SHARED_STATE_URL)
+        except ImportError:
+            logger.error("SHARED_STATE_URL is set but the redis package is not installed; using local state")
+    return LocalBackend()
+
+
+shared = make_backend()
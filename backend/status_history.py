@@ -0,0 +1,194 @@
+"""
+Dwell time and throughput by status, from status_events (migration 0011).
+
+    python status_history.py dwell order pending --since 2026-10-01
+    python status_history.py throughput stop completed --bucket hour --since 2026-10-18
+    python status_history.py history 42
+
+Each question is one range of one index, however many events there are:
+
+  - dwell: how long rows stayed in a status before leaving it in
+    [since, until) - count, average, min and max of changed_at - entered_at
+    over ix_status_events_from (entity_type, from_status, changed_at,
+    entered_at). Rows still in the status aren't counted, nor are changes
+    with no entered_at (the row predates the history).
+  - throughput: how many rows entered a status per hour or day, over
+    ix_status_events_to (entity_type, to_status, changed_at).
+
+With sharding every shard answers for its own rows and the answers are
+added up (merge_dwell, merge_throughput).
+"""
+import argparse
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+
+from sqlalchemy import DateTime, func, literal, select
+
+from database import shard_engines
+from models import StatusEvent
+from order_queries import keyset_value
+from statuses import ENTITY_CODES, STATUS_CODES
+
+BUCKETS = ("hour", "day")
+SQLITE_BUCKET_FORMATS = {"hour": "%Y-%m-%d %H:00:00", "day": "%Y-%m-%d 00:00:00"}
+
+_STATUS_NAMES = {kind: {code: name for name, code in codes.items()} for kind, codes in STATUS_CODES.items()}
+_ENTITY_NAMES = {code: name for name, code in ENTITY_CODES.items()}
+
+
+def _code(entity: str, status: str) -> int:
+    if status not in STATUS_CODES[entity]:
+        raise ValueError(f"Unknown {entity} status {status!r}")
+    return STATUS_CODES[entity][status]
+
+
+def _bound(value: datetime, dialect_name: str):
+    """A period bound; naive means UTC"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    if dialect_name == "sqlite":
+        # Compared with the stored text, as a keyset bound is
+        return literal(keyset_value(value, dialect_name))
+    return literal(value.replace(tzinfo=timezone.utc), DateTime(timezone=True))
+
+
+def _period(conn, since: Optional[datetime], until: Optional[datetime]) -> list:
+    dialect_name = conn.dialect.name
+    terms = []
+    if since is not None:
+        terms.append(StatusEvent.changed_at >= _bound(since, dialect_name))
+    if until is not None:
+        terms.append(StatusEvent.changed_at < _bound(until, dialect_name))
+    return terms
+
+
+def _utc(value: datetime) -> datetime:
+    # SQLite returns naive UTC datetimes, PostgreSQL aware ones
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def dwell(conn, entity: str, status: str, since: Optional[datetime] = None,
+          until: Optional[datetime] = None) -> dict:
+    """Time spent in `status` by the rows that left it in [since, until), in seconds"""
+    if conn.dialect.name == "postgresql":
+        seconds = func.extract("epoch", StatusEvent.changed_at - StatusEvent.entered_at)
+    else:
+        seconds = (func.julianday(StatusEvent.changed_at) - func.julianday(StatusEvent.entered_at)) * 86400.0
+    count, total, shortest, longest = conn.execute(
+        select(func.count(), func.sum(seconds), func.min(seconds), func.max(seconds))
+        .where(
+            StatusEvent.entity_type == ENTITY_CODES[entity],
+            StatusEvent.from_status == _code(entity, status),
+            StatusEvent.entered_at.is_not(None),
+            *_period(conn, since, until),
+        )
+    ).one()
+    return merge_dwell([{
+        "count": count,
+        "total_seconds": float(total or 0),
+        "min_seconds": float(shortest) if shortest is not None else None,
+        "max_seconds": float(longest) if longest is not None else None,
+    }])
+
+
+def merge_dwell(parts: Iterable[dict]) -> dict:
+    parts = list(parts)
+    count = sum(part["count"] for part in parts)
+    total = sum(part["total_seconds"] for part in parts)
+    shortest = [part["min_seconds"] for part in parts if part["min_seconds"] is not None]
+    longest = [part["max_seconds"] for part in parts if part["max_seconds"] is not None]
+    return {
+        "count": count,
+        "total_seconds": total,
+        "avg_seconds": total / count if count else None,
+        "min_seconds": min(shortest, default=None),
+        "max_seconds": max(longest, default=None),
+    }
+
+
+def throughput(conn, entity: str, status: str, since: Optional[datetime] = None,
+               until: Optional[datetime] = None, bucket: str = "hour") -> list:
+    """How many rows entered `status`, per bucket starting in [since, until), oldest first"""
+    if bucket not in BUCKETS:
+        raise ValueError(f"Unknown bucket {bucket!r}, expected one of {BUCKETS}")
+    if conn.dialect.name == "postgresql":
+        start = func.date_trunc(bucket, StatusEvent.changed_at)
+    else:
+        start = func.strftime(SQLITE_BUCKET_FORMATS[bucket], StatusEvent.changed_at)
+    rows = conn.execute(
+        select(start.label("start"), func.count())
+        .where(
+            StatusEvent.entity_type == ENTITY_CODES[entity],
+            StatusEvent.to_status == _code(entity, status),
+            *_period(conn, since, until),
+        )
+        .group_by(start)
+        .order_by(start)
+    ).all()
+    return [
+        {"start": _utc(datetime.fromisoformat(start) if isinstance(start, str) else start), "count": count}
+        for start, count in rows
+    ]
+
+
+def merge_throughput(parts: Iterable[list]) -> list:
+    counts = {}
+    for part in parts:
+        for row in part:
+            counts[row["start"]] = counts.get(row["start"], 0) + row["count"]
+    return [{"start": start, "count": count} for start, count in sorted(counts.items())]
+
+
+def order_history(conn, order_id: int) -> list:
+    """An order's and its stops' status changes, oldest first, with the codes as names"""
+    history = []
+    for event in conn.execute(
+        select(StatusEvent.__table__).where(StatusEvent.order_id == order_id).order_by(StatusEvent.id)
+    ):
+        names = _STATUS_NAMES[_ENTITY_NAMES[event.entity_type]]
+        history.append({
+            "entity": _ENTITY_NAMES[event.entity_type],
+            "entity_id": event.entity_id,
+            "from_status": names.get(event.from_status) if event.from_status is not None else None,
+            "to_status": names.get(event.to_status),
+            "entered_at": _utc(event.entered_at) if event.entered_at is not None else None,
+            "changed_at": _utc(event.changed_at),
+        })
+    return history
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Status dwell time and throughput from status_events")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in ("dwell", "throughput"):
+        command = sub.add_parser(name)
+        command.add_argument("entity", choices=list(ENTITY_CODES))
+        command.add_argument("status")
+        command.add_argument("--since", type=datetime.fromisoformat)
+        command.add_argument("--until", type=datetime.fromisoformat)
+        if name == "throughput":
+            command.add_argument("--bucket", choices=BUCKETS, default="hour")
+    sub.add_parser("history").add_argument("order_id", type=int)
+    args = parser.parse_args()
+
+    try:
+        if args.command == "dwell":
+            parts = []
+            for shard_engine in shard_engines:
+                with shard_engine.connect() as conn:
+                    parts.append(dwell(conn, args.entity, args.status, args.since, args.until))
+            print(merge_dwell(parts))
+        elif args.command == "throughput":
+            parts = []
+            for shard_engine in shard_engines:
+                with shard_engine.connect() as conn:
+                    parts.append(throughput(conn, args.entity, args.status, args.since, args.until, args.bucket))
+            for row in merge_throughput(parts):
+                print(f"{row['start'].isoformat()}  {row['count']}")
+        else:
+            for shard_engine in shard_engines:
+                with shard_engine.connect() as conn:
+                    for event in order_history(conn, args.order_id):
+                        print(event)
+    except ValueError as e:
+        raise SystemExit(f"❌ {e}")
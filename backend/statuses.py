@@ -0,0 +1,108 @@
+"""
+Order and stop statuses: the allowed values, which changes are allowed, and
+the small integers status_events stores them as.
+
+A status may move along the edges below and on through any chain of them
+(pending -> completed skips the steps between, which drivers do); anything
+else is refused with 409. The set is closed under chaining on purpose:
+write-behind (write_behind.py) coalesces a stop's queued updates into the
+last one, and each step being allowed makes the jump allowed too. Setting
+the status a row already has is allowed and records nothing.
+
+Rows written before these rules may hold statuses outside the vocabulary;
+they can move to any known status. Stops with a NULL status count as
+pending.
+
+The codes are stored in status_events, so they are append-only: never
+renumber or reuse one (migration 0011 has a frozen copy for its triggers).
+"""
+from typing import Dict, Optional, Tuple
+
+ORDER_STATUS_CODES = {
+    "pending": 1, "assigned": 2, "in_progress": 3, "in_transit": 4,
+    "delivered": 5, "completed": 6, "cancelled": 7,
+}
+STOP_STATUS_CODES = {
+    "pending": 1, "arrived": 2, "in_progress": 3, "completed": 4, "failed": 5,
+}
+# status_events.entity_type
+ENTITY_CODES = {"order": 1, "stop": 2}
+
+_ORDER_EDGES = {
+    "pending": ("assigned", "cancelled"),
+    "assigned": ("pending", "in_progress", "cancelled"),
+    "in_progress": ("in_transit", "delivered", "cancelled"),
+    "in_transit": ("in_progress", "delivered", "cancelled"),
+    "delivered": ("completed",),
+}
+_STOP_EDGES = {
+    "pending": ("arrived", "in_progress", "completed", "failed"),
+    "arrived": ("in_progress", "completed", "failed"),
+    "in_progress": ("completed", "failed"),
+    "failed": ("pending",),  # another attempt
+}
+
+
+def _closure(edges: Dict[str, tuple], statuses) -> Dict[str, frozenset]:
+    """Every status reachable from each status (itself included)"""
+    reachable = {}
+    for status in statuses:
+        seen, frontier = {status}, [status]
+        while frontier:
+            for following in edges.get(frontier.pop(), ()):
+                if following not in seen:
+                    seen.add(following)
+                    frontier.append(following)
+        reachable[status] = frozenset(seen)
+    return reachable
+
+
+TRANSITIONS = {
+    "order": _closure(_ORDER_EDGES, ORDER_STATUS_CODES),
+    "stop": _closure(_STOP_EDGES, STOP_STATUS_CODES),
+}
+STATUS_CODES = {"order": ORDER_STATUS_CODES, "stop": STOP_STATUS_CODES}
+
+ORDER_STATUS_PATTERN = "^(" + "|".join(ORDER_STATUS_CODES) + ")$"
+STOP_STATUS_PATTERN = "^(" + "|".join(STOP_STATUS_CODES) + ")$"
+
+
+class InvalidTransition(ValueError):
+    """A status change the state machine doesn't allow"""
+
+    def __init__(self, kind: str, current: Optional[str], target: str):
+        super().__init__(f"{kind.capitalize()} status cannot change from {current!r} to {target!r}")
+        self.kind = kind
+        self.current = current
+        self.target = target
+
+
+def _current(kind: str, current: Optional[str]) -> Optional[str]:
+    return "pending" if current is None and kind == "stop" else current
+
+
+def can_transition(kind: str, current: Optional[str], target: str) -> bool:
+    current = _current(kind, current)
+    if target not in STATUS_CODES[kind]:
+        return False
+    if current not in STATUS_CODES[kind]:
+        return True  # legacy value: anything known fixes it
+    return target in TRANSITIONS[kind][current]
+
+
+def check_transition(kind: str, current: Optional[str], target: str):
+    if not can_transition(kind, current, target):
+        raise InvalidTransition(kind, current, target)
+
+
+def sources(kind: str, target: str) -> Tuple[str, ...]:
+    """The known statuses `target` can be reached from, for a guarded UPDATE"""
+    return tuple(status for status, reachable in TRANSITIONS[kind].items() if target in reachable)
+
+
+def next_statuses(kind: str, current: Optional[str]) -> Tuple[str, ...]:
+    """Statuses `current` may change to, itself excluded"""
+    current = _current(kind, current)
+    if current not in STATUS_CODES[kind]:
+        return tuple(STATUS_CODES[kind])
+    return tuple(status for status in STATUS_CODES[kind] if status != current and status in TRANSITIONS[kind][current])
@@ -0,0 +1,102 @@
+"""
+No lost updates under concurrent read-modify-write of one order.
+
+Several threads each GET the order, PUT weight + 1 with If-Match and retry on
+412, against serve.py with several worker processes on a scratch SQLite
+database - so the writes really race, in different processes.
+"""
+import os
+import tempfile
+import threading
+import uuid
+
+import httpx
+import pytest
+
+from loadtest import serve
+
+WORKERS = 4
+THREADS = 8
+INCREMENTS = 10
+
+
+@pytest.fixture(scope="module")
+def base():
+    with tempfile.TemporaryDirectory() as scratch:
+        url, server = serve({
+            "DATABASE_URL": f"sqlite:///{os.path.join(scratch, 'test.db')}",
+            "ARCHIVE_DATABASE_PATH": os.path.join(scratch, "test_archive.db"),
+        }, WORKERS)
+        try:
+            yield url
+        finally:
+            server.terminate()
+            server.wait()
+
+
+@pytest.fixture
+def order(base):
+    with httpx.Client(base_url=base, timeout=30.0) as http:
+        customer = http.post("/api/customers", json={
+            "name": "Concurrency Freight", "email": f"concurrency-{uuid.uuid4().hex[:12]}@example.com",
+        })
+        customer.raise_for_status()
+        created = http.post("/api/orders", json={
+            "customer_id": customer.json()["id"],
+            "pickup_location": "Chicago, IL",
+            "delivery_location": "Dallas, TX",
+            "pickup_date": "2030-01-01T08:00:00",
+            "delivery_date": "2030-01-02T08:00:00",
+            "cargo_type": "Electronics",
+            "weight": 0,
+            "stops": [],
+        })
+        created.raise_for_status()
+        return created.json()
+
+
+def increment(base: str, order_id: int, times: int, results: dict):
+    succeeded = conflicts = 0
+    with httpx.Client(base_url=base, timeout=30.0) as http:
+        while succeeded < times:
+            current = http.get(f"/api/orders/{order_id}").json()
+            response = http.put(
+                f"/api/orders/{order_id}",
+                json={"weight": current["weight"] + 1},
+                headers={"If-Match": f'"{current["version"]}"'},
+            )
+            if response.status_code == 412:
+                conflicts += 1
+                continue
+            response.raise_for_status()
+            succeeded += 1
+    results[threading.get_ident()] = (succeeded, conflicts)
+
+
+def test_concurrent_updates_are_not_lost(base, order):
+    results = {}
+    threads = [
+        threading.Thread(target=increment, args=(base, order["id"], INCREMENTS, results)) for _ in range(THREADS)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    succeeded = sum(s for s, _ in results.values())
+    assert len(results) == THREADS
+    assert succeeded == THREADS * INCREMENTS
+
+    final = httpx.get(f"{base}/api/orders/{order['id']}").json()
+    assert final["weight"] == succeeded
+    assert final["version"] == order["version"] + succeeded
+
+
+def test_stale_if_match_is_refused(base, order):
+    with httpx.Client(base_url=base, timeout=30.0) as http:
+        stale = f'"{order["version"]}"'
+        assert http.put(f"/api/orders/{order['id']}", json={"weight": 1}, headers={"If-Match": stale}).status_code == 200
+
+        response = http.put(f"/api/orders/{order['id']}", json={"weight": 2}, headers={"If-Match": stale})
+        assert response.status_code == 412
+        assert http.get(f"/api/orders/{order['id']}").json()["weight"] == 1
@@ -0,0 +1,95 @@
+"""
+The ETA cache generation moves only after the write it stands for is visible.
+
+A reader that reloads the stop arrays between a writer's generation bump and
+its DBAPI commit would cache the old rows under the new generation; the
+reader here runs at exactly that point, from the engine's "commit" event.
+"""
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+import pytest
+
+# database.py reads its configuration at import
+SCRATCH = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(SCRATCH, 'eta.db')}"
+os.environ["ARCHIVE_DATABASE_PATH"] = os.path.join(SCRATCH, "eta_archive.db")
+
+from sqlalchemy import event  # noqa: E402
+
+import migrations  # noqa: E402
+from database import SessionLocal, engine  # noqa: E402
+from eta import changing_stops, stop_array_cache, stops_changed  # noqa: E402
+from models import Customer, Order, Stop  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def stop_ids():
+    migrations.upgrade(engine, log=lambda *args: None)
+    now = datetime.utcnow()
+    with SessionLocal() as db:
+        customer = Customer(name="ETA", email="eta@example.com")
+        db.add(customer)
+        db.flush()
+        order = Order(
+            customer_id=customer.id, pickup_location="A", delivery_location="B", vehicle_type="Dry Van",
+            pickup_date=now, delivery_date=now + timedelta(days=1), cargo_type="x", weight=0,
+        )
+        order.stops = [
+            Stop(sequence=sequence, location=f"S{sequence}", stop_type="pickup",
+                 scheduled_time=now + timedelta(hours=sequence), latitude=40.0 + sequence, longitude=-74.0)
+            for sequence in (1, 2, 3)
+        ]
+        db.add(order)
+        db.commit()
+        return [stop.id for stop in order.stops]
+
+
+def done_count():
+    with SessionLocal() as reader:
+        return int(stop_array_cache.get(reader).done.sum())
+
+
+@pytest.fixture
+def reader_mid_commit():
+    """Reloads the cache from another session while a commit is in flight"""
+    seen = []
+
+    def read(conn):
+        stop_array_cache.invalidate()  # as a bump made before the DBAPI commit would
+        seen.append(done_count())
+
+    event.listen(engine, "commit", read, once=True)
+    yield seen
+    if event.contains(engine, "commit", read):
+        event.remove(engine, "commit", read)
+
+
+def test_session_commit_is_visible_to_the_next_read(stop_ids, reader_mid_commit):
+    before = done_count()
+    with SessionLocal() as db:
+        db.get(Stop, stop_ids[0]).status = "completed"
+        stops_changed(db)
+        db.commit()
+    assert reader_mid_commit == [before]  # the reader did see the old rows
+    assert done_count() == before + 1
+
+
+def test_core_commit_is_visible_to_the_next_read(stop_ids, reader_mid_commit):
+    before = done_count()
+    with changing_stops(engine) as conn:
+        conn.execute(Stop.__table__.update().where(Stop.id == stop_ids[1]).values(status="completed"))
+    assert reader_mid_commit == [before]
+    assert done_count() == before + 1
+
+
+def test_rolled_back_mark_does_not_invalidate(stop_ids):
+    done_count()
+    generation = stop_array_cache.generation
+    with SessionLocal() as db:
+        db.get(Stop, stop_ids[2]).status = "completed"
+        stops_changed(db)
+        db.rollback()
+        db.commit()
+    assert stop_array_cache.generation == generation
@@ -0,0 +1,252 @@
+"""
+Write-behind batching for stop status updates.
+
+When enabled, `PATCH /api/stops/{id}/status` does not commit per call. Updates
+are coalesced per stop (last write wins) in memory and flushed by a background
+asyncio task as one grouped transaction, either every
+STOP_STATUS_FLUSH_INTERVAL_MS or as soon as STOP_STATUS_FLUSH_SIZE distinct
+stops are pending.
+
+Durability modes (STOP_STATUS_DURABILITY):
+  - "buffered": the request returns (202) once the update is queued; the
+    endpoint has checked that the stop exists, nothing more. Anything still
+    queued is lost if the process dies before the next flush (graceful shutdown
+    drains the queue).
+  - "flush":    the request waits until the batch containing its update has
+    committed. Commits are still shared across concurrent requests.
+
+Each coalesced update is checked against the stop's status when the batch is
+written (statuses.py); one that isn't allowed is left out of the batch. In
+"flush" mode its requests get the InvalidTransition (409); in "buffered" mode
+they have already returned, so it is logged and counted as rejected.
+
+A flush that fails puts its batch back ("buffered"; "flush" mode fails the
+waiting requests instead) and the next one is tried after an exponential
+backoff, up to MAX_RETRY_DELAY. An update whose flush has failed
+STOP_STATUS_MAX_FLUSH_ATTEMPTS times is logged and dropped (counted as
+dropped), so a batch that can never be written doesn't stay queued forever.
+"""
+import asyncio
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select, bindparam
+from sqlalchemy.sql import func
+
+from eta import stops_changed
+from models import Stop
+from statuses import InvalidTransition, can_transition
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_ENABLED = os.getenv("STOP_STATUS_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+FLUSH_INTERVAL_MS = int(os.getenv("STOP_STATUS_FLUSH_INTERVAL_MS", "50"))
+FLUSH_SIZE = int(os.getenv("STOP_STATUS_FLUSH_SIZE", "500"))
+DURABILITY = os.getenv("STOP_STATUS_DURABILITY", "buffered")
+MAX_FLUSH_ATTEMPTS = int(os.getenv("STOP_STATUS_MAX_FLUSH_ATTEMPTS", "8"))
+# Longest wait between flushes while they keep failing, in seconds
+MAX_RETRY_DELAY = 5.0
+
+DURABILITY_MODES = ("buffered", "flush")
+
+
+class StopStatusBuffer:
+    """Coalesces stop status writes and flushes them in grouped transactions"""
+
+    def __init__(
+        self,
+        session_factory,
+        flush_interval_ms: int = FLUSH_INTERVAL_MS,
+        flush_size: int = FLUSH_SIZE,
+        durability: str = DURABILITY,
+        max_flush_attempts: int = MAX_FLUSH_ATTEMPTS,
+    ):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode {durability!r}, expected one of {DURABILITY_MODES}")
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_size = flush_size
+        self.durability = durability
+        self.max_flush_attempts = max_flush_attempts
+
+        # stop_id -> (latest status, futures waiting on the flush)
+        self._pending: Dict[int, Tuple[str, List[asyncio.Future]]] = {}
+        # stop_id -> failed flushes of its queued update ("buffered")
+        self._attempts: Dict[int, int] = {}
+        self._failed_flushes = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._closing = False
+
+        # Counters for observability
+        self.submitted = 0
+        self.written = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.flushes = 0
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._closing = False
+        self._task = asyncio.create_task(self._run())
+
+    async def submit(self, stop_id: int, status: str) -> Optional[bool]:
+        """
+        Queue a status change. In "flush" mode, wait for the commit and return
+        whether the stop exists; in "buffered" mode return None immediately.
+        """
+        if self._closing:
+            raise RuntimeError("Stop status buffer is shutting down")
+
+        waiters = self._pending[stop_id][1] if stop_id in self._pending else []
+        future = None
+        if self.durability == "flush":
+            future = asyncio.get_running_loop().create_future()
+            waiters.append(future)
+        self._pending[stop_id] = (status, waiters)
+        self.submitted += 1
+
+        if len(self._pending) >= self.flush_size:
+            self._wakeup.set()
+
+        if future is not None:
+            return await future
+        return None
+
+    async def _run(self):
+        while not self._closing:
+            delay = min(self.flush_interval * 2 ** self._failed_flushes, MAX_RETRY_DELAY)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+                self._failed_flushes = 0
+            except Exception:
+                self._failed_flushes += 1
+                logger.exception("Stop status flush failed; will retry")
+
+    async def flush(self):
+        """Write everything queued so far in one transaction"""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            updates = {stop_id: status for stop_id, (status, _) in batch.items()}
+
+            try:
+                found, rejected = await asyncio.to_thread(self._write, updates)
+            except Exception as e:
+                if self.durability == "flush":
+                    for _, waiters in batch.values():
+                        for future in waiters:
+                            if not future.done():
+                                future.set_exception(e)
+                else:
+                    self._requeue(batch)
+                raise
+
+            for stop_id in batch:
+                self._attempts.pop(stop_id, None)
+            self.flushes += 1
+            self.written += len(found) - len(rejected)
+            self.rejected += len(rejected)
+            for stop_id, (_, waiters) in batch.items():
+                for future in waiters:
+                    if future.done():
+                        continue
+                    if stop_id in rejected:
+                        future.set_exception(rejected[stop_id])
+                    else:
+                        future.set_result(stop_id in found)
+
+    def _requeue(self, batch: Dict[int, Tuple[str, List[asyncio.Future]]]):
+        """Put a failed batch back without clobbering newer updates, dropping those out of attempts"""
+        dropped = []
+        for stop_id, entry in batch.items():
+            attempts = self._attempts.get(stop_id, 0) + 1
+            if attempts >= self.max_flush_attempts:
+                self._attempts.pop(stop_id, None)
+                dropped.append(stop_id)
+                continue
+            self._attempts[stop_id] = attempts
+            self._pending.setdefault(stop_id, entry)
+        if dropped:
+            self.dropped += len(dropped)
+            logger.error(
+                "Dropped %d stop status updates after %d failed flushes: %s",
+                len(dropped), self.max_flush_attempts,
+                ", ".join(f"{stop_id}={batch[stop_id][0]}" for stop_id in dropped),
+            )
+
+    def _write(self, updates: Dict[int, str]) -> Tuple[set, Dict[int, InvalidTransition]]:
+        """
+        Apply a batch of coalesced updates in a single transaction; returns the
+        stops found and the updates refused by the state machine
+        """
+        db = self.session_factory()
+        try:
+            stop_ids = list(updates)
+            # Locked until the commit (PostgreSQL), so the check holds for the write
+            current = dict(db.execute(
+                select(Stop.id, Stop.status).where(Stop.id.in_(stop_ids)).with_for_update()
+            ).all())
+            rejected = {
+                stop_id: InvalidTransition("stop", status, updates[stop_id])
+                for stop_id, status in current.items() if not can_transition("stop", status, updates[stop_id])
+            }
+            rows = [
+                {"_id": stop_id, "status": updates[stop_id]}
+                for stop_id in stop_ids if stop_id in current and stop_id not in rejected
+            ]
+            if rows:
+                stops_table = Stop.__table__
+                db.connection().execute(
+                    stops_table.update()
+                    .where(stops_table.c.id == bindparam("_id"))
+                    .values(
+                        status=bindparam("status"),
+                        version=stops_table.c.version + 1,
+                        updated_at=func.now()
+                    ),
+                    rows
+                )
+                stops_changed(db)
+            db.commit()
+            missing = len(stop_ids) - len(current)
+            if missing:
+                logger.warning("Dropped %d status updates for unknown stops", missing)
+            if rejected and self.durability == "buffered":
+                logger.warning("Dropped %d status updates the state machine refused: %s",
+                               len(rejected), "; ".join(str(e) for e in rejected.values()))
+            return set(current), rejected
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def drain(self):
+        """Stop the background task and flush whatever is still queued"""
+        self._closing = True
+        if self._task is not None:
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "durability": self.durability,
+            "pending": len(self._pending),
+            "submitted": self.submitted,
+            "written": self.written,
+            "rejected": self.rejected,
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+        }
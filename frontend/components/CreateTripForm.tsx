@@ -13,6 +13,10 @@ interface CreateTripFormProps {
 
 type TabType = 'order_details' | 'stops' | 'shipment' | 'reference' | 'notes';
 
+// Customers shown in the picker at a time; typing searches the rest
+const CUSTOMER_PICKER_LIMIT = 20;
+const CUSTOMER_SEARCH_DELAY_MS = 250;
+
 interface StopData {
   locationName: string;
   locationId: string;
@@ -48,6 +52,7 @@ const emptyStop = (type: 'pickup' | 'delivery' | 'stop'): StopData => ({
 export default function CreateTripForm({ isOpen, onClose, onSubmit }: CreateTripFormProps) {
   const [activeTab, setActiveTab] = useState<TabType>('order_details');
   const [customers, setCustomers] = useState<Customer[]>([]);
+  const [customerQuery, setCustomerQuery] = useState('');
   
   // Order Details
   const [selectedCustomerId, setSelectedCustomerId] = useState<number>(0);
@@ -76,20 +81,38 @@ export default function CreateTripForm({ isOpen, onClose, onSubmit }: CreateTrip
   const [notes, setNotes] = useState('');
 
   useEffect(() => {
-    if (isOpen) {
-      loadCustomers();
+    if (!isOpen) {
+      return;
     }
-  }, [isOpen]);
+    // Debounced type-ahead; a newer query makes the older response stale
+    let stale = false;
+    const timer = setTimeout(() => {
+      loadCustomers(customerQuery.trim()).then((data) => {
+        if (stale || !data) {
+          return;
+        }
+        setCustomers(data);
+        setSelectedCustomerId((current) =>
+          data.some((customer) => customer.id === current) ? current : (data[0]?.id ?? 0)
+        );
+      });
+    }, customerQuery ? CUSTOMER_SEARCH_DELAY_MS : 0);
+    return () => {
+      stale = true;
+      clearTimeout(timer);
+    };
+  }, [isOpen, customerQuery]);
 
-  const loadCustomers = async () => {
+  const loadCustomers = async (query: string): Promise<Customer[] | null> => {
     try {
-      const data = await customerService.getCustomers();
-      setCustomers(data);
-      if (data.length > 0) {
-        setSelectedCustomerId(data[0].id);
+      if (!query) {
+        return await customerService.getCustomers(CUSTOMER_PICKER_LIMIT);
       }
+      const data = await customerService.searchCustomers(query, undefined, CUSTOMER_PICKER_LIMIT);
+      return data.customers;
     } catch (error) {
       console.error('Failed to load customers:', error);
+      return null;
     }
   };
 
@@ -174,6 +197,7 @@ export default function CreateTripForm({ isOpen, onClose, onSubmit }: CreateTrip
 
   const resetForm = () => {
     setSelectedCustomerId(0);
+    setCustomerQuery('');
     setEquipmentType('');
     setContactPerson('');
     setContactPhone('');
@@ -385,6 +409,13 @@ export default function CreateTripForm({ isOpen, onClose, onSubmit }: CreateTrip
                   
                   <div>
                     <label className="block text-sm font-medium text-gray-700 mb-1">Customer Name *</label>
+                    <input
+                      type="search"
+                      value={customerQuery}
+                      onChange={(e) => setCustomerQuery(e.target.value)}
+                      placeholder="Search by name or email"
+                      className="w-full px-3 py-2 mb-2 border border-gray-300 rounded-md focus:outline-none focus:ring-2 focus:ring-blue-500"
+                    />
                     <select
                       required
                       value={selectedCustomerId}
@@ -12,8 +12,14 @@ export const api = axios.create({
 
 // Customer Service
 export const customerService = {
-  async getCustomers(): Promise<Customer[]> {
-    const response = await api.get<Customer[]>('/api/customers');
+  async getCustomers(limit?: number): Promise<Customer[]> {
+    const response = await api.get<Customer[]>('/api/customers', { params: { limit } });
+    return response.data;
+  },
+
+  // Type-ahead lookup - use instead of loading every customer for a dropdown
+  async searchCustomers(q: string, cursor?: string, limit = 20): Promise<{ customers: Customer[]; next_cursor: string | null }> {
+    const response = await api.get('/api/customers/search', { params: { q, cursor, limit } });
     return response.data;
   },
 